@@ -2,4 +2,5 @@ __author__ = "Vlad Calin <vlad.s.calin@gmail.com>"
 __version__ = "0.0.1"
 
 from taswor.workflow import Workflow, node
-from taswor.util import Next
+from taswor.util import Next, Join
+from taswor.process.pool import WorkerPool
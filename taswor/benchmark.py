@@ -0,0 +1,235 @@
+"""
+Benchmarks of the execution engine itself, on synthetic workflows whose nodes do (almost) nothing. Run them with::
+
+    python -m taswor.benchmark --executor process --workers 4 --output results.json
+
+Every run reports the throughput, the per-task overhead, latency percentiles of the tasks (from their enqueueing to the
+end of their processing, see :py:class:`taswor.metrics.NodeMetrics`), the time spent creating the workflow and the
+peak memory of the workers and of the main process. The ``--output`` file is JSON, so the results of two versions (or
+two configurations) can be compared.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import platform
+import resource
+
+import taswor
+from taswor.metrics import Histogram
+from taswor.node import Node
+from taswor.util import Next
+from taswor.workflow import Workflow
+
+
+def noop(*args, **kwargs):
+    return None
+
+
+def chain_step(step, depth):
+    if step < depth:
+        return Next("chain_step", step + 1, depth)
+
+
+def fan_out(item):
+    return Next("noop", item)
+
+
+def diamond_top(item):
+    return [Next("diamond_left", item), Next("diamond_right", item)]
+
+
+def diamond_left(item):
+    return Next("diamond_bottom", item)
+
+
+def diamond_right(item):
+    return Next("diamond_bottom", item)
+
+
+def payload_source(item, size):
+    return Next("payload_step", bytearray(size))
+
+
+def payload_step(data):
+    return Next("noop", data)
+
+
+def burn(item, iterations):
+    total = 0
+    for i in range(iterations):
+        total += i * i
+    return None
+
+
+def chain(size):
+    """
+    A single branch of ``size`` sequential tasks: measures the latency of a task hand-off.
+    """
+    nodes = [Node(chain_step, "chain_step", start=True, init_generator=[((1, size), {})])]
+    return nodes, size
+
+
+def fan_out_wide(size):
+    """
+    ``size`` start tasks produced by an ``init_generator``, each followed by a no-op leaf.
+    """
+    nodes = [Node(fan_out, "fan_out", start=True, init_generator=(((i,), {}) for i in range(size))),
+             Node(noop, "noop")]
+    return nodes, 2 * size
+
+
+def diamond(size):
+    """
+    ``size`` diamonds: the bottom node of every diamond is reached twice with the same arguments, so the second call
+    can be served from the cache.
+    """
+    nodes = [Node(diamond_top, "diamond_top", start=True, init_generator=(((i,), {}) for i in range(size))),
+             Node(diamond_left, "diamond_left"), Node(diamond_right, "diamond_right"), Node(noop, "diamond_bottom")]
+    return nodes, 5 * size
+
+
+def tiny(size):
+    """
+    ``size`` no-op tasks: the whole cost is the engine overhead.
+    """
+    nodes = [Node(noop, "noop", start=True, init_generator=(((i,), {}) for i in range(size)))]
+    return nodes, size
+
+
+def cpu_heavy(size):
+    """
+    ``size`` tasks burning CPU for a few milliseconds each: the engine overhead should be negligible.
+    """
+    nodes = [Node(burn, "burn", start=True, init_generator=(((i, 100000), {}) for i in range(size)))]
+    return nodes, size
+
+
+def payload(size):
+    """
+    ``size`` branches passing a 1 MiB buffer along two edges: measures the cost of moving large arguments between the
+    workers, see the ``--shared-memory-threshold`` option.
+    """
+    nodes = [Node(payload_source, "payload_source", start=True,
+                  init_generator=(((i, 1 << 20), {}) for i in range(size))),
+             Node(payload_step, "payload_step", use_cache=False), Node(noop, "noop", use_cache=False)]
+    return nodes, 3 * size
+
+
+SCENARIOS = {
+    "chain": chain,
+    "fan_out": fan_out_wide,
+    "diamond": diamond,
+    "tiny": tiny,
+    "cpu_heavy": cpu_heavy,
+    "payload": payload,
+}
+
+
+def peak_rss_kb(pid=None):
+    """
+    :return: the peak resident memory of a process in KB, or ``None`` if it can not be determined.
+    """
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open("/proc/{}/status".format(pid)) as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_scenario(name, size, **workflow_kwargs):
+    nodes, tasks = SCENARIOS[name](size)
+
+    start_time = time.perf_counter()
+    workflow = Workflow(*nodes, **workflow_kwargs)
+    startup = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    workflow.start(wait=True)
+    elapsed = time.perf_counter() - start_time
+
+    metrics = workflow.metrics()
+    # thread workers share the memory of the main process
+    workers_rss = [peak_rss_kb(handle.pid) for handle in workflow.executor.handles if hasattr(handle, "pid")]
+    concurrency = len(workflow.executor.handles) or 1
+    workflow.close()
+
+    processed = sum(node_metrics.calls for node_metrics in metrics.values())
+    if processed != tasks:
+        raise RuntimeError("Scenario {} processed {} tasks instead of {}".format(name, processed, tasks))
+    latency = Histogram()
+    for node_metrics in metrics.values():
+        latency.merge(node_metrics.latency)
+    # the time the workers spent outside of the node functions
+    overhead = max(0.0, elapsed * concurrency - sum(node_metrics.exec_time.total for node_metrics in metrics.values()))
+    return {
+        "scenario": name,
+        "size": size,
+        "tasks": tasks,
+        "startup_seconds": startup,
+        "elapsed_seconds": elapsed,
+        "tasks_per_second": tasks / elapsed if elapsed else None,
+        "overhead_per_task_seconds": overhead / tasks,
+        "latency_p50_seconds": latency.percentile(0.5),
+        "latency_p99_seconds": latency.percentile(0.99),
+        "peak_rss_workers_kb": max(workers_rss) if workers_rss and None not in workers_rss else None,
+        "peak_rss_main_kb": peak_rss_kb(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m taswor.benchmark", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("scenarios", nargs="*", help="the scenarios to run, among {} (all of them by default)".format(
+        ", ".join(sorted(SCENARIOS))))
+    parser.add_argument("--size", type=int, default=1000, help="number of start tasks or chain length")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--executor", default="process", choices=["process", "thread", "inline", "distributed"])
+    parser.add_argument("--engine", default="sync", choices=["sync", "asyncio"])
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--scheduling", default="bfs", choices=["bfs", "dfs"])
+    parser.add_argument("--affinity", action="store_true", help="runs the children of a task in the same worker")
+    parser.add_argument("--shared-memory-threshold", type=int, help="passes the arguments of this many bytes or more "
+                        "through shared memory")
+    parser.add_argument("--output", help="writes the results to this file as JSON")
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario {}".format(name))
+
+    results = []
+    for name in args.scenarios or sorted(SCENARIOS):
+        results.append(run_scenario(name, args.size, workers=args.workers, executor=args.executor,
+                                    engine=args.engine, batch_size=args.batch_size, scheduling=args.scheduling,
+                                    affinity=args.affinity,
+                                    shared_memory_threshold=args.shared_memory_threshold))
+
+    report = {
+        "taswor_version": taswor.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.time(),
+        "options": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(report, out, indent=4, sort_keys=True)
+
+    columns = ["scenario", "tasks", "startup_seconds", "tasks_per_second", "overhead_per_task_seconds",
+               "latency_p50_seconds", "latency_p99_seconds", "peak_rss_workers_kb"]
+    print("\t".join(columns), file=sys.stderr)
+    for result in results:
+        print("\t".join("{:.6g}".format(result[c]) if isinstance(result[c], float) else str(result[c])
+                        for c in columns), file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import os
+import time
+import struct
+import pickle
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from taswor import settings
+
+MISSING = object()
+
+KEY_DIGEST_SIZE = 16
+
+
+def make_key(*parts):
+    """
+    Derives a fixed-size cache key from any number of values. The values are serialised canonically (dictionaries and
+    sets do not depend on their ordering, floats are encoded exactly) and hashed, so the key is always a 32 characters
+    hex string, no matter how large the values are.
+
+    Values of types that have no canonical form are pickled, since their ``repr`` usually contains the object id.
+    """
+    digest = hashlib.blake2b(digest_size=KEY_DIGEST_SIZE)
+    for part in parts:
+        _feed(digest, part)
+    return digest.hexdigest()
+
+
+def _feed(digest, value):
+    if value is None or value is True or value is False:
+        digest.update(b"c" + repr(value).encode())
+    elif isinstance(value, int):
+        data = str(value).encode()
+        digest.update(b"i" + struct.pack("<Q", len(data)) + data)
+    elif isinstance(value, float):
+        digest.update(b"f" + struct.pack("<d", value))
+    elif isinstance(value, str):
+        data = value.encode("utf-8", "surrogatepass")
+        digest.update(b"s" + struct.pack("<Q", len(data)) + data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = memoryview(value)
+        if not data.c_contiguous:
+            data = memoryview(data.tobytes())
+        # hashed in place, large buffers are not copied
+        digest.update(b"b" + struct.pack("<Q", data.nbytes))
+        digest.update(data)
+    elif isinstance(value, (tuple, list)):
+        digest.update((b"t" if isinstance(value, tuple) else b"l") + struct.pack("<Q", len(value)))
+        for item in value:
+            _feed(digest, item)
+    elif isinstance(value, dict):
+        digest.update(b"d" + struct.pack("<Q", len(value)))
+        for item_key, item in sorted((make_key(k), make_key(v)) for k, v in value.items()):
+            digest.update(item_key.encode() + item.encode())
+    elif isinstance(value, (set, frozenset)):
+        digest.update(b"e" + struct.pack("<Q", len(value)))
+        for item in sorted(make_key(v) for v in value):
+            digest.update(item.encode())
+    else:
+        # the buffers of the objects supporting pickle protocol 5, e.g. NumPy arrays, are hashed without a copy
+        buffers = []
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL, buffer_callback=buffers.append)
+        digest.update(b"p" + struct.pack("<Q", len(data)) + data)
+        for buffer in buffers:
+            _feed(digest, memoryview(buffer))
+
+
+class Cache:
+    """
+    Base class for the cache backends used by the workers to store node results. Every backend supports size and
+    time based eviction and counts its hits and misses.
+
+    A backend instance is never shared between processes: each worker builds its own from the workflow's
+    ``cache_url`` (see :py:func:`get_cache`).
+
+    Backends also hold the claims of the single-flight nodes (see :py:class:`taswor.node.Node`): a claim on a key
+    marks its value as being computed, so that identical tasks wait for it instead of computing it again. Claims
+    expire after their lease, in case the worker holding them dies.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        """
+        :param max_size: maximum number of entries kept in the cache. ``None`` means unbounded.
+        :param ttl: number of seconds after which an entry expires. ``None`` means entries never expire.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored under ``key`` or ``default`` if the key is missing or expired.
+        """
+        try:
+            value = self._get(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._set(key, value)
+
+    def claim(self, key, lease):
+        """
+        Claims the computation of the value of ``key`` for ``lease`` seconds.
+
+        :return: True if the key was claimed, False if an unexpired claim is held on it.
+        """
+        raise NotImplementedError()
+
+    def release(self, key):
+        """
+        Releases a claim taken with :py:func:`Cache.claim()`.
+        """
+        raise NotImplementedError()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    def close(self):
+        pass
+
+    def _expires_at(self):
+        return time.time() + self.ttl if self.ttl is not None else None
+
+    def _get(self, key):
+        raise NotImplementedError()
+
+    def _set(self, key, value):
+        raise NotImplementedError()
+
+    def __len__(self):
+        raise NotImplementedError()
+
+
+class LocalCache(Cache):
+    """
+    In-process LRU cache. Each worker has its own instance, so lookups never leave the worker process, and its claims
+    only hold back the identical tasks of the same worker.
+    """
+
+    def __init__(self, max_size=10000, ttl=None):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.entries = OrderedDict()
+        self.claims = {}
+
+    def claim(self, key, lease):
+        now = time.time()
+        expires_at = self.claims.get(key)
+        if expires_at is not None and expires_at > now:
+            return False
+        self.claims[key] = now + lease
+        return True
+
+    def release(self, key):
+        self.claims.pop(key, None)
+
+    def _get(self, key):
+        expires_at, value = self.entries[key]
+        if expires_at is not None and expires_at < time.time():
+            del self.entries[key]
+            raise KeyError(key)
+        self.entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        self.entries[key] = (self._expires_at(), value)
+        self.entries.move_to_end(key)
+        if self.max_size is not None:
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SqliteCache(Cache):
+    """
+    On-disk cache stored in a sqlite database. The database is shared by all the workers and survives restarts.
+    Entries are evicted in least recently used order once ``max_size`` is exceeded. The size is only checked every
+    :py:attr:`EVICTION_INTERVAL` inserts of a worker, or every tenth of ``max_size`` if it is smaller, so the cache
+    can briefly hold more entries. The time entries are accessed at is only recorded if there is a ``max_size``.
+    """
+
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, path, max_size=None, ttl=None):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache "
+                                "(key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, expires REAL)")
+        if max_size is not None:
+            self.eviction_interval = max(1, min(self.EVICTION_INTERVAL, max_size // 10))
+            self.inserts = 0
+
+    def claim(self, key, lease):
+        now = time.time()
+        # a single statement, so that two workers can not both take the claim
+        cursor = self.connection.execute("INSERT INTO claims (key, expires) VALUES (?, ?) ON CONFLICT (key) "
+                                         "DO UPDATE SET expires = excluded.expires WHERE claims.expires < ?",
+                                         (key, now + lease, now))
+        return cursor.rowcount == 1
+
+    def release(self, key):
+        self.connection.execute("DELETE FROM claims WHERE key = ?", (key,))
+
+    def _get(self, key):
+        row = self.connection.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            raise KeyError(key)
+        if self.max_size is not None:
+            self.connection.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(value)
+
+    def _set(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires_at(), time.time()))
+        if self.max_size is not None:
+            self.inserts += 1
+            if self.inserts % self.eviction_interval == 0:
+                self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries beyond ``max_size``.
+        """
+        excess = len(self) - self.max_size
+        if excess > 0:
+            self.connection.execute("DELETE FROM cache WHERE key IN "
+                                    "(SELECT key FROM cache ORDER BY accessed LIMIT ?)", (excess,))
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class RedisCache(Cache):
+    """
+    Cache stored on a Redis server (or anything speaking its protocol). Expiration is delegated to the server; the
+    size limit is enforced by keeping the keys in a sorted set ordered by last access.
+
+    Requires the ``redis`` package.
+    """
+
+    def __init__(self, host=settings.redis_server, port=settings.redis_port, db=0, max_size=None, ttl=None,
+                 prefix="taswor:cache:"):
+        super().__init__(max_size=max_size, ttl=ttl)
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis cache backend")
+        self.client = redis.Redis(host=host, port=port, db=db)
+        self.prefix = prefix
+        self.index = prefix + "__index__"
+        self.claim_prefix = prefix + "__claim__:"
+
+    def claim(self, key, lease):
+        return bool(self.client.set(self.claim_prefix + key, 1, nx=True, px=max(1, int(lease * 1000))))
+
+    def release(self, key):
+        self.client.delete(self.claim_prefix + key)
+
+    def _get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            if self.max_size is not None:
+                # the key expired on the server, drop it from the index
+                self.client.zrem(self.index, key)
+            raise KeyError(key)
+        if self.max_size is not None:
+            self.client.zadd(self.index, {key: time.time()})
+        return pickle.loads(value)
+
+    def _set(self, key, value):
+        pipeline = self.client.pipeline()
+        pipeline.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                     px=max(1, int(self.ttl * 1000)) if self.ttl is not None else None)
+        if self.max_size is not None:
+            pipeline.zadd(self.index, {key: time.time()})
+            pipeline.zcard(self.index)
+        size = pipeline.execute()[-1]
+        if self.max_size is not None and size > self.max_size:
+            evicted = [item for item, _ in self.client.zpopmin(self.index, size - self.max_size)]
+            self.client.delete(*[self.prefix + item.decode() for item in evicted])
+
+    def close(self):
+        self.client.close()
+
+    def __len__(self):
+        if self.max_size is not None:
+            return self.client.zcard(self.index)
+        # no index is kept for unbounded caches, count the keys on the server
+        return sum(1 for key in self.client.scan_iter(match=self.prefix + "*")
+                   if key.decode() != self.index and not key.decode().startswith(self.claim_prefix))
+
+
+def get_cache(url=None):
+    """
+    Builds a cache backend from an url. The supported schemes are:
+
+    - ``memory://`` (or ``None``): a per-worker in-memory LRU cache
+    - ``sqlite:///path/to/file.db``: a sqlite database shared by all the workers
+    - ``redis://host:port/db``: a Redis server; host and port default to the values in ``taswor.settings``
+
+    The ``max_size`` and ``ttl`` query parameters configure the eviction, e.g. ``memory://?max_size=1000&ttl=60``.
+    """
+    if not url:
+        return LocalCache()
+
+    parsed = urlparse(url)
+    options = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+    kwargs = {}
+    if "max_size" in options:
+        kwargs["max_size"] = int(options["max_size"])
+    if "ttl" in options:
+        kwargs["ttl"] = float(options["ttl"])
+
+    if parsed.scheme == "memory":
+        return LocalCache(**kwargs)
+    if parsed.scheme == "sqlite":
+        path = parsed.netloc + parsed.path
+        return SqliteCache(os.path.abspath(path) if path else "taswor_cache.db", **kwargs)
+    if parsed.scheme == "redis":
+        return RedisCache(host=parsed.hostname or settings.redis_server, port=parsed.port or settings.redis_port,
+                          db=int(parsed.path.strip("/") or 0), **kwargs)
+    raise RuntimeError("Unknown cache backend {}".format(url))
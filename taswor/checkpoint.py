@@ -0,0 +1,165 @@
+import os
+import glob
+import time
+import pickle
+import sqlite3
+
+from taswor.cache import make_key
+
+
+def task_key(task):
+    """
+    :param task: a ``(node_name, args, kwargs)`` tuple.
+    :return: the key identifying the task in a checkpoint.
+    """
+    return make_key(*task)
+
+
+class CheckpointLog:
+    """
+    Append-only log of the tasks completed by a worker. Every record holds the key of a task and the tasks it produced.
+    The records are buffered and written at most every ``interval`` seconds, so checkpointing costs the workers a
+    single write now and then. The records that were not written when a worker dies are lost, and their tasks are
+    processed again on resume.
+    """
+
+    def __init__(self, file, interval=1):
+        self.file = file
+        self.interval = interval
+        self.buffer = []
+        self.written = time.time()
+
+    def record(self, task, children):
+        self.buffer.append((task_key(task), children))
+
+    def flush(self, force=False):
+        if self.buffer and (force or time.time() - self.written >= self.interval):
+            pickle.dump(self.buffer, self.file, pickle.HIGHEST_PROTOCOL)
+            self.file.flush()
+            self.buffer = []
+            self.written = time.time()
+
+    def close(self):
+        self.flush(force=True)
+        self.file.close()
+
+
+class Checkpoint:
+    """
+    The progress of a workflow, kept in ``directory``: the tasks that were completed and the tasks they produced.
+
+    The workers append their records to logs of their own (see :py:class:`CheckpointLog`) and never stall on a
+    snapshot. :py:func:`Checkpoint.compact()` folds the logs into a sqlite snapshot, from which the completed tasks
+    are looked up and the pending ones, produced but never completed, are found.
+
+    The snapshot doubles as a cache: the completed tasks are not run again, the tasks they produced are replayed.
+    """
+
+    SNAPSHOT = "checkpoint.db"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, self.SNAPSHOT)
+        self.connection = None
+        self.empty = True
+
+    def open(self, name, interval=1):
+        """
+        :return: the :py:class:`CheckpointLog` of the worker ``name``.
+        """
+        return CheckpointLog(open(os.path.join(self.directory, "{}.log".format(name)), "ab"), interval)
+
+    def connect(self):
+        """
+        Opens the snapshot, which is only read from now on. The connection can be used from another thread than the
+        one that opened it, but not from several threads at once.
+        """
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self.empty = self.connection.execute("SELECT 1 FROM tasks LIMIT 1").fetchone() is None
+        return self
+
+    def compact(self):
+        """
+        Folds the logs of the workers into the snapshot, in a single transaction, and removes them. Must not be called
+        while workers are appending to the logs.
+
+        :return: the number of tasks added to the snapshot.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS tasks (key TEXT PRIMARY KEY)")
+        connection.execute("CREATE TABLE IF NOT EXISTS edges "
+                           "(parent TEXT, position INTEGER, child_key TEXT, child BLOB)")
+        connection.execute("CREATE INDEX IF NOT EXISTS edges_parent ON edges (parent)")
+        connection.execute("CREATE INDEX IF NOT EXISTS edges_child ON edges (child_key)")
+
+        paths = sorted(glob.glob(os.path.join(self.directory, "*.log")))
+        added = 0
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for records in self.read_logs(paths):
+                for key, children in records:
+                    if not connection.execute("INSERT OR IGNORE INTO tasks (key) VALUES (?)", (key,)).rowcount:
+                        # completed more than once, e.g. reached from several parents
+                        continue
+                    added += 1
+                    connection.executemany(
+                        "INSERT INTO edges (parent, position, child_key, child) VALUES (?, ?, ?, ?)",
+                        [(key, i, task_key(child), pickle.dumps(child, pickle.HIGHEST_PROTOCOL))
+                         for i, child in enumerate(children)])
+        except Exception:
+            connection.execute("ROLLBACK")
+            connection.close()
+            raise
+        connection.execute("COMMIT")
+        connection.close()
+        for path in paths:
+            os.remove(path)
+        return added
+
+    @staticmethod
+    def read_logs(paths):
+        for path in paths:
+            with open(path, "rb") as log:
+                while True:
+                    try:
+                        yield pickle.load(log)
+                    except (EOFError, pickle.UnpicklingError):
+                        # the last record of a worker that died may be partial
+                        break
+
+    def completed(self, task):
+        """
+        :return: the list of the tasks produced by ``task`` if it was completed, ``None`` otherwise.
+        """
+        if self.empty:
+            return None
+        rows = self.connection.execute("SELECT edges.child FROM tasks LEFT JOIN edges ON edges.parent = tasks.key "
+                                       "WHERE tasks.key = ? ORDER BY edges.position", (task_key(task),)).fetchall()
+        if not rows:
+            return None
+        return [pickle.loads(child) for child, in rows if child is not None]
+
+    def pending(self):
+        """
+        Yields the tasks that were produced but never completed, once each.
+        """
+        if self.empty:
+            return
+        rows = self.connection.execute("SELECT child FROM edges WHERE child_key NOT IN (SELECT key FROM tasks) "
+                                       "GROUP BY child_key")
+        for child, in rows:
+            yield pickle.loads(child)
+
+    def __len__(self):
+        """
+        :return: the number of completed tasks in the snapshot.
+        """
+        return self.connection.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
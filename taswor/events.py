@@ -0,0 +1,175 @@
+import os
+import glob
+import pickle
+
+
+class NodeProcessed:
+    """
+    An edge of the execution: the task ``from_node(*from_args, **from_kwargs)`` produced the task ``to_node(...)``, or
+    nothing for a leaf or an error. ``cached`` is True when the result of the task came from the cache, in which case
+    ``duration`` is the time of the cache lookup.
+    """
+
+    __slots__ = ("from_node", "from_args", "from_kwargs", "to_node", "to_args", "to_kwargs", "duration", "error",
+                 "cached")
+
+    def __init__(self, from_node, from_args, from_kwargs, to_node, to_args, to_kwargs, duration, error, cached=False):
+        self.from_node = from_node
+        self.from_args = from_args
+        self.from_kwargs = from_kwargs
+        self.to_node = to_node
+        self.to_args = to_args
+        self.to_kwargs = to_kwargs
+        self.duration = duration
+        self.error = error
+        self.cached = cached
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __str__(self):
+        return repr(self.to_dict())
+
+
+class EventSink:
+    """
+    Receives the events produced by a worker. The events are plain tuples holding the :py:class:`NodeProcessed`
+    fields, in the same order.
+    """
+
+    def append(self, record):
+        raise NotImplementedError()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class FileEventSink(EventSink):
+    """
+    Buffers the events of a worker in memory and appends them in batches to a file owned by that worker. The file is a
+    sequence of pickled lists of records. The fields of the records that can not be pickled, such as the arguments of
+    tasks run by thread workers, are written as their ``repr``.
+
+    :param file: the binary file the events are appended to, see :py:func:`EventLog.open()`.
+    """
+
+    def __init__(self, file, flush_size=1000):
+        self.flush_size = flush_size
+        self.buffer = []
+        self.file = file
+
+    def append(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            try:
+                data = pickle.dumps(self.buffer, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                data = pickle.dumps([picklable(record) for record in self.buffer], pickle.HIGHEST_PROTOCOL)
+            # a record is never written partially
+            self.file.write(data)
+            self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def picklable(record):
+    """
+    :return: the record, or the tuple of its fields, with the values that can not be pickled replaced by their
+     ``repr``.
+    """
+    if not isinstance(record, tuple):
+        return picklable((record,))[0]
+    fields = []
+    for field in record:
+        try:
+            pickle.dumps(field, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            field = repr(field)
+        fields.append(field)
+    return tuple(fields)
+
+
+class EventLog:
+    """
+    Read side of the :py:class:`FileEventSink` files of a workflow. Iterating over it lazily merges the files of all
+    the workers, so the events are never all held in memory at once.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def sink_path(self, name, extension="events"):
+        """
+        :return: the path of a file of the worker ``name``: its events, or its metrics or profile, see
+         :py:mod:`taswor.metrics`.
+        """
+        return os.path.join(self.directory, "{}.{}".format(name, extension))
+
+    def open(self, name, extension="events"):
+        """
+        :return: the file :py:func:`EventLog.sink_path()` opened for appending.
+        """
+        return open(self.sink_path(name, extension), "ab")
+
+    def tail(self, extension):
+        """
+        :return: a :py:class:`LogTail` following the files of the workers with the given extension.
+        """
+        return LogTail(self, extension)
+
+    def records(self):
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.events"))):
+            with open(path, "rb") as events_file:
+                while True:
+                    try:
+                        records = pickle.load(events_file)
+                    except (EOFError, pickle.UnpicklingError):
+                        # the last record of a worker that died may be partial
+                        break
+                    yield from records
+
+    def __iter__(self):
+        for record in self.records():
+            yield NodeProcessed(*record)
+
+
+class LogTail:
+    """
+    Follows the :py:class:`FileEventSink` files of an :py:class:`EventLog` with a given extension, e.g. ``"results"``,
+    while the workers append to them: every :py:func:`LogTail.read()` yields the records written since the previous
+    one, including the ones of the files created in between.
+    """
+
+    def __init__(self, event_log, extension):
+        self.pattern = os.path.join(event_log.directory, "*." + extension)
+        self.files = {}
+
+    def read(self):
+        for path in sorted(glob.glob(self.pattern)):
+            records_file = self.files.get(path)
+            if records_file is None:
+                records_file = self.files[path] = open(path, "rb")
+            while True:
+                position = records_file.tell()
+                try:
+                    records = pickle.load(records_file)
+                except Exception:
+                    # the end of the file, or a record that is still being written
+                    records_file.seek(position)
+                    break
+                yield from records
+
+    def close(self):
+        for records_file in self.files.values():
+            records_file.close()
+        self.files = {}
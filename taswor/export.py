@@ -0,0 +1,422 @@
+import os
+import sys
+import gzip
+import json
+import struct
+import pickle
+from array import array
+
+from taswor.events import NodeProcessed
+from taswor.metrics import Histogram
+
+
+class NodeSummary:
+    """
+    What the events of a node add up to: how many there were, the errors (the distinct messages are counted, up to
+    :py:attr:`GraphExport.error_messages`), the cache hits and the durations, and how many tasks of every other node it
+    produced.
+    """
+
+    __slots__ = ("events", "errors", "cached", "durations", "children", "messages", "chunks")
+
+    def __init__(self):
+        self.events = 0
+        self.errors = 0
+        self.cached = 0
+        self.durations = Histogram()
+        self.children = {}
+        self.messages = {}
+        self.chunks = 0
+
+
+class GraphExport:
+    """
+    Builds the graph of a workflow from its events, in a single pass that keeps none of them: the graph has a vertex
+    per node of the workflow and an edge per pair of nodes, weighted by the number of tasks the first produced for the
+    second. The call counts and execution times are taken from the ``metrics`` of the workers, if given.
+
+    Only the tasks of the ``detail`` nodes are kept, for drill-down. Their arguments are turned into labels of at most
+    ``label_size`` characters, interned, and the tasks are written in chunks of ``chunk_size``, as soon as a chunk is
+    full.
+
+    The export is written to ``directory`` as JavaScript files the HTML report loads with script tags, so that it can
+    be opened from the file system: ``summary.js`` calls ``report.summary(data)`` and the chunks, listed in the summary,
+    call ``report.chunk(node_index, chunk_index, data)`` when the report loads them.
+    """
+
+    error_messages = 20
+
+    def __init__(self, graph, directory, metrics=None, detail=(), chunk_size=10000, label_size=200):
+        """
+        :param graph: the :py:class:`taswor.graph.Graph` of the workflow.
+        :param metrics: a dict mapping the node names to their :py:class:`taswor.metrics.NodeMetrics`.
+        :param detail: the names of the nodes whose tasks are exported, or ``True`` for all of them.
+        """
+        self.directory = directory
+        self.metrics = metrics or {}
+        self.chunk_size = chunk_size
+        self.label_size = label_size
+        self.names = [node.name for node in graph]
+        self.start = [node.name for node in graph.start_nodes]
+        self.indexes = {name: i for i, name in enumerate(self.names)}
+        self.summaries = [NodeSummary() for _ in self.names]
+        self.detail = set(self.names if detail is True else detail)
+        self.chunks = {}
+        self.last_args = self.last_kwargs = self.last_label = None
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, event):
+        """
+        :param event: a :py:class:`taswor.events.NodeProcessed`.
+        """
+        index = self.index(event.from_node)
+        summary = self.summaries[index]
+        summary.events += 1
+        summary.durations.add(event.duration)
+        if event.cached:
+            summary.cached += 1
+        if event.error:
+            summary.errors += 1
+            messages = summary.messages
+            if event.error in messages or len(messages) < self.error_messages:
+                messages[event.error] = messages.get(event.error, 0) + 1
+        to_index = -1
+        if event.to_node is not None:
+            to_index = self.index(event.to_node)
+            summary.children[to_index] = summary.children.get(to_index, 0) + 1
+        if event.from_node in self.detail:
+            self.add_task(index, event, to_index)
+
+    def add_all(self, events):
+        for event in events:
+            self.add(event)
+        return self
+
+    def index(self, name):
+        index = self.indexes.get(name)
+        if index is None:
+            # the events may come from an older version of the workflow
+            index = self.indexes[name] = len(self.names)
+            self.names.append(name)
+            self.summaries.append(NodeSummary())
+        return index
+
+    def add_task(self, index, event, to_index):
+        chunk = self.chunks.get(index)
+        if chunk is None:
+            chunk = self.chunks[index] = {"labels": [], "interned": {}, "tasks": []}
+        to_label = -1
+        if event.to_node is not None:
+            to_label = self.intern(chunk, self.label(event.to_args, event.to_kwargs))
+        # the events of the children of a task share its arguments
+        if event.from_args is not self.last_args or event.from_kwargs is not self.last_kwargs:
+            self.last_args, self.last_kwargs = event.from_args, event.from_kwargs
+            self.last_label = self.label(event.from_args, event.from_kwargs)
+        chunk["tasks"].append([self.intern(chunk, self.last_label), to_index, to_label, round(event.duration, 6),
+                               event.error, 1 if event.cached else 0])
+        if len(chunk["tasks"]) >= self.chunk_size:
+            self.write_chunk(index)
+
+    def label(self, args, kwargs):
+        arguments = [str(arg) for arg in args or ()]
+        arguments.extend("{}={}".format(k, v) for k, v in (kwargs or {}).items())
+        label = ", ".join(arguments)
+        if len(label) > self.label_size:
+            label = label[:self.label_size - 3] + "..."
+        return label
+
+    @staticmethod
+    def intern(chunk, label):
+        interned = chunk["interned"]
+        label_id = interned.get(label)
+        if label_id is None:
+            label_id = interned[label] = len(chunk["labels"])
+            chunk["labels"].append(label)
+        return label_id
+
+    def write_chunk(self, index):
+        chunk = self.chunks.pop(index)
+        summary = self.summaries[index]
+        path = os.path.join(self.directory, "node-{}-{}.js".format(index, summary.chunks))
+        with open(path, "w") as out:
+            out.write("report.chunk({}, {}, ".format(index, summary.chunks))
+            json.dump({"labels": chunk["labels"], "tasks": chunk["tasks"]}, out, separators=(",", ":"))
+            out.write(");\n")
+        summary.chunks += 1
+
+    def summary(self):
+        """
+        :return: the aggregated graph, as the dict given to ``report.summary()``.
+        """
+        nodes = []
+        edges = []
+        for index, (name, summary) in enumerate(zip(self.names, self.summaries)):
+            metrics = self.metrics.get(name)
+            nodes.append({
+                "name": name,
+                "start": name in self.start,
+                "events": summary.events,
+                "errors": summary.errors,
+                "cached": summary.cached,
+                "duration": summary.durations.to_dict(),
+                "calls": metrics.calls if metrics is not None else None,
+                "exec_time": metrics.exec_time.to_dict() if metrics is not None else None,
+                "error_messages": sorted(summary.messages.items(), key=lambda item: -item[1]),
+                "chunks": ["node-{}-{}.js".format(index, i) for i in range(summary.chunks)],
+            })
+            edges.extend([index, to_index, count] for to_index, count in summary.children.items())
+        return {"nodes": nodes, "edges": edges}
+
+    def close(self):
+        """
+        Writes the chunks that are not full yet and the summary.
+        """
+        for index in list(self.chunks):
+            self.write_chunk(index)
+        with open(os.path.join(self.directory, "summary.js"), "w") as out:
+            out.write("report.summary(")
+            json.dump(self.summary(), out, separators=(",", ":"))
+            out.write(");\n")
+
+
+def open_text(filename, mode, compress=None):
+    """
+    Opens a text file, compressed with gzip if ``compress`` is ``True``, or if it is ``None`` and the name ends with
+    ``.gz``.
+    """
+    if compress is None:
+        compress = filename.endswith(".gz")
+    if compress:
+        return gzip.open(filename, mode + "t", encoding="utf-8")
+    return open(filename, mode, encoding="utf-8")
+
+
+def write_ndjson(events, filename, compress=None):
+    """
+    Writes the events to a file as they are read, one JSON object per line (see
+    :py:func:`taswor.events.NodeProcessed.to_dict()`). The arguments that have no JSON form are written as their
+    ``str()``.
+
+    :param compress: see :py:func:`open_text()`.
+    :return: the number of events written.
+    """
+    count = 0
+    encoder = json.JSONEncoder(separators=(",", ":"), default=str)
+    with open_text(filename, "w", compress) as out:
+        for event in events:
+            out.write(encoder.encode(event.to_dict()))
+            out.write("\n")
+            count += 1
+    return count
+
+
+def read_ndjson(filename, compress=None):
+    """
+    Yields the events of a file written by :py:func:`write_ndjson()`, as :py:class:`taswor.events.NodeProcessed`.
+    The arguments are read back as JSON values: the tuples are lists.
+    """
+    with open_text(filename, "r", compress) as lines:
+        for line in lines:
+            if line.strip():
+                yield NodeProcessed(**json.loads(line))
+
+
+class ColumnarWriter:
+    """
+    Writes events in a compact binary format for analytics, with a column per field. The events are written in row
+    groups of ``group_size`` events, as soon as a group is full, so the dump never holds more than a group in memory.
+
+    The file starts with :py:attr:`MAGIC` and the byte order of the machine (``b"<"`` or ``b">"``). Every row group
+    is made of blocks, each prefixed with its size as a little-endian unsigned 64 bits integer:
+
+    - a JSON header: the number of rows and the strings added to the string table by the group
+    - the ``from_node``, ``to_node`` and ``error`` columns, indexes in the string table (``-1`` for ``None``), as
+      ``array("i")``
+    - the ``duration`` column, as ``array("d")``, and the ``cached`` column, as ``array("b")``
+    - if ``args`` is True, the offsets of the arguments of every row in the next block, as ``array("Q")``, and the
+      arguments, every row pickled as a ``(from_args, from_kwargs, to_args, to_kwargs)`` tuple
+
+    The columns are stored as they are in memory, so they can be mapped to NumPy arrays as they are read.
+    """
+
+    MAGIC = b"TASWORC1"
+
+    def __init__(self, file, group_size=65536, args=True):
+        """
+        :param file: a binary file open for writing.
+        :param args: whether the arguments of the tasks are written. Without them, the dump only holds fixed-size
+         columns.
+        """
+        self.file = file
+        self.group_size = group_size
+        self.args = args
+        self.strings = {}
+        self.new_strings = []
+        self.count = 0
+        self.reset()
+        file.write(self.MAGIC + (b"<" if sys.byteorder == "little" else b">"))
+
+    def reset(self):
+        self.from_node = array("i")
+        self.to_node = array("i")
+        self.error = array("i")
+        self.duration = array("d")
+        self.cached = array("b")
+        self.offsets = array("Q", [0])
+        self.payloads = []
+        self.size = 0
+
+    def intern(self, string):
+        if string is None:
+            return -1
+        index = self.strings.get(string)
+        if index is None:
+            index = self.strings[string] = len(self.strings)
+            self.new_strings.append(string)
+        return index
+
+    def add(self, event):
+        self.from_node.append(self.intern(event.from_node))
+        self.to_node.append(self.intern(event.to_node))
+        self.error.append(self.intern(event.error))
+        self.duration.append(event.duration)
+        self.cached.append(1 if event.cached else 0)
+        if self.args:
+            payload = pickle.dumps((event.from_args, event.from_kwargs, event.to_args, event.to_kwargs),
+                                   pickle.HIGHEST_PROTOCOL)
+            self.payloads.append(payload)
+            self.size += len(payload)
+            self.offsets.append(self.size)
+        self.count += 1
+        if len(self.duration) >= self.group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.duration:
+            return
+        header = {"rows": len(self.duration), "strings": self.new_strings, "args": self.args}
+        blocks = [json.dumps(header).encode(), self.from_node, self.to_node, self.error, self.duration, self.cached]
+        if self.args:
+            blocks.extend([self.offsets, b"".join(self.payloads)])
+        for block in blocks:
+            data = memoryview(block).cast("B")
+            self.file.write(struct.pack("<Q", data.nbytes))
+            self.file.write(data)
+        self.new_strings = []
+        self.reset()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def write_columns(events, filename, group_size=65536, args=True):
+    """
+    Writes the events to a file in the format of :py:class:`ColumnarWriter`.
+
+    :return: the number of events written.
+    """
+    writer = ColumnarWriter(open(filename, "wb"), group_size, args)
+    try:
+        for event in events:
+            writer.add(event)
+    finally:
+        writer.close()
+    return writer.count
+
+
+class ColumnarEvents:
+    """
+    The events read from a :py:class:`ColumnarWriter` file, as columns: ``from_node``, ``to_node`` and ``error`` are
+    indexes in ``strings`` (``-1`` for ``None``), ``duration`` and ``cached`` hold the values. The arguments, if they
+    were written and read, are only unpickled when the events are iterated over.
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.from_node = array("i")
+        self.to_node = array("i")
+        self.error = array("i")
+        self.duration = array("d")
+        self.cached = array("b")
+        self.args = None
+
+    def __len__(self):
+        return len(self.duration)
+
+    def string(self, index):
+        return self.strings[index] if index >= 0 else None
+
+    def __iter__(self):
+        """
+        Yields the events as :py:class:`taswor.events.NodeProcessed`.
+        """
+        args = iter(self.args) if self.args is not None else None
+        for i in range(len(self.duration)):
+            from_args = from_kwargs = to_args = to_kwargs = None
+            if args is not None:
+                from_args, from_kwargs, to_args, to_kwargs = next(args)
+            yield NodeProcessed(self.string(self.from_node[i]), from_args, from_kwargs, self.string(self.to_node[i]),
+                                to_args, to_kwargs, self.duration[i], self.string(self.error[i]),
+                                bool(self.cached[i]))
+
+
+class _Arguments:
+    """
+    The pickled arguments of a :py:class:`ColumnarEvents`, per row group.
+    """
+
+    def __init__(self):
+        self.groups = []
+
+    def __iter__(self):
+        for offsets, data in self.groups:
+            for i in range(len(offsets) - 1):
+                yield pickle.loads(data[offsets[i]:offsets[i + 1]])
+
+
+def read_columns(filename, args=False):
+    """
+    Reads a file written by :py:class:`ColumnarWriter`.
+
+    :param args: whether the arguments are read, if they were written. Otherwise they are skipped.
+    :return: a :py:class:`ColumnarEvents`.
+    """
+    columns = ColumnarEvents()
+    if args:
+        columns.args = _Arguments()
+    with open(filename, "rb") as dump:
+        magic = dump.read(len(ColumnarWriter.MAGIC) + 1)
+        if magic[:-1] != ColumnarWriter.MAGIC:
+            raise RuntimeError("{} is not a columnar dump".format(filename))
+        swap = magic[-1:] != (b"<" if sys.byteorder == "little" else b">")
+
+        def read_block(column=None):
+            size, = struct.unpack("<Q", dump.read(8))
+            if column is None:
+                return dump.read(size)
+            values = array(column.typecode)
+            values.frombytes(dump.read(size))
+            if swap:
+                values.byteswap()
+            column.extend(values)
+
+        while dump.read(1):
+            dump.seek(-1, os.SEEK_CUR)
+            header = json.loads(read_block())
+            columns.strings.extend(header["strings"])
+            for column in (columns.from_node, columns.to_node, columns.error, columns.duration, columns.cached):
+                read_block(column)
+            if header["args"]:
+                if args:
+                    offsets = array("Q")
+                    read_block(offsets)
+                    columns.args.groups.append((offsets, read_block()))
+                else:
+                    for _ in range(2):
+                        size, = struct.unpack("<Q", dump.read(8))
+                        dump.seek(size, os.SEEK_CUR)
+            elif args:
+                columns.args = None
+                args = False
+    return columns
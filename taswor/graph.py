@@ -0,0 +1,47 @@
+from taswor.node import Node
+
+
+class Graph:
+    """
+    The nodes of a workflow, compiled once when the workflow is created. Nodes are indexed by name, so routing a
+    :py:class:`taswor.util.Next` to its node is a dictionary lookup, and the whole graph is validated up front:
+    invalid workflows are rejected before any worker is started.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = tuple(nodes)
+        self.index = {}
+        for node in self.nodes:
+            if not isinstance(node, Node):
+                raise RuntimeError("{!r} is not a Node (use the .node attribute of the decorated functions)".format(
+                    node))
+            if node.name in self.index:
+                raise RuntimeError("Multiple nodes with name {} registered".format(node.name))
+            self.index[node.name] = node
+
+        self.start_nodes = [node for node in self.nodes if node.start]
+        if not self.start_nodes:
+            raise RuntimeError("The workflow has no start node")
+
+        for node in self.nodes:
+            for successor in node.successors or ():
+                if successor not in self.index:
+                    raise RuntimeError("Node {} declares the unknown successor {}".format(node.name, successor))
+
+    def route(self, current_node, next_instance):
+        """
+        :return: the node the ``next_instance`` emitted by ``current_node`` must be processed by.
+        """
+        node = self[next_instance.node_name]
+        if current_node.successors is not None and node.name not in current_node.successors:
+            raise RuntimeError("Node {} is not a declared successor of {}".format(node.name, current_node.name))
+        return node
+
+    def __getitem__(self, node_name):
+        try:
+            return self.index[node_name]
+        except KeyError:
+            raise RuntimeError("No node with name {} registered".format(node_name))
+
+    def __iter__(self):
+        return iter(self.nodes)
@@ -0,0 +1,207 @@
+import os
+import time
+import glob
+import pickle
+
+HISTOGRAM_BUCKETS = 40
+
+
+class Histogram:
+    """
+    Distribution of durations, in log2 buckets: bucket ``i`` counts the durations below ``2 ** i`` microseconds (and
+    above the previous bucket). Histograms of different workers are merged by adding their buckets, so the percentiles
+    of a whole workflow are known to within a factor of 2 without keeping every measure.
+    """
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = min(int(seconds * 1000000).bit_length(), HISTOGRAM_BUCKETS - 1)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, fraction):
+        """
+        :return: an upper bound of the given percentile (between 0 and 1), in seconds, or ``None`` if the histogram is
+         empty.
+        """
+        if not self.count:
+            return None
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= fraction * self.count:
+                return min(2 ** bucket / 1000000, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "total": self.total, "mean": self.mean, "max": self.max,
+                "p50": self.percentile(0.5), "p90": self.percentile(0.9), "p99": self.percentile(0.99)}
+
+
+class NodeMetrics:
+    """
+    The counters and histograms of a node:
+
+    - ``calls``: tasks of the node that were processed, cache hits included
+    - ``cache_hits`` and ``cache_misses``: cache lookups, for the nodes that use the cache
+    - ``errors``: calls that raised an exception, once they ran out of retries
+    - ``retries``: failed calls that were retried
+    - ``deduplicated``: tasks of single-flight nodes that got the result of an identical task in flight instead of
+      being called
+    - ``exec_time``: time spent in the node function, per call (per batch for batched nodes)
+    - ``queue_wait``: time the tasks spent in the shared queue before a worker took them
+    - ``latency``: time from the enqueueing of a task taken from the shared queue to the end of its processing (to its
+      deferral for batched nodes, retried calls and single-flight waits), i.e. its queue wait plus its run time
+    - ``serialization``: time spent pickling and unpickling the tasks sent through the queue of a process executor
+    """
+
+    __slots__ = ("calls", "cache_hits", "cache_misses", "errors", "retries", "deduplicated", "exec_time", "queue_wait",
+                 "latency", "serialization")
+
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.errors = 0
+        self.retries = 0
+        self.deduplicated = 0
+        self.exec_time = Histogram()
+        self.queue_wait = Histogram()
+        self.latency = Histogram()
+        self.serialization = Histogram()
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        self.errors += other.errors
+        self.retries += other.retries
+        self.deduplicated += other.deduplicated
+        self.exec_time.merge(other.exec_time)
+        self.queue_wait.merge(other.queue_wait)
+        self.latency.merge(other.latency)
+        self.serialization.merge(other.serialization)
+
+    def to_dict(self):
+        return {"calls": self.calls, "cache_hits": self.cache_hits, "cache_misses": self.cache_misses,
+                "errors": self.errors, "retries": self.retries, "deduplicated": self.deduplicated,
+                "exec_time": self.exec_time.to_dict(), "queue_wait": self.queue_wait.to_dict(),
+                "latency": self.latency.to_dict(), "serialization": self.serialization.to_dict()}
+
+    def __str__(self):
+        return repr(self.to_dict())
+
+
+class MetricsRecorder:
+    """
+    Collects the metrics of a worker. The metrics measured since the last flush are appended to a file owned by the
+    worker; the worker flushes periodically and whenever it runs out of tasks (see
+    :py:class:`taswor.process.worker.Worker`), so the files are complete once the workflow has completed.
+
+    Without a ``file``, the recorder only collects metrics, to be merged into another recorder.
+
+    :param file: the binary file the metrics are appended to, see :py:func:`taswor.events.EventLog.open()`.
+    """
+
+    def __init__(self, file=None):
+        self.nodes = {}
+        self.file = file
+        # the time the tasks taken from the shared queue were enqueued, by id, until they are processed
+        self.enqueued = {}
+
+    def __getitem__(self, node_name):
+        metrics = self.nodes.get(node_name)
+        if metrics is None:
+            metrics = self.nodes[node_name] = NodeMetrics()
+        return metrics
+
+    def record_queue_wait(self, tasks, seconds):
+        """
+        Records the time a batch of tasks waited in the shared queue, for every task of the batch.
+        """
+        enqueued_at = time.time() - seconds
+        for task in tasks:
+            self[task[0]].queue_wait.add(seconds)
+            self.enqueued[id(task)] = enqueued_at
+
+    def record_latency(self, task):
+        """
+        Records the latency of a task once it is processed, if it was taken from the shared queue.
+        """
+        enqueued_at = self.enqueued.pop(id(task), None)
+        if enqueued_at is not None:
+            self[task[0]].latency.add(time.time() - enqueued_at)
+
+    def forget(self, tasks):
+        """
+        Drops the enqueue time of tasks that are enqueued again, their latency is measured by the worker taking them.
+        """
+        for task in tasks:
+            self.enqueued.pop(id(task), None)
+
+    def record_serialization(self, tasks, seconds):
+        """
+        Shares the time spent (un)pickling a batch of tasks between the tasks of the batch.
+        """
+        share = seconds / len(tasks)
+        for task in tasks:
+            self[task[0]].serialization.add(share)
+
+    def merge(self, other):
+        for node_name, metrics in other.nodes.items():
+            self[node_name].merge(metrics)
+        self.enqueued.update(other.enqueued)
+
+    def flush(self):
+        if self.nodes and self.file:
+            pickle.dump(self.nodes, self.file, pickle.HIGHEST_PROTOCOL)
+            self.nodes = {}
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.file:
+            self.file.close()
+
+
+def read_metrics(directory):
+    """
+    Merges the metrics files of all the workers found in ``directory``.
+
+    :return: a dict mapping node names to :py:class:`NodeMetrics`
+    """
+    merged = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.metrics"))):
+        with open(path, "rb") as metrics_file:
+            while True:
+                try:
+                    nodes = pickle.load(metrics_file)
+                except (EOFError, pickle.UnpicklingError):
+                    # the last record of a worker that died may be partial
+                    break
+                for node_name, metrics in nodes.items():
+                    if node_name not in merged:
+                        merged[node_name] = NodeMetrics()
+                    merged[node_name].merge(metrics)
+    return merged
@@ -1,13 +1,101 @@
+from taswor.cache import make_key
+
+
 class Node:
-    def __init__(self, func, name, start=False, init_generator=None, use_cache=True):
+    SINGLE_FLIGHT_LEASE = 60
+
+    def __init__(self, func, name, start=False, init_generator=None, use_cache=True, cache_key=None, batch_size=None,
+                 max_wait=0, batch_numpy=False, successors=None, retries=0, backoff=0, timeout=None, priority=0,
+                 single_flight=False):
+        """
+        :param cache_key: optional callable receiving the node arguments and returning the value from which the cache
+         key is derived. By default the key is derived from all the arguments.
+        :param batch_size: if set, the node is a batch node: up to ``batch_size`` pending invocations are resolved
+         with a single call of ``func``, which receives a list for every positional and keyword argument (the values
+         of that argument for every invocation) and must return a list with one result per invocation.
+        :param max_wait: the maximum number of seconds an invocation of a batch node waits for the batch to fill up.
+         With the default, the batch is resolved as soon as there are no more tasks to take from the queue.
+        :param batch_numpy: if True, the arguments of a batch node are passed as NumPy arrays instead of lists.
+        :param successors: optional names of the nodes this node may emit a ``Next`` to. They are validated when the
+         workflow is created and emitting a ``Next`` to any other node is an error.
+        :param retries: the number of times a failed call is retried before the error is recorded.
+        :param backoff: the number of seconds before the first retry. The delay doubles with every retry.
+        :param timeout: the maximum number of seconds a call may last. A call that lasts longer fails with a
+         ``TimeoutError``. Calls are interrupted in the main thread of the worker processes, while ``async def``
+         nodes are cancelled; elsewhere the timeout can only be checked once the call returns.
+        :param priority: the tasks of nodes with a higher priority are run first among the tasks held by a worker. The
+         shared queue itself is first in, first out.
+        :param single_flight: if True, a task identical to one in flight (with the same cache key) is not run: it
+         waits for the result of the first one, read from the cache. The first task holds a claim on its cache key
+         (see :py:func:`taswor.cache.Cache.claim()`) until its result is cached or it fails, in which case one of the
+         waiting tasks runs instead. Identical tasks are detected across the workers with a shared cache backend, and
+         within a worker with the in-memory one. A claim whose worker died expires after :py:func:`Node.claim_lease()`
+         seconds; a number can be given instead of True to set it.
+        """
+        if single_flight and not use_cache:
+            raise RuntimeError("The single-flight node {} must use the cache".format(name))
         self.func = func
         self.name = name
         self.start = start
         self.init_generator = init_generator
         self.use_cache = use_cache
+        self.cache_key = cache_key
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.batch_numpy = batch_numpy
+        self.successors = frozenset(successors) if successors is not None else None
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.priority = priority
+        self.single_flight = single_flight
 
     def resolve(self, *args, **kwargs):
         return self.func(*args, **kwargs)
 
+    def resolve_batch(self, invocations):
+        """
+        Calls a batch node for several invocations at once.
+
+        :param invocations: a list of (args, kwargs) tuples with the same number of args and the same kwargs names.
+        """
+        args = [list(column) for column in zip(*[args for args, _ in invocations])]
+        kwargs = {name: [invocation_kwargs[name] for _, invocation_kwargs in invocations]
+                  for name in invocations[0][1]}
+        if self.batch_numpy:
+            import numpy
+            args = [numpy.asarray(column) for column in args]
+            kwargs = {name: numpy.asarray(column) for name, column in kwargs.items()}
+        return self.func(*args, **kwargs)
+
+    def retry_delay(self, attempt):
+        """
+        :return: the number of seconds to wait before the given attempt (1 for the first retry).
+        """
+        return self.backoff * 2 ** (attempt - 1)
+
+    def claim_lease(self):
+        """
+        :return: the number of seconds a claim of a single-flight node lasts: the time all its attempts may take if it
+         has a ``timeout``, :py:attr:`SINGLE_FLIGHT_LEASE` otherwise.
+        """
+        if self.single_flight is not True:
+            return self.single_flight
+        if self.timeout is None:
+            return self.SINGLE_FLIGHT_LEASE
+        delays = sum(self.retry_delay(attempt) for attempt in range(1, self.retries + 1))
+        return self.timeout * (self.retries + 1) + delays
+
+    def get_cache_key(self, args, kwargs):
+        if self.cache_key is not None:
+            return make_key(self.name, self.cache_key(*args, **kwargs))
+        return make_key(self.name, args, kwargs)
+
+    def __getstate__(self):
+        # the workers never use the init generator, which may not be picklable
+        state = self.__dict__.copy()
+        state["init_generator"] = None
+        return state
+
     def __repr__(self):
         return "<Node {} func={}>".format(self.name, self.func)
@@ -0,0 +1,264 @@
+import os
+import time
+import asyncio
+import inspect
+from collections import deque
+from functools import partial
+
+from taswor.cache import MISSING
+from taswor.metrics import MetricsRecorder
+from taswor.process.worker import Worker, call_with_timeout, await_with_timeout, split_task
+
+
+class AsyncWorker(Worker):
+    """
+    Worker that runs the nodes inside an asyncio event loop. ``async def`` node functions are awaited, so up to
+    ``concurrency`` of them can be in progress at the same time in a single worker process. Regular node functions are
+    called directly and block the loop while they run.
+
+    The tasks the worker keeps in its local queue (the children that do not fit in a full queue, or all of them with
+    ``affinity``) are started one at a time, as the concurrency limit allows, so that they run in the order of the
+    local queue, and before the tasks taken from the shared queue meanwhile.
+
+    While nodes with ``retries`` or ``single_flight`` are running, the queue is polled every
+    :py:attr:`RETRY_POLL_INTERVAL` seconds at most, so that the calls they retry and the tasks waiting for them are not
+    delayed by a blocking read.
+    """
+
+    RETRY_POLL_INTERVAL = 0.1
+
+    def __init__(self, *args, concurrency=100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.concurrency = concurrency
+        self.semaphore = None
+        self.local_ready = None
+        self.received = deque()
+        self.receiving = None
+        self.running = set()
+        self.has_retries = any(node.retries or node.single_flight for node in self.graph)
+
+    def start(self):
+        self.logger.debug("Async worker %s started and waiting", os.getpid())
+        asyncio.run(self.run())
+        self.close()
+
+    def run_until_idle(self):
+        asyncio.run(self.run(until_idle=True))
+        self.flush_metrics()
+        self.dump_profile()
+
+    async def run(self, until_idle=False):
+        loop = asyncio.get_running_loop()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.local_ready = asyncio.Event()
+
+        while True:
+            if until_idle:
+                await self.run_retries_async()
+                await self.run_local()
+                tasks = self.queue.get(block=False, metrics=self.metrics)
+                if not tasks and self.pending:
+                    await self.run_batches_async(force=True)
+                    continue
+                if not tasks and self.running:
+                    # the running nodes may still produce new tasks, or a retry may become due
+                    await asyncio.wait(set(self.running), timeout=self.pending_timeout(),
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                if not tasks and (self.retrying or self.waiting):
+                    await asyncio.sleep(self.pending_timeout())
+                    continue
+                if not tasks:
+                    break
+            else:
+                await self.run_local()
+                if self.receiving is None:
+                    # the queue is blocking, so it is read from a thread of the default executor, which records its
+                    # metrics apart from the ones of the running nodes
+                    received = MetricsRecorder()
+                    timeout = self.pending_timeout()
+                    if self.has_retries and self.running:
+                        timeout = min(self.RETRY_POLL_INTERVAL,
+                                      self.RETRY_POLL_INTERVAL if timeout is None else timeout)
+                    # the batch is journaled as soon as it is received, as the process may die while the loop runs
+                    self.receiving = loop.run_in_executor(None, partial(self.queue.get, timeout=timeout,
+                                                                        metrics=received, journal=self.journal))
+                if self.metrics_held and not self.running:
+                    # the workflow may be waiting for the metrics to complete
+                    self.flush_metrics()
+                # the running nodes may hold new tasks before a batch is received
+                self.local_ready.clear()
+                held = asyncio.ensure_future(self.local_ready.wait())
+                await asyncio.wait({self.receiving, held}, return_when=asyncio.FIRST_COMPLETED)
+                held.cancel()
+                if not self.receiving.done():
+                    continue
+                tasks, self.receiving = self.receiving.result(), None
+                self.metrics.merge(received)
+                if tasks is None:
+                    break
+                await self.run_retries_async()
+                if not tasks:
+                    await self.run_batches_async(force=True)
+                    continue
+            held = []
+            for task in tasks:
+                if self.graph[task[0]].batch_size:
+                    # batch nodes are deferred right away, so that the pending batches are known before the next get
+                    self.process_tasks([task])
+                else:
+                    held.append(task)
+            # started by run_local(), once the tasks the running nodes keep meanwhile are started
+            self.received.extend(held)
+            await self.run_batches_async()
+
+        while self.running:
+            await asyncio.wait(set(self.running))
+            await self.run_local()
+
+    async def run_retries_async(self):
+        for task, cache_key, attempt in self.due_retries():
+            if self.graph[task[0]].batch_size:
+                # deferred right away, as the tasks of batch nodes taken from the queue
+                self.retry(task, cache_key, attempt)
+                continue
+            await self.semaphore.acquire()
+            self.spawn(task, acquired=True, retry=(cache_key, attempt))
+        for task, cache_key in self.pop_due(self.waiting):
+            if self.poll_waiting(task, cache_key):
+                continue
+            # the identical task failed: the waiting task is called as a first attempt
+            if self.graph[task[0]].batch_size:
+                self.retry(task, cache_key, 0)
+                continue
+            await self.semaphore.acquire()
+            self.spawn(task, acquired=True, retry=(cache_key, 0))
+
+    def spawn(self, task, acquired=False, retry=None):
+        """
+        :param retry: a tuple (cache_key, attempt) if the task is a retry of a failed call.
+        """
+        running = asyncio.get_running_loop().create_task(self.run_task(task, acquired, retry))
+        self.running.add(running)
+        running.add_done_callback(self.task_stopped)
+
+    def task_stopped(self, running):
+        self.running.discard(running)
+        if self.metrics_held and not self.running and self.local_ready is not None:
+            # wakes the loop waiting for the queue, so that it writes the metrics first
+            self.local_ready.set()
+
+    def flush_children(self):
+        super().flush_children()
+        if self.local and self.local_ready is not None:
+            self.local_ready.set()
+
+    def idle(self):
+        # the task calling it is still running, and the worker may be waiting for the shared queue already
+        return (not self.local and not self.received and len(self.running) <= 1 and
+                (self.receiving is not None or self.queue.empty()))
+
+    async def run_local(self):
+        """
+        Starts the tasks of the local queue, each once the concurrency allows, so that they start in the order of the
+        local queue, which the tasks running meanwhile may add to. Like the other workers, the worker then runs the
+        tasks it received from the shared queue.
+        """
+        while self.local or self.received:
+            await self.semaphore.acquire()
+            if self.local:
+                tasks = self.local.pop_many(1)
+            elif self.received:
+                tasks = [self.received.popleft()]
+            else:
+                # shared with the other workers meanwhile
+                self.semaphore.release()
+                break
+            if self.graph[tasks[0][0]].batch_size:
+                self.semaphore.release()
+                self.process_tasks(tasks)
+                continue
+            self.spawn(tasks[0], acquired=True)
+
+    async def run_task(self, task, acquired=True, retry=None):
+        if not acquired:
+            await self.semaphore.acquire()
+        node_name, args, kwargs, tag = split_task(task)
+        retried = False
+        try:
+            node = self.graph[node_name]
+            if retry is None:
+                self.task_logger.debug("Received %s", node)
+                retried = await self.process_node_async(node, args, kwargs, tag)
+            else:
+                retried = await self.call_node_async(node, args, kwargs, *retry, tag=tag)
+        except Exception as e:
+            self.handle_error(e, self.graph[node_name], args, kwargs, time.time(), tag)
+        finally:
+            self.metrics.record_latency(task)
+            # a task whose call is retried, or that waits, is held by the worker until then
+            self.finish(0 if retried else 1)
+            self.semaphore.release()
+
+    async def process_node_async(self, current_node, args, kwargs, tag=None):
+        """
+        :return: True if the call failed and is retried, or the task waits for an identical task in flight.
+        """
+        start_time = time.time()
+        try:
+            if tag is None and self.replay(current_node, args, kwargs, start_time):
+                return False
+            cache_key, cached = self.lookup_cache(current_node, args, kwargs)
+        except Exception as e:
+            self.handle_error(e, current_node, args, kwargs, start_time, tag)
+            return False
+        if cached is MISSING and current_node.single_flight:
+            claimed, cached = self.claim(current_node, cache_key)
+            if not claimed:
+                self.wait((current_node.name, args, kwargs, tag), cache_key)
+                return True
+        if cached is not MISSING:
+            self.process_result(cached, current_node, args, kwargs, start_time, cached=True, tag=tag)
+            return False
+
+        return await self.call_node_async(current_node, args, kwargs, cache_key, tag=tag)
+
+    async def call_node_async(self, current_node, args, kwargs, cache_key, attempt=0, tag=None):
+        # while a profiled node is awaited, the profile also includes the other nodes running in the loop
+        profiled = self.start_profile(current_node)
+        start_time = time.time()
+        try:
+            result = call_with_timeout(current_node.timeout, current_node.resolve, *args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await await_with_timeout(current_node.timeout, result)
+        except Exception as e:
+            self.metrics[current_node.name].exec_time.add(time.time() - start_time)
+            return self.handle_failure(e, current_node, args, kwargs, cache_key, attempt, start_time, tag)
+        finally:
+            if profiled:
+                self.stop_profile()
+
+        self.metrics[current_node.name].exec_time.add(time.time() - start_time)
+        self.handle_resolved(result, cache_key, current_node, args, kwargs, start_time, tag)
+        return False
+
+    async def run_batches_async(self, force=False):
+        for current_node, invocations in self.due_batches(force):
+            retried = 0
+            profiled = self.start_profile(current_node)
+            start_time = time.time()
+            try:
+                try:
+                    results = call_with_timeout(current_node.timeout, current_node.resolve_batch,
+                                                [(args, kwargs) for args, kwargs, _, _, _ in invocations])
+                    if inspect.isawaitable(results):
+                        results = await await_with_timeout(current_node.timeout, results)
+                except Exception as e:
+                    results = e
+                finally:
+                    if profiled:
+                        self.stop_profile()
+                self.metrics[current_node.name].exec_time.add(time.time() - start_time)
+                retried = self.handle_batch(results, current_node, invocations, start_time)
+            finally:
+                self.finish(len(invocations) - retried)
@@ -0,0 +1,179 @@
+import os
+import threading
+from collections import OrderedDict
+from multiprocessing.connection import Listener
+
+from taswor.util import get_logger
+
+
+class Delivery:
+    """
+    The batches delivered to a remote worker and not acknowledged yet, with the number of their tasks the worker
+    already marked as done.
+    """
+
+    def __init__(self):
+        self.batches = OrderedDict()
+        self.sequence = 0
+        self.done = 0
+
+
+class Broker:
+    """
+    TCP server handing out the tasks of a :py:class:`taswor.process.task_queue.TaskQueue` to remote workers (see
+    :py:mod:`taswor.process.remote`). It runs in the process of the workflow, in threads of its own.
+
+    Every remote worker opens two authenticated connections. On the ``tasks`` connection it pulls batches, which the
+    broker numbers. On the ``control`` connection, which is never answered so it costs no round-trip, it sends the
+    tasks it produces, the outstanding tasks it reserves, the number of tasks it is done with, and the content of its
+    event and metrics files. When the worker has no task in progress, it acknowledges the batches delivered so far.
+
+    If a connection of a worker is lost, the batches that were not acknowledged are delivered again to the other
+    workers: the tasks are executed at least once.
+    """
+
+    def __init__(self, queue, event_dir, config, address=("127.0.0.1", 0), authkey=None, logger=None):
+        """
+        :param config: the tuple sent to the workers when they connect, see
+         :py:func:`taswor.process.remote.run_worker()`.
+        :param logger: the logger of the broker. By default, the messages are written to stdout.
+        """
+        self.queue = queue
+        self.event_dir = event_dir
+        self.config = config
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.lock = threading.Lock()
+        self.deliveries = {}
+        self.files = {}
+        self.connections = set()
+        self.closed = False
+        self.logger = logger or get_logger("Broker")
+
+    def start(self):
+        threading.Thread(target=self.accept, name="broker", daemon=True).start()
+
+    def accept(self):
+        while not self.closed:
+            try:
+                connection = self.listener.accept()
+            except Exception as e:
+                if not self.closed:
+                    self.logger.error("Could not accept a worker: %s", e)
+                continue
+            threading.Thread(target=self.serve, args=(connection,), name="broker-connection", daemon=True).start()
+
+    def serve(self, connection):
+        worker = None
+        with self.lock:
+            self.connections.add(connection)
+        try:
+            role, worker = connection.recv()
+            if role == "tasks":
+                with self.lock:
+                    self.deliveries[worker] = Delivery()
+                connection.send(self.config)
+                self.logger.info("Worker %s connected", worker)
+                self.serve_tasks(connection, worker)
+            else:
+                self.serve_control(connection, worker)
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            # closing the broker closes the connections under the feet of their threads
+            if not self.closed:
+                self.logger.error("Connection of worker %s failed: %s", worker, e)
+        finally:
+            with self.lock:
+                self.connections.discard(connection)
+            connection.close()
+            if worker is not None:
+                self.disconnect(worker)
+
+    def serve_tasks(self, connection, worker):
+        while True:
+            block, timeout = connection.recv()
+            item = self.queue.get_item(block, timeout)
+            if not item:
+                # no batch, or None once the queue is stopped
+                connection.send(item)
+                continue
+            enqueued_at, batch = item
+            with self.lock:
+                delivery = self.deliveries.get(worker)
+                if delivery is not None:
+                    delivery.sequence += 1
+                    delivery.batches[delivery.sequence] = batch
+            if delivery is None:
+                # the control connection of the worker is already lost
+                self.queue.redeliver(batch)
+                return
+            connection.send((delivery.sequence, enqueued_at, batch))
+
+    def serve_control(self, connection, worker):
+        while True:
+            message = connection.recv()
+            kind = message[0]
+            if kind == "put":
+                self.queue.put_many(message[1])
+            elif kind == "reserve":
+                self.queue.reserve(message[1])
+            elif kind == "done":
+                _, count, acknowledged = message
+                with self.lock:
+                    delivery = self.deliveries.get(worker)
+                    if delivery is not None:
+                        delivery.done += count
+                        if acknowledged:
+                            self.acknowledge(delivery, acknowledged)
+                self.queue.task_done(count)
+            elif kind == "append":
+                self.append(message[1], message[2])
+            elif kind == "close":
+                return
+
+    def acknowledge(self, delivery, sequence):
+        """
+        Forgets the batches delivered up to ``sequence``, whose tasks are all done.
+        """
+        while delivery.batches:
+            first = next(iter(delivery.batches))
+            if first > sequence:
+                break
+            delivery.done -= len(delivery.batches.pop(first))
+
+    def append(self, filename, data):
+        # the workers only name files of the event directory
+        path = os.path.join(self.event_dir, os.path.basename(filename))
+        with self.lock:
+            if path not in self.files:
+                self.files[path] = open(path, "ab")
+            events_file = self.files[path]
+            events_file.write(data)
+            events_file.flush()
+
+    def disconnect(self, worker):
+        with self.lock:
+            delivery = self.deliveries.pop(worker, None)
+        if delivery is None:
+            return
+        tasks = [task for batch in delivery.batches.values() for task in batch]
+        if tasks:
+            self.logger.warning("Worker %s left with %s unfinished tasks, delivering them again", worker, len(tasks))
+            self.queue.redeliver(tasks, delivery.done)
+        else:
+            self.logger.info("Worker %s left", worker)
+
+    def worker_count(self):
+        with self.lock:
+            return len(self.deliveries)
+
+    def close(self):
+        self.closed = True
+        self.listener.close()
+        with self.lock:
+            for connection in list(self.connections):
+                connection.close()
+            for events_file in self.files.values():
+                events_file.close()
+            self.files = {}
@@ -0,0 +1,195 @@
+import time
+import threading
+from collections import OrderedDict
+
+from taswor.events import FileEventSink
+from taswor.util import get_logger
+
+
+def chain_tag(tag):
+    """
+    :return: the tag of the task produced by a task of a join branch through a single ``Next``.
+    """
+    return None if tag is None else (tag[0], tag[1], tag[2] + 1)
+
+
+def branch_tag(tag, index):
+    """
+    :return: the tag of the ``index``-th task of the list of ``Next`` returned by a task of a join branch.
+    """
+    return None if tag is None else (tag[0], tag[1] + (index,), tag[2] + 1)
+
+
+class PendingJoin:
+    """
+    The state of a join whose branches are running: how many of their tasks are outstanding, the results of the leaf
+    tasks and the size of the lists of ``Next`` returned, by position in the branches.
+
+    The reports of the workers are read in no particular order, so the tasks reported before the task that produced
+    them are kept apart as ``orphans``: until they are adopted, the count of outstanding tasks misses their siblings.
+    """
+
+    __slots__ = ("task", "tag", "size", "outstanding", "failed", "outputs", "fanouts", "reported", "orphans")
+
+    def __init__(self):
+        self.task = None
+        self.tag = None
+        self.size = None
+        self.outstanding = 0
+        self.failed = 0
+        self.outputs = {}
+        self.fanouts = {}
+        self.reported = {}
+        self.orphans = set()
+
+    def output(self, path):
+        fanout = self.fanouts.get(path)
+        if fanout is None:
+            return self.outputs.get(path)
+        return [self.output(path + (i,)) for i in range(fanout)]
+
+    def results(self):
+        return [self.output((i,)) for i in range(self.size)]
+
+
+class JoinCollector:
+    """
+    Completes the joins of a workflow (see :py:class:`taswor.util.Join`), from the process of the workflow.
+
+    The tasks of the branches of a join carry a tag, a 4th element of their tuple: ``(join_id, path, depth)``, where
+    ``path`` is the position of the task in the lists of ``Next`` of its branch and ``depth`` the number of tasks that
+    led to it from the start of its branch. The tasks produced by a tagged task inherit its tag, extended with
+    :py:func:`chain_tag()` or :py:func:`branch_tag()`. Every tagged task reports to the ``joins`` file of its worker
+    how many tasks it produced and, for a leaf, its result; the worker that produced the join reports its node, its
+    number of branches and the tag of the task that produced it, and holds an outstanding task for the join until it
+    is enqueued.
+
+    The collector reads the reports as they are written (see :py:class:`taswor.events.LogTail`) and once all the tasks
+    of the branches of a join are done, enqueues the join node with their results. A task delivered again after its
+    worker died is only counted once: the ids of the last :py:attr:`COMPLETED_JOINS` completed joins are kept, so that
+    the reports of such tasks read after their join completed are ignored.
+    """
+
+    POLL_INTERVAL = 0.02
+    COMPLETED_JOINS = 10000
+
+    def __init__(self, queue, event_log, logger=None):
+        self.queue = queue
+        self.tail = event_log.tail("joins")
+        self.events = FileEventSink(event_log.open("collector"))
+        self.joins = {}
+        self.completed = OrderedDict()
+        self.closed = False
+        self.thread = None
+        self.logger = logger or get_logger("Collector")
+
+    def start(self):
+        """
+        Polls the reports from a thread of its own.
+        """
+        self.thread = threading.Thread(target=self.run, name="join-collector", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.closed:
+            if not self.poll():
+                time.sleep(self.POLL_INTERVAL)
+
+    def poll(self):
+        """
+        Handles the reports written since the last call.
+
+        :return: the number of reports handled.
+        """
+        count = 0
+        for record in self.tail.read():
+            count += 1
+            if record[0] == "join":
+                self.add_join(*record[1:])
+            else:
+                self.report(*record[1:])
+        self.events.flush()
+        return count
+
+    def pending(self, join_id):
+        join = self.joins.get(join_id)
+        if join is None:
+            # the reports of the branches may be read before the one of the join
+            join = self.joins[join_id] = PendingJoin()
+        return join
+
+    def add_join(self, join_id, task, tag, size, failed):
+        """
+        :param task: the ``(node_name, args, kwargs)`` of the join node, without the results.
+        :param tag: the tag of the task that produced the join, or ``None``.
+        :param size: the number of branches.
+        :param failed: the number of branches that could not be routed.
+        """
+        join = self.pending(join_id)
+        join.task = task
+        join.tag = tag
+        join.size = size
+        join.outstanding += size - failed
+        join.failed += failed
+        self.check(join_id, join)
+
+    def report(self, tag, children, output, fanout, error):
+        """
+        :param children: the number of tasks produced by the task.
+        :param output: the result of the task, if it is a leaf.
+        :param fanout: the length of the list of ``Next`` returned by the task, if it returned one.
+        :param error: True if the task, or the routing of a task it produced, failed.
+        """
+        join_id, path, depth = tag
+        if join_id in self.completed:
+            return
+        join = self.pending(join_id)
+        if (path, depth) in join.reported:
+            return
+        join.reported[(path, depth)] = fanout
+        join.outstanding += children - 1
+        if error:
+            join.failed += 1
+        elif fanout is not None:
+            join.fanouts[path] = fanout
+        elif not children:
+            join.outputs[path] = output
+        # the task was produced by a single Next of the previous task at the same path, or by the list of Next of the
+        # previous task at the parent path
+        if depth and (path, depth - 1) not in join.reported and join.reported.get((path[:-1], depth - 1)) is None:
+            join.orphans.add((path, depth))
+        if fanout is None:
+            join.orphans.discard((path, depth + 1))
+        else:
+            join.orphans.difference_update((path + (i,), depth + 1) for i in range(fanout))
+        self.check(join_id, join)
+
+    def check(self, join_id, join):
+        if join.size is None or join.outstanding > 0 or join.orphans:
+            return
+        del self.joins[join_id]
+        self.completed[join_id] = None
+        if len(self.completed) > self.COMPLETED_JOINS:
+            self.completed.popitem(last=False)
+        node_name, args, kwargs = join.task
+        if join.failed:
+            error = "{} branches of the join failed".format(join.failed)
+            self.logger.error("Join %s(%s, %s) not called: %s", node_name, args, kwargs, error)
+            self.events.append((node_name, args, kwargs, None, None, None, 0.0, error, False))
+            # the event is written before the workflow can complete
+            self.events.flush()
+            if join.tag is not None:
+                self.report(join.tag, 0, None, None, True)
+        else:
+            task = (node_name, (join.results(),) + tuple(args), kwargs)
+            self.queue.put_many([task + (join.tag,) if join.tag is not None else task])
+        # the worker that produced the join held an outstanding task for it
+        self.queue.task_done()
+
+    def close(self):
+        self.closed = True
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.tail.close()
+        self.events.close()
@@ -0,0 +1,291 @@
+import os
+import time
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+
+from taswor.events import EventLog
+from taswor.process.broker import Broker
+from taswor.process.inflight import InflightJournal
+from taswor.process.remote import run_worker, parse_address
+from taswor.process.task_queue import TaskQueue, ThreadContext
+from taswor.process.transport import SharedMemoryTransport
+from taswor.process.worker import worker_run
+from taswor.util import LogPolicy
+
+
+class ProcessExecutor:
+    """
+    Runs every worker in its own process. Best suited for CPU-bound nodes.
+
+    When closed, the workers are asked to stop and the ones still busy after ``grace_period`` seconds are terminated.
+
+    The workers are supervised by a thread of the workflow's process: when one of them dies, the tasks it held (see
+    :py:class:`taswor.process.inflight.InflightJournal`) are enqueued again and a new worker takes its place, at most
+    ``max_restarts`` times. The tasks are executed at least once.
+    """
+
+    grace_period = 1
+
+    max_restarts = 100
+
+    context = multiprocessing
+
+    # the queue the workers log to, if they inherited it, see taswor.util.LogPolicy.start()
+    log_queue = None
+
+    def __init__(self, workers, log_policy=None):
+        """
+        :param log_policy: the :py:class:`taswor.util.LogPolicy` of the workflow, which the executor logs with as well.
+        """
+        self.workers = workers
+        self.log_policy = log_policy or LogPolicy()
+        self.handles = []
+        self.worker_class = None
+        self.args = ()
+        self.kwargs = {}
+        self.lock = threading.Lock()
+        self.closing = False
+        self.restarts = 0
+        self.logger = self.log_policy.get_logger("Executor")
+
+    def create_queue(self, batch_size, maxsize=0, shared_memory_threshold=None):
+        transport = None
+        if shared_memory_threshold and self.context is multiprocessing:
+            transport = SharedMemoryTransport(shared_memory_threshold)
+        return TaskQueue(batch_size, context=self.context, maxsize=maxsize, transport=transport)
+
+    def start(self, worker_class, args, kwargs):
+        self.worker_class = worker_class
+        self.args = args
+        self.kwargs = dict(kwargs, track_inflight=True)
+        self.handles = [self.start_worker("worker-{}".format(i)) for i in range(self.workers)]
+        threading.Thread(target=self.supervise, name="supervisor", daemon=True).start()
+
+    def start_worker(self, name):
+        handle = multiprocessing.Process(target=worker_run, args=(self.worker_class,) + self.args,
+                                         kwargs=dict(self.kwargs, name=name), name=name)
+        handle.start()
+        return handle
+
+    def supervise(self):
+        queue, _, event_dir = self.args[:3]
+        while True:
+            with self.lock:
+                sentinels = {handle.sentinel: handle for handle in self.handles}
+            if not sentinels:
+                return
+            for sentinel in wait(list(sentinels)):
+                handle = sentinels[sentinel]
+                handle.join()
+                # the worker may have died waiting for a batch, with the reader lock of the queue held
+                queue.release_reader(handle.pid)
+                with self.lock:
+                    if self.closing:
+                        return
+                    self.replace(handle)
+                batches, done = InflightJournal.recover(EventLog(event_dir).sink_path(handle.name, "inflight"))
+                # the replacement is already started, so it can take tasks if the queue is full
+                count = queue.recover(batches, done)
+                self.logger.warning("Worker %s died with exit code %s, delivered its %s unfinished tasks again",
+                                    handle.name, handle.exitcode, count)
+
+    def replace(self, handle):
+        self.handles.remove(handle)
+        if self.restarts >= self.max_restarts:
+            self.logger.error("Worker %s not replaced, %s workers were already restarted", handle.name, self.restarts)
+            return
+        self.restarts += 1
+        # the files of the dead worker may end with a partial record, its replacement writes files of its own
+        name = "{}-restart-{}".format(handle.name.split("-restart-")[0], self.restarts)
+        self.handles.append(self.start_worker(name))
+
+    def seed(self, seeder):
+        threading.Thread(target=seeder.run, name="seeder", daemon=True).start()
+
+    def collect(self, collector):
+        """
+        Runs the :py:class:`taswor.process.collector.JoinCollector` of the workflow while the workers run.
+        """
+        collector.start()
+
+    def run_pending(self):
+        pass
+
+    def close(self, queue):
+        with self.lock:
+            self.closing = True
+        # the workers that stop by themselves flush their events and logs
+        deadline = time.time() + self.grace_period
+        queue.stop(len(self.handles), timeout=self.grace_period)
+        for handle in self.handles:
+            handle.join(max(0, deadline - time.time()))
+        for handle in self.handles:
+            if handle.is_alive():
+                handle.terminate()
+                handle.join()
+
+
+class ThreadExecutor(ProcessExecutor):
+    """
+    Runs every worker in a thread of the current process. There is no process to start and the tasks are passed to
+    the workers without being pickled, which suits small workflows and nodes that release the GIL (I/O, NumPy, ...).
+    Their arguments are still pickled to derive the cache keys, and to record the events.
+    """
+
+    context = ThreadContext
+
+    def start(self, worker_class, args, kwargs):
+        self.handles = [
+            threading.Thread(target=worker_run, args=(worker_class,) + args,
+                             kwargs=dict(kwargs, name="worker-{}".format(i)), name="worker-{}".format(i), daemon=True)
+            for i in range(self.workers)]
+        for handle in self.handles:
+            handle.start()
+
+    def close(self, queue):
+        # threads can not be terminated, they return once they receive the stop marker
+        queue.stop(len(self.handles))
+        for handle in self.handles:
+            handle.join()
+
+
+class InlineExecutor(ThreadExecutor):
+    """
+    Runs a single worker in the calling thread, while waiting for the completion of the workflow. The execution is
+    deterministic, which makes it the easiest mode to debug and profile node code with.
+    """
+
+    def __init__(self, workers=1, log_policy=None):
+        super().__init__(1, log_policy)
+        self.worker = None
+        self.seeders = []
+        self.collector = None
+
+    def start(self, worker_class, args, kwargs):
+        self.worker = worker_class(*args, name="worker-0", **kwargs)
+
+    def seed(self, seeder):
+        self.seeders.append(seeder)
+
+    def collect(self, collector):
+        # polled once the worker is idle, as the branches of the joins are all done then
+        self.collector = collector
+
+    def run_pending(self):
+        while True:
+            for seeder in self.seeders:
+                seeder.feed(block=False)
+            self.worker.run_until_idle()
+            self.seeders = [seeder for seeder in self.seeders if not seeder.exhausted]
+            if self.collector is not None and self.collector.poll():
+                continue
+            if not self.seeders:
+                break
+
+    def close(self, queue):
+        if self.worker is not None:
+            self.worker.close()
+
+
+class DistributedExecutor(ProcessExecutor):
+    """
+    Hands the tasks out to remote workers through a :py:class:`taswor.process.broker.Broker` listening on ``address``
+    (``"host:port"``). The remote workers are started with ``python -m taswor.worker host:port --authkey ...``
+    on any number of machines, and ``workers`` local worker processes connect to the broker as well.
+
+    The queue of the broker is unbounded. The node functions must be importable by the remote workers, and their
+    ``cache_url`` and ``storage_url`` should point to servers they can all reach. Worker affinity is disabled: the
+    broker only redelivers the tasks it delivered, so the workers enqueue all the tasks they produce.
+    """
+
+    context = ThreadContext
+
+    def __init__(self, workers, address="127.0.0.1:0", authkey=None, log_policy=None):
+        super().__init__(workers, log_policy)
+        self.address = parse_address(address)
+        self.authkey = authkey.encode() if isinstance(authkey, str) else authkey or os.urandom(16)
+        self.broker = None
+
+    def create_queue(self, batch_size, maxsize=0, shared_memory_threshold=None):
+        # the remote workers do not share the memory of the broker
+        return TaskQueue(batch_size, context=self.context)
+
+    def start(self, worker_class, args, kwargs):
+        queue, graph, event_dir, cache_url, storage_url = args
+        kwargs = dict(kwargs, log_policy=kwargs["log_policy"].detached(), affinity=False)
+        config = (worker_class, graph, cache_url, storage_url, queue.batch_size, kwargs)
+        self.broker = Broker(queue, event_dir, config, self.address, self.authkey, self.log_policy.get_logger("Broker"))
+        self.address = self.broker.address
+        self.broker.start()
+
+        self.handles = [
+            multiprocessing.Process(target=run_worker, args=(self.address, self.authkey, "worker-{}".format(i)),
+                                    name="worker-{}".format(i))
+            for i in range(self.workers)]
+        for handle in self.handles:
+            handle.start()
+
+    def close(self, queue):
+        if self.broker is None:
+            return
+        deadline = time.time() + self.grace_period
+        queue.stop(self.broker.worker_count())
+        for handle in self.handles:
+            handle.join(max(0, deadline - time.time()))
+        for handle in self.handles:
+            if handle.is_alive():
+                handle.terminate()
+                handle.join()
+        self.broker.close()
+
+
+class PoolExecutor(ProcessExecutor):
+    """
+    Runs the workers of a workflow in the processes of a :py:class:`taswor.process.pool.WorkerPool`, a thread in each.
+    Closing the workflow stops its workers, not the processes.
+
+    The queue of the workflow is the one of the slot it takes in the pool, which is unbounded and does not pass the
+    arguments through shared memory.
+    """
+
+    def __init__(self, pool, log_policy=None):
+        super().__init__(pool.workers, log_policy)
+        self.pool = pool
+        self.job = None
+
+    def create_queue(self, batch_size, maxsize=0, shared_memory_threshold=None):
+        if maxsize or shared_memory_threshold:
+            raise RuntimeError("The queue size and shared memory threshold are not supported by worker pools")
+        self.job = self.pool.open_job(batch_size)
+        self.log_queue = self.job.log_queue
+        return self.job.queue
+
+    def start(self, worker_class, args, kwargs):
+        self.pool.start_job(self.job, worker_class, args[1:], dict(kwargs, track_inflight=True))
+
+    def seed(self, seeder):
+        thread = threading.Thread(target=seeder.run, name="seeder", daemon=True)
+        self.job.seeders.append((seeder, thread))
+        thread.start()
+
+    def close(self, queue):
+        self.pool.close_job(self.job, self.grace_period)
+
+
+EXECUTORS = {
+    "process": ProcessExecutor,
+    "thread": ThreadExecutor,
+    "inline": InlineExecutor,
+    "distributed": DistributedExecutor,
+}
+
+
+def get_executor(name, workers, **options):
+    """
+    :param options: the options of the executor, e.g. the ``log_policy`` of the workflow, or the ``address`` and
+     ``authkey`` of the distributed executor.
+    """
+    if name not in EXECUTORS:
+        raise RuntimeError("Unknown executor {}".format(name))
+    return EXECUTORS[name](workers, **options)
@@ -0,0 +1,89 @@
+import pickle
+import threading
+
+
+class InflightJournal:
+    """
+    Append-only record of the tasks a worker process holds: the batches it takes from the queue (or keeps for itself
+    when the queue is full), how many tasks it marks as done and whether it holds one of them as outstanding until its
+    metrics are written (see :py:class:`taswor.process.worker.Worker`). Whenever the worker has no task in progress, the
+    records before are obsolete, and the journal is truncated once it grows beyond :py:attr:`COMPACT_SIZE` bytes.
+
+    If the worker dies, :py:func:`InflightJournal.recover()` returns the batches it was still holding, so that they can
+    be enqueued again.
+    """
+
+    COMPACT_SIZE = 1 << 20
+
+    def __init__(self, file):
+        """
+        :param file: the binary file the records are appended to, see :py:func:`taswor.events.EventLog.open()`. The
+         records are flushed right away, so that they survive the worker process.
+        """
+        self.file = file
+        self.in_progress = 0
+        self.held = False
+        # the batches may be taken from another thread than the one marking the tasks as done
+        self.lock = threading.Lock()
+
+    def take(self, batch, payload=None):
+        """
+        :param payload: the batch as it was received from the queue, if it was. Otherwise the batch is pickled.
+        """
+        received = payload is not None
+        if not received:
+            payload = pickle.dumps(batch, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.in_progress += len(batch)
+            pickle.dump(("take", payload, received), self.file, pickle.HIGHEST_PROTOCOL)
+            self.file.flush()
+
+    def done(self, count, held=None):
+        """
+        Records that ``count`` tasks are done. Must be called before they are marked as done in the queue.
+
+        :param held: whether the worker holds one of the tasks it marked as done as outstanding from now on, if it
+         changed.
+        """
+        with self.lock:
+            self.in_progress -= count
+            if held is not None:
+                self.held = held
+            idle = self.in_progress <= 0
+            pickle.dump(("done", count, idle, self.held), self.file, pickle.HIGHEST_PROTOCOL)
+            if idle and self.file.tell() > self.COMPACT_SIZE:
+                self.file.truncate(0)
+                if self.held:
+                    pickle.dump(("done", 0, True, True), self.file, pickle.HIGHEST_PROTOCOL)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    @staticmethod
+    def recover(path):
+        """
+        :return: a tuple ``(batches, done)``: the batches held by the worker when it died, as ``(payload, received)``
+         tuples, and how many of their tasks it already marked as done in the queue: one less than it recorded if it
+         held one as outstanding, possibly -1. See :py:func:`taswor.process.task_queue.TaskQueue.recover()`.
+        """
+        batches = []
+        done = 0
+        held = False
+        try:
+            with open(path, "rb") as journal:
+                while True:
+                    record = pickle.load(journal)
+                    if record[0] == "take":
+                        batches.append(record[1:])
+                    else:
+                        done += record[1]
+                        held = record[3]
+                        if record[2]:
+                            # nothing was in progress anymore
+                            batches = []
+                            done = 0
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # the last record may have been written partially
+            pass
+        return batches, done - held
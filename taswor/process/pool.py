@@ -0,0 +1,314 @@
+import os
+import copy
+import queue
+import pickle
+import threading
+import importlib
+import itertools
+import multiprocessing
+from multiprocessing.connection import wait
+
+from taswor.events import EventLog
+from taswor.process.executor import PoolExecutor
+from taswor.process.inflight import InflightJournal
+from taswor.process.task_queue import TaskQueue
+from taswor.process.worker import worker_run
+from taswor.util import LogPolicy
+
+
+class PoolJob:
+    """
+    A workflow run by a :py:class:`WorkerPool`: the slot it took, the processes running a worker for it and the threads
+    seeding its queue, which must all be done before the slot is given to another workflow.
+    """
+
+    def __init__(self, job_id, slot, queue, log_queue):
+        self.id = job_id
+        self.slot = slot
+        self.queue = queue
+        self.log_queue = log_queue
+        self.event_dir = None
+        self.payload = None
+        self.members = set()
+        self.seeders = []
+        self.closing = False
+        self.released = threading.Event()
+
+
+class WorkerPool:
+    """
+    Long-lived worker processes shared by workflows (see the ``pool`` parameter of
+    :py:class:`taswor.workflow.Workflow`), so that the processes are started, and the modules of the nodes imported,
+    once for all of them rather than for every workflow. The workflows can run one after the other or at the same
+    time, up to ``max_workflows`` of them.
+
+    Every workflow runs in all the processes of the pool, a worker thread in each, and is isolated from the others: it
+    has an event log, metrics and results of its own, and its own queue and outstanding count. The queues, and the
+    queues the workers log to, are created with the pool and inherited by its processes, in ``max_workflows`` slots: a
+    workflow takes a free slot when it is created and gives it back once all its workers and seeders stopped. The
+    batches carry the id of the workflow (see :py:class:`taswor.process.task_queue.TaskQueue`), so the tasks left by a
+    workflow closed before it completed never reach the next one.
+
+    The graph of a workflow is pickled to the processes, so the node functions must be importable by them: defined at
+    the top level of a module, or of the main script before the pool is created. ``preload`` names modules every
+    process imports when it starts, and ``initializer`` is called with ``initargs`` after, e.g. to load heavy libraries
+    or models once. As the workers run in threads, the ``timeout`` of the nodes is only checked once the calls return
+    (see :py:class:`taswor.node.Node`).
+
+    Like with the process executor, a process that dies is replaced and the tasks it held for every workflow are
+    enqueued again, at most :py:attr:`max_restarts` times.
+
+    The pool and its processes log with ``log_policy`` (see :py:class:`taswor.util.LogPolicy`), the workers with the
+    policy of their workflow.
+    """
+
+    max_restarts = 100
+
+    def __init__(self, workers=os.cpu_count(), max_workflows=8, preload=(), initializer=None, initargs=(),
+                 log_policy=None):
+        self.workers = workers
+        self.log_policy = log_policy or LogPolicy()
+        self.preload = tuple(preload)
+        self.initializer = initializer
+        self.initargs = tuple(initargs)
+        self.slots = [(TaskQueue(), multiprocessing.Queue()) for _ in range(max_workflows)]
+        self.free = list(range(max_workflows))
+        self.done = multiprocessing.Queue()
+        self.jobs = {}
+        self.job_counter = itertools.count(1)
+        self.lock = threading.Lock()
+        self.closed = False
+        self.restarts = 0
+        self.logger = self.log_policy.get_logger("Pool")
+        self.inboxes = {}
+        self.handles = [self.start_process("worker-{}".format(i)) for i in range(workers)]
+        threading.Thread(target=self.supervise, name="pool-supervisor", daemon=True).start()
+
+    def start_process(self, name):
+        inbox = multiprocessing.Queue()
+        handle = multiprocessing.Process(target=pool_worker_run, name=name,
+                                         args=(self.slots, inbox, self.done, self.preload, self.initializer,
+                                               self.initargs, self.log_policy))
+        handle.start()
+        self.inboxes[name] = inbox
+        return handle
+
+    def executor(self, log_policy=None):
+        """
+        :param log_policy: the :py:class:`taswor.util.LogPolicy` of the workflow.
+        :return: the executor of a workflow run by the pool.
+        """
+        if self.closed:
+            raise RuntimeError("The worker pool is closed")
+        return PoolExecutor(self, log_policy)
+
+    def open_job(self, batch_size):
+        """
+        Takes a free slot for a new workflow.
+
+        :return: a :py:class:`PoolJob`, whose queue is a view of the queue of the slot, with the id of the job as its
+         generation.
+        """
+        with self.lock:
+            if not self.free:
+                raise RuntimeError("The {} workflows of the worker pool are running".format(len(self.slots)))
+            slot = self.free.pop(0)
+            job_id = next(self.job_counter)
+        # the view shares the underlying queue and counter of the slot
+        job_queue = copy.copy(self.slots[slot][0])
+        job_queue.batch_size = batch_size
+        job_queue.generation = job_id
+        with job_queue.condition:
+            job_queue.outstanding.value = 0
+        return PoolJob(job_id, slot, job_queue, self.slots[slot][1])
+
+    def start_job(self, job, worker_class, args, kwargs):
+        """
+        Starts a worker for the job in every process.
+
+        :param args: the arguments of the workers, but their queue.
+        """
+        job.event_dir = args[1]
+        # the processes log to the queue of the slot
+        log_policy = copy.copy(kwargs["log_policy"])
+        log_policy.queue = None
+        job.payload = pickle.dumps((worker_class, args, dict(kwargs, log_policy=log_policy)), pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            for handle in self.handles:
+                self.add_member(job, handle.name)
+            self.jobs[job.id] = job
+
+    def add_member(self, job, name):
+        self.inboxes[name].put(("start", job.id, job.slot, job.queue.batch_size, job.payload))
+        job.members.add(name)
+
+    def close_job(self, job, timeout=None):
+        """
+        Stops the workers of a job. Its slot is given back once they all stopped, even if they are still busy when
+        ``timeout`` expires.
+
+        :return: True if the slot was given back.
+        """
+        for seeder, _ in job.seeders:
+            seeder.stop()
+        with self.lock:
+            job.closing = True
+            for name in job.members:
+                self.inboxes[name].put(("stop", job.id))
+            # wakes the workers waiting for tasks
+            job.queue.stop(len(job.members))
+            if not job.members:
+                self.release(job)
+        if not job.released.wait(timeout):
+            self.logger.warning("Workers of workflow %s are still busy, its slot is given back once they stop", job.id)
+            return False
+        return True
+
+    def release(self, job):
+        """
+        Gives the slot of a job back, once its workers stopped. Called with the lock held.
+        """
+        self.jobs.pop(job.id, None)
+        # wakes the seeders waiting for the outstanding tasks to drop
+        with job.queue.condition:
+            job.queue.outstanding.value = 0
+            job.queue.condition.notify_all()
+        for _, thread in job.seeders:
+            thread.join()
+        self.free.append(job.slot)
+        job.released.set()
+
+    def supervise(self):
+        while True:
+            with self.lock:
+                sentinels = {handle.sentinel: handle for handle in self.handles}
+            if not sentinels:
+                return
+            ready = wait(list(sentinels) + [self.done._reader])
+            for sentinel in ready:
+                handle = sentinels.get(sentinel)
+                if handle is None:
+                    continue
+                handle.join()
+                with self.lock:
+                    if self.closed:
+                        return
+                    self.replace(handle)
+            while True:
+                try:
+                    job_id, name = self.done.get(False)
+                except queue.Empty:
+                    break
+                with self.lock:
+                    job = self.jobs.get(job_id)
+                    if job is not None and name in job.members:
+                        job.members.discard(name)
+                        if job.closing and not job.members:
+                            self.release(job)
+
+    def replace(self, handle):
+        """
+        Enqueues again the tasks a dead process held for every job, and starts a process in its place. Called with the
+        lock held.
+        """
+        self.handles.remove(handle)
+        del self.inboxes[handle.name]
+        # the process may have died waiting for a batch of any of the workflows, with the reader lock of its queue held
+        for job_queue, _ in self.slots:
+            job_queue.release_reader(handle.pid)
+        for job in list(self.jobs.values()):
+            if handle.name not in job.members:
+                continue
+            job.members.discard(handle.name)
+            batches, done = InflightJournal.recover(EventLog(job.event_dir).sink_path(handle.name, "inflight"))
+            count = job.queue.recover(batches, done)
+            self.logger.warning("Worker %s died with exit code %s, delivered its %s unfinished tasks of workflow %s "
+                                "again", handle.name, handle.exitcode, count, job.id)
+            if job.closing and not job.members:
+                self.release(job)
+        if self.restarts >= self.max_restarts:
+            self.logger.error("Worker %s not replaced, %s workers were already restarted", handle.name, self.restarts)
+            return
+        self.restarts += 1
+        name = "{}-restart-{}".format(handle.name.split("-restart-")[0], self.restarts)
+        self.handles.append(self.start_process(name))
+        for job in self.jobs.values():
+            if not job.closing:
+                self.add_member(job, name)
+
+    def close(self, timeout=1):
+        """
+        Stops the processes of the pool, once the workers of the workflows still running are done, or after
+        ``timeout`` seconds. The workflows should be closed first.
+        """
+        with self.lock:
+            self.closed = True
+            jobs = list(self.jobs.values())
+        if jobs:
+            self.logger.warning("Closing the worker pool while %s workflows are running", len(jobs))
+            for job in jobs:
+                if not job.closing:
+                    self.close_job(job, timeout)
+        with self.lock:
+            handles = list(self.handles)
+        for handle in handles:
+            self.inboxes[handle.name].put(None)
+        # the tasks and records left in the queues are dropped
+        for job_queue, log_queue in self.slots:
+            job_queue.queue.cancel_join_thread()
+            log_queue.cancel_join_thread()
+        for handle in handles:
+            handle.join(timeout)
+        for handle in handles:
+            if handle.is_alive():
+                handle.terminate()
+                handle.join()
+
+
+def pool_worker_run(slots, inbox, done, preload, initializer, initargs, log_policy):
+    """
+    The main loop of the processes of a :py:class:`WorkerPool`: starts a worker thread for every job received in
+    ``inbox`` and cancels its queue when the job is closed, until it receives ``None``.
+    """
+    name = multiprocessing.current_process().name
+    logger = log_policy.get_logger("Pool {}".format(name))
+    for module in preload:
+        importlib.import_module(module)
+    if initializer is not None:
+        initializer(*initargs)
+    queues = {}
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        if message[0] == "stop":
+            job_queue = queues.pop(message[1], None)
+            if job_queue is not None:
+                job_queue.cancelled = True
+            continue
+        _, job_id, slot, batch_size, payload = message
+        try:
+            worker_class, args, kwargs = pickle.loads(payload)
+        except Exception as e:
+            logger.error("Could not start a worker for workflow %s: %s", job_id, e)
+            done.put((job_id, name))
+            continue
+        job_queue, log_queue = slots[slot]
+        job_queue = copy.copy(job_queue)
+        job_queue.batch_size = batch_size
+        job_queue.generation = job_id
+        queues[job_id] = job_queue
+        kwargs["log_policy"].queue = log_queue
+        threading.Thread(target=run_job, name="{}-{}".format(name, job_id), daemon=True,
+                         args=(done, job_id, worker_class, (job_queue,) + args, dict(kwargs, name=name))).start()
+    for job_queue in queues.values():
+        job_queue.cancelled = True
+    for job_queue, log_queue in slots:
+        job_queue.queue.cancel_join_thread()
+
+
+def run_job(done, job_id, worker_class, args, kwargs):
+    try:
+        worker_run(worker_class, *args, **kwargs)
+    finally:
+        done.put((job_id, kwargs["name"]))
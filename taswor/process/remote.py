@@ -0,0 +1,153 @@
+import os
+import time
+import pickle
+import socket
+import tempfile
+import threading
+from multiprocessing.connection import Client
+
+from taswor.events import EventLog
+
+
+class RemoteTaskQueue:
+    """
+    Client side of the :py:class:`taswor.process.broker.Broker`, with the interface of
+    :py:class:`taswor.process.task_queue.TaskQueue` the workers use.
+
+    It counts the tasks in progress, and once all the delivered tasks are done it acknowledges them to the broker, with
+    the number of the last batch received.
+    """
+
+    def __init__(self, address, authkey, name):
+        self.name = name
+        self.tasks = Client(address, authkey=authkey)
+        self.tasks.send(("tasks", name))
+        self.config = self.tasks.recv()
+        self.control = Client(address, authkey=authkey)
+        self.control.send(("control", name))
+        self.batch_size = self.config[4]
+        self.lock = threading.Lock()
+        self.in_progress = 0
+        self.received = 0
+
+    def get(self, block=True, timeout=None, metrics=None, journal=None):
+        """
+        See :py:func:`taswor.process.task_queue.TaskQueue.get()`. A lost connection to the broker stops the worker. The
+        ``journal`` is ignored: the broker itself keeps track of the batches in progress.
+        """
+        try:
+            self.tasks.send((block, timeout))
+            data = self.tasks.recv_bytes()
+        except (EOFError, OSError):
+            return None
+        start_time = time.perf_counter()
+        item = pickle.loads(data)
+        if not item:
+            return item
+        sequence, enqueued_at, batch = item
+        with self.lock:
+            self.in_progress += len(batch)
+            self.received = sequence
+        if metrics is not None:
+            metrics.record_serialization(batch, time.perf_counter() - start_time)
+            metrics.record_queue_wait(batch, max(0.0, time.time() - enqueued_at))
+        return batch
+
+    def put_many(self, tasks, block=True, metrics=None):
+        """
+        Sends the tasks to the broker. Its queue is unbounded, so all of them are enqueued.
+        """
+        if not tasks:
+            return []
+        start_time = time.perf_counter()
+        data = pickle.dumps(("put", tasks), pickle.HIGHEST_PROTOCOL)
+        if metrics is not None:
+            metrics.record_serialization(tasks, time.perf_counter() - start_time)
+        self.send_bytes(data)
+        return []
+
+    def reserve(self, count=1):
+        """
+        Counts ``count`` more outstanding tasks in the queue of the broker, e.g. for a join in progress.
+        """
+        self.send(("reserve", count))
+
+    def task_done(self, count=1):
+        with self.lock:
+            self.in_progress -= count
+            acknowledged = self.received if self.in_progress <= 0 else None
+        self.send(("done", count, acknowledged))
+
+    def empty(self):
+        return False
+
+    def send(self, message):
+        self.send_bytes(pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+
+    def send_bytes(self, data):
+        with self.lock:
+            self.control.send_bytes(data)
+
+    def close(self):
+        try:
+            self.send(("close",))
+        except OSError:
+            pass
+        self.control.close()
+        self.tasks.close()
+
+
+class RemoteFile:
+    """
+    Append-only file of the broker's event directory. The data written is sent to the broker when flushed.
+    """
+
+    def __init__(self, queue, filename):
+        self.queue = queue
+        self.filename = filename
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self.queue.send(("append", self.filename, bytes(self.buffer)))
+            self.buffer = bytearray()
+
+    def close(self):
+        self.flush()
+
+
+class RemoteEventLog(EventLog):
+    """
+    Event log of a remote worker: the events and metrics files are the ones of the broker. The profiles are written to
+    a local directory.
+    """
+
+    def __init__(self, queue):
+        super().__init__(tempfile.mkdtemp(prefix="taswor-remote-"))
+        self.queue = queue
+
+    def open(self, name, extension="events"):
+        return RemoteFile(self.queue, "{}.{}".format(name, extension))
+
+
+def run_worker(address, authkey, name=None):
+    """
+    Connects to the broker at ``address`` and processes its tasks until the workflow is closed.
+    """
+    name = name or "{}-{}".format(socket.gethostname(), os.getpid())
+    queue = RemoteTaskQueue(address, authkey, name)
+    worker_class, graph, cache_url, storage_url, _, worker_kwargs = queue.config
+    worker = worker_class(queue, graph, RemoteEventLog(queue), cache_url, storage_url, name=name, **worker_kwargs)
+    try:
+        worker.start()
+    finally:
+        queue.close()
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
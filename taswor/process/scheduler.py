@@ -0,0 +1,67 @@
+from collections import deque
+
+
+class LocalQueue:
+    """
+    The tasks held by a worker, in the order it runs them: by decreasing ``priority`` of their node (see
+    :py:class:`taswor.node.Node`), then in arrival order (breadth-first) or, if ``depth_first``, the last task first.
+
+    There is one deque per priority level, so pushing and popping tasks costs the same as with a single deque. The
+    worker runs the tasks from the hot end of the queue and shares the ones at the cold end (the lowest priority, and
+    the oldest tasks when depth-first, which are the roots of the largest subtrees) with the other workers.
+    """
+
+    def __init__(self, graph, depth_first=False):
+        self.priorities = {node.name: node.priority for node in graph if node.priority}
+        self.depth_first = depth_first
+        self.levels = {0: deque()}
+        self.order = [0]
+        self.size = 0
+
+    def extend(self, tasks):
+        if not self.priorities:
+            self.levels[0].extend(tasks)
+        else:
+            for task in tasks:
+                self.level(self.priorities.get(task[0], 0)).append(task)
+        self.size += len(tasks)
+
+    def level(self, priority):
+        level = self.levels.get(priority)
+        if level is None:
+            level = self.levels[priority] = deque()
+            self.order = sorted(self.levels, reverse=True)
+        return level
+
+    def pop_many(self, count):
+        """
+        Removes and returns up to ``count`` tasks from the hot end of the queue.
+        """
+        tasks = []
+        for priority in self.order:
+            level = self.levels[priority]
+            pop = level.pop if self.depth_first else level.popleft
+            while level and len(tasks) < count:
+                tasks.append(pop())
+            if len(tasks) >= count:
+                break
+        self.size -= len(tasks)
+        return tasks
+
+    def share(self, count):
+        """
+        Removes and returns up to ``count`` tasks from the cold end of the queue, to be run by other workers.
+        """
+        tasks = []
+        for priority in reversed(self.order):
+            level = self.levels[priority]
+            pop = level.popleft if self.depth_first else level.pop
+            while level and len(tasks) < count:
+                tasks.append(pop())
+            if len(tasks) >= count:
+                break
+        self.size -= len(tasks)
+        return tasks
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,75 @@
+import itertools
+
+from taswor.util import get_logger
+
+
+class Seeder:
+    """
+    Streams the tasks of the start nodes into the queue. The ``init_generator`` of the start nodes are consumed lazily:
+    new tasks are only pulled from them while the number of outstanding tasks is below the high-water mark, so large
+    or infinite generators never flood the queue.
+
+    While seeding, the seeder holds an outstanding task of its own, so the workflow can not complete before the
+    generators are exhausted.
+    """
+
+    def __init__(self, queue, start_nodes, high_water_mark, logger=None, tasks=None):
+        """
+        :param tasks: optional iterable of the tasks to seed instead of the ones of the start nodes, e.g. the pending
+         tasks of a checkpoint.
+        """
+        self.queue = queue
+        self.high_water_mark = high_water_mark
+        self.tasks = iter(tasks) if tasks is not None else self.generate(start_nodes)
+        self.backlog = []
+        self.exhausted = False
+        self.logger = logger or get_logger("Seeder")
+        self.queue.reserve()
+
+    @staticmethod
+    def generate(start_nodes):
+        for node in start_nodes:
+            if not node.init_generator:
+                yield (node.name, (), {})
+            else:
+                for args, kwargs in node.init_generator:
+                    yield (node.name, args, kwargs)
+
+    def feed(self, block=True):
+        """
+        Enqueues start tasks until the high-water mark is reached.
+
+        :param block: if False, stops as soon as the queue is full instead of waiting for free space.
+        :return: False once the generators are exhausted, True otherwise.
+        """
+        while not self.exhausted and self.queue.outstanding.value < self.high_water_mark:
+            tasks, self.backlog = self.backlog, []
+            if not tasks:
+                try:
+                    tasks = list(itertools.islice(self.tasks, self.queue.batch_size))
+                except Exception as e:
+                    self.logger.error("Init generator raised an exception: %s", e)
+            if not tasks:
+                self.exhausted = True
+                self.queue.task_done()
+                break
+            self.backlog = self.queue.put_many(tasks, block)
+            if self.backlog:
+                # the queue is full, the tasks will be enqueued by the next call
+                self.queue.task_done(len(self.backlog))
+                break
+        return not self.exhausted
+
+    def stop(self):
+        """
+        Stops feeding the queue, e.g. when the workflow is closed before the generators are exhausted. A running
+        :py:func:`Seeder.run()` returns once the outstanding count drops below the high-water mark.
+        """
+        self.exhausted = True
+
+    def run(self):
+        """
+        Feeds the queue until the generators are exhausted, waiting for the workers to make room in between.
+        """
+        while self.feed():
+            self.queue.wait_below(self.high_water_mark)
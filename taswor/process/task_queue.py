@@ -0,0 +1,306 @@
+import os
+import time
+import queue
+import pickle
+import threading
+import multiprocessing
+from types import SimpleNamespace
+
+
+class ThreadContext:
+    """
+    Provides the same primitives as the ``multiprocessing`` module, for a :py:class:`TaskQueue` shared by threads of a
+    single process.
+    """
+
+    Queue = queue.Queue
+    Condition = threading.Condition
+
+    @staticmethod
+    def Value(typecode, value, lock=True):
+        return SimpleNamespace(value=value)
+
+
+class ReaderLock:
+    """
+    The lock the readers of a ``multiprocessing`` queue hold while they wait for an item, which records the process
+    holding it, so that the lock can be released if that process dies (see :py:func:`TaskQueue.release_reader()`).
+    """
+
+    def __init__(self):
+        self.lock = multiprocessing.Lock()
+        self.owner = multiprocessing.Value("i", 0, lock=False)
+
+    def acquire(self, block=True, timeout=None):
+        if not self.lock.acquire(block, timeout):
+            return False
+        self.owner.value = os.getpid()
+        return True
+
+    def release(self):
+        self.owner.value = 0
+        self.lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class TaskQueue:
+    """
+    The queue shared by the workflow and its workers. Besides the tasks themselves, it keeps an exact count of the
+    outstanding tasks: the count is incremented when a task is enqueued and decremented by the worker once the task
+    and the enqueueing of all its children are done, so it only reaches zero when the whole workflow has completed.
+
+    Tasks travel through the underlying queue in batches of up to ``batch_size`` tasks, so a worker takes a whole batch
+    in a single round-trip. The queue has its own internal locking, so the workers can take batches concurrently.
+
+    The ``context`` provides the queue and synchronisation primitives: the ``multiprocessing`` module for worker
+    processes or :py:class:`ThreadContext` for worker threads. The reader lock of a ``multiprocessing`` queue is a
+    :py:class:`ReaderLock`, which the supervisor of the worker processes releases if a worker dies while holding it.
+
+    If ``maxsize`` is given, the queue holds at most that many batches. Producers then either block or, if they are
+    workers, keep the tasks that did not fit and process them themselves.
+
+    Every batch is enqueued with a timestamp, so the time tasks wait in the queue can be measured. With the
+    ``multiprocessing`` context the batches are pickled by the queue itself rather than by the feeder thread of the
+    underlying queue, which is where the serialization time is measured. A ``transport`` such as
+    :py:class:`taswor.process.transport.SharedMemoryTransport` can pickle them instead.
+
+    The queues of a :py:class:`taswor.process.pool.WorkerPool` are used by one workflow after the other. Their
+    ``generation`` is then set, per workflow: the batches and stop markers carry it, and the ones of another generation,
+    left by a workflow closed before it completed, are dropped when they are taken. Once the workflow is closed, its
+    queue objects are ``cancelled``: their workers stop at their next get, instead of running the tasks enqueued before
+    the stop markers.
+    """
+
+    def __init__(self, batch_size=1, context=multiprocessing, maxsize=0, transport=None):
+        self.batch_size = batch_size
+        self.serialize = context is multiprocessing
+        self.transport = transport if self.serialize else None
+        self.queue = context.Queue(maxsize)
+        if self.serialize:
+            self.queue._rlock = ReaderLock()
+        self.condition = context.Condition()
+        self.outstanding = context.Value("q", 0, lock=False)
+        self.generation = None
+        self.cancelled = False
+
+    def put(self, task):
+        self.put_many([task])
+
+    def put_many(self, tasks, block=True, metrics=None):
+        """
+        Enqueues the tasks in batches.
+
+        :param block: if False and the queue is full, the tasks that did not fit are returned instead of waiting for
+         free space. They are counted as outstanding anyway, so the caller is responsible for processing them.
+        :param metrics: optional :py:class:`taswor.metrics.MetricsRecorder` the serialization time is recorded to.
+        :return: the list of tasks that were not enqueued.
+        """
+        if not tasks:
+            return []
+        self.reserve(len(tasks))
+        for i in range(0, len(tasks), self.batch_size):
+            batch = tasks[i:i + self.batch_size]
+            payload = batch
+            if self.serialize:
+                start_time = time.perf_counter()
+                payload = self.dumps(batch)
+                if metrics is not None:
+                    metrics.record_serialization(batch, time.perf_counter() - start_time)
+            try:
+                self.queue.put(self.item(payload), block)
+            except queue.Full:
+                return tasks[i:]
+        return []
+
+    def redeliver(self, tasks, done=0):
+        """
+        Enqueues again the tasks taken by a worker that died before completing them. They are still counted as
+        outstanding, except for the ``done`` of them the worker already marked as done, which are counted again. If
+        ``done`` is negative, the worker held as many completed tasks as outstanding, which are marked as done.
+        """
+        if done < 0:
+            self.task_done(-done)
+        else:
+            self.reserve(done)
+        for i in range(0, len(tasks), self.batch_size):
+            batch = tasks[i:i + self.batch_size]
+            self.queue.put(self.item(self.dumps(batch) if self.serialize else batch))
+
+    def recover(self, batches, done=0):
+        """
+        Enqueues again the batches held by a worker process that died, see
+        :py:func:`taswor.process.inflight.InflightJournal.recover()`. The batches it received are enqueued as they
+        were, without their tasks whose shared memory was released, as they were completed.
+
+        :return: the number of tasks enqueued again.
+        """
+        tasks = []
+        payloads = []
+        count = 0
+        for payload, received in batches:
+            if not received or self.transport is None:
+                tasks.extend(pickle.loads(payload))
+                continue
+            entries = pickle.loads(payload)
+            kept = [entry for entry in entries if self.transport.available(entry[0])]
+            # the completed tasks were marked as done
+            done -= len(entries) - len(kept)
+            if kept:
+                count += len(kept)
+                payloads.append(pickle.dumps(kept, pickle.HIGHEST_PROTOCOL))
+        # the tasks are counted again before any of them can be taken
+        self.redeliver(tasks, done)
+        for payload in payloads:
+            self.queue.put(self.item(payload))
+        return count + len(tasks)
+
+    def item(self, payload):
+        """
+        :return: the item a batch is stored as in the underlying queue: ``(enqueued_at, batch)``, followed by the
+         generation of the queue if it has one.
+        """
+        if self.generation is None:
+            return time.time(), payload
+        return time.time(), payload, self.generation
+
+    def dumps(self, batch):
+        if self.transport is not None:
+            return self.transport.dumps(batch)
+        return pickle.dumps(batch, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, payload):
+        if self.transport is not None:
+            return self.transport.loads(payload)
+        return pickle.loads(payload)
+
+    def empty(self):
+        """
+        :return: True if there is no batch in the queue. As with any shared queue, the result is only a hint.
+        """
+        return self.queue.empty()
+
+    def reserve(self, count=1):
+        """
+        Counts ``count`` more outstanding tasks, without enqueueing anything. They must be released with
+        :py:func:`TaskQueue.task_done()`.
+        """
+        with self.condition:
+            self.outstanding.value += count
+
+    def get_item(self, block=True, timeout=None):
+        """
+        Like :py:func:`TaskQueue.get()`, but returns the batch with the time it was enqueued, as a tuple
+        ``(enqueued_at, batch)``, and records no metrics. The batch is returned as it is stored, so pickled with the
+        ``multiprocessing`` context.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.cancelled:
+            item = self.receive(block, None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if not item or self.generation is None:
+                return item
+            if item[2] == self.generation:
+                # the stop markers carry no batch
+                return item[:2] if item[1] is not None else None
+            # left by the workflow the queue was used by before
+        return None
+
+    def receive(self, block, timeout):
+        """
+        Takes the next item of the underlying queue, see :py:func:`TaskQueue.get_item()`.
+        """
+        try:
+            return self.queue.get(block, timeout)
+        except queue.Empty:
+            return []
+
+    def release_reader(self, pid):
+        """
+        Releases the reader lock of the underlying queue if it is held by the process ``pid``, which died. A process
+        blocked in :py:func:`TaskQueue.get()` holds the lock while it waits for a batch, so the other workers would
+        wait for it forever.
+
+        :return: True if the lock was released.
+        """
+        reader_lock = getattr(self.queue, "_rlock", None)
+        if not isinstance(reader_lock, ReaderLock) or reader_lock.owner.value != pid:
+            return False
+        reader_lock.release()
+        return True
+
+    def get(self, block=True, timeout=None, metrics=None, journal=None):
+        """
+        Returns the next batch of tasks as a list. Blocks until a batch is available, unless ``block`` is ``False`` or
+        the ``timeout`` expires.
+
+        :param metrics: optional :py:class:`taswor.metrics.MetricsRecorder` the queue wait and serialization times are
+         recorded to.
+        :param journal: optional :py:class:`taswor.process.inflight.InflightJournal` the batch is recorded to.
+        :return: the batch, an empty list if no batch was available or ``None`` if the queue was stopped.
+        """
+        item = self.get_item(block, timeout)
+        if not item:
+            return item
+        enqueued_at, batch = item
+        payload = None
+        if self.serialize:
+            start_time = time.perf_counter()
+            payload, batch = batch, self.loads(batch)
+            if metrics is not None:
+                metrics.record_serialization(batch, time.perf_counter() - start_time)
+        if journal is not None:
+            # the batch is recorded as it was received, without pickling it again
+            journal.take(batch, payload)
+        if metrics is not None:
+            metrics.record_queue_wait(batch, max(0.0, time.time() - enqueued_at))
+        return batch
+
+    def stop(self, count=1, timeout=None):
+        """
+        Makes ``count`` of the workers blocked in :py:func:`TaskQueue.get()` return ``None``.
+
+        :param timeout: if the queue is bounded, the maximum number of seconds to wait for free space. The stop markers
+         that do not fit are dropped.
+        """
+        marker = None if self.generation is None else (None, None, self.generation)
+        for _ in range(count):
+            try:
+                self.queue.put(marker, timeout=timeout)
+            except queue.Full:
+                break
+
+    def task_done(self, count=1):
+        with self.condition:
+            self.outstanding.value -= count
+            self.condition.notify_all()
+        if self.transport is not None:
+            # the workers record the tasks as done in their journal first
+            self.transport.release()
+
+    def close(self):
+        """
+        Removes the shared memory left by the tasks that were never completed, if any.
+        """
+        if self.transport is not None:
+            self.transport.unlink_all()
+
+    def wait_below(self, count):
+        """
+        Blocks until there are less than ``count`` outstanding tasks.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.outstanding.value < count)
+
+    def join(self, timeout=None):
+        """
+        Blocks until there are no more outstanding tasks.
+
+        :param timeout: maximum number of seconds to wait. ``None`` means waiting forever.
+        :return: ``True`` if all the tasks were processed, ``False`` if the timeout expired first.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.outstanding.value <= 0, timeout)
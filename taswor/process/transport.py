@@ -0,0 +1,189 @@
+import io
+import os
+import glob
+import time
+import pickle
+import itertools
+import threading
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+
+class SharedMemoryTransport:
+    """
+    Pickles the batches of a :py:class:`taswor.process.task_queue.TaskQueue` with their large arguments placed in
+    shared memory: the ``bytes``, ``bytearray`` and out-of-band buffers of pickle protocol 5 (NumPy arrays, for one)
+    of ``threshold`` bytes or more. Every buffer goes to a segment of its own, passed by name, so it is
+    neither copied through the queue nor written to the in-flight journal of the worker. NumPy arrays are rebuilt over
+    the segment itself, without a copy; ``bytes`` and ``bytearray`` are copied out of it.
+
+    Every task is pickled apart and owns its segments, which the worker that takes the task removes once the task is
+    done and nothing references them anymore (see :py:func:`SharedMemoryTransport.release()`). The segments of a
+    worker that dies are left to the tasks it did not complete, which are delivered again as they were received.
+
+    The segment names start with a prefix of the workflow, so that the ones left behind can be removed by
+    :py:func:`SharedMemoryTransport.unlink_all()`. Only POSIX shared memory, which outlives the processes that
+    created it, is supported.
+    """
+
+    RELEASE_INTERVAL = 0.05
+
+    SHM_DIRECTORY = "/dev/shm"
+
+    def __init__(self, threshold=1 << 20):
+        if os.name != "posix":
+            raise RuntimeError("Shared memory arguments are not supported on {}".format(os.name))
+        self.threshold = threshold
+        self.prefix = "tw{}".format(os.urandom(4).hex())
+        self.counter = itertools.count()
+        self.received = []
+        self.lock = threading.Lock()
+        self.released_at = 0
+        # the segments are tracked until they are unlinked, by any process: the workers must share the tracker of the
+        # workflow rather than start their own
+        resource_tracker.ensure_running()
+
+    def dumps(self, batch):
+        """
+        :return: the batch pickled as a list of ``(segment_names, task_data)`` tuples.
+        """
+        entries = []
+        for task in batch:
+            data = io.BytesIO()
+            pickler = _SharingPickler(data, self)
+            pickler.dump(task)
+            entries.append((pickler.segments, data.getvalue()))
+        return pickle.dumps(entries, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, payload):
+        """
+        Unpickles a batch received by this process. Its segments are kept until
+        :py:func:`SharedMemoryTransport.release()` finds them unused.
+        """
+        batch = []
+        for names, data in pickle.loads(payload):
+            unpickler = _SharingUnpickler(io.BytesIO(data))
+            batch.append(unpickler.load())
+            if unpickler.segments:
+                with self.lock:
+                    self.received.append(unpickler.segments)
+        return batch
+
+    def share(self, obj):
+        """
+        Copies a large buffer to a new segment.
+
+        :return: the persistent id of the buffer, or ``None`` if it is pickled in band.
+        """
+        if isinstance(obj, pickle.PickleBuffer):
+            kind = "buffer"
+            try:
+                data = obj.raw()
+            except BufferError:
+                # not contiguous
+                return None
+        elif type(obj) in (bytes, bytearray):
+            kind = type(obj).__name__
+            data = memoryview(obj)
+        else:
+            return None
+        size = data.nbytes
+        if size < self.threshold:
+            return None
+        name = "{}_{}_{}".format(self.prefix, os.getpid(), next(self.counter))
+        segment = SharedMemory(name, create=True, size=size)
+        segment.buf[:size] = data
+        segment.close()
+        return kind, name, size, data.readonly
+
+    def release(self, force=False):
+        """
+        Unlinks the segments of the tasks received by this process that are done: the ones no object references
+        anymore, since a task keeps its arguments until it is done. Called every time tasks are marked as done, but
+        the segments are only looked at every :py:attr:`RELEASE_INTERVAL` seconds.
+        """
+        if not self.received or (not force and time.monotonic() - self.released_at < self.RELEASE_INTERVAL):
+            return
+        self.released_at = time.monotonic()
+        with self.lock:
+            received, self.received = self.received, []
+        kept = []
+        for segments in received:
+            if all(_close(segment) for segment in segments):
+                for segment in segments:
+                    segment.unlink()
+            else:
+                kept.append(segments)
+        with self.lock:
+            self.received[:0] = kept
+
+    def available(self, names):
+        """
+        :return: True if all the segments exist, so the task owning them was not completed.
+        """
+        for name in names:
+            try:
+                SharedMemory(name).close()
+            except FileNotFoundError:
+                return False
+        return True
+
+    def unlink_all(self):
+        """
+        Removes the segments of the workflow that are left, owned by tasks that were never completed.
+        """
+        for path in glob.glob(os.path.join(self.SHM_DIRECTORY, self.prefix + "_*")):
+            _unlink(os.path.basename(path))
+
+
+class _SharingPickler(pickle.Pickler):
+
+    def __init__(self, file, transport):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.transport = transport
+        self.segments = []
+
+    def persistent_id(self, obj):
+        pid = self.transport.share(obj)
+        if pid is not None:
+            self.segments.append(pid[1])
+        return pid
+
+
+class _SharingUnpickler(pickle.Unpickler):
+
+    def __init__(self, file):
+        super().__init__(file)
+        self.segments = []
+
+    def persistent_load(self, pid):
+        kind, name, size, readonly = pid
+        segment = SharedMemory(name)
+        self.segments.append(segment)
+        # a view of its own keeps the mapping alive: the segment can not be closed while it is referenced
+        data = segment.buf[:size]
+        if kind == "bytes":
+            return bytes(data)
+        if kind == "bytearray":
+            return bytearray(data)
+        return data.toreadonly() if readonly else data
+
+
+def _close(segment):
+    """
+    :return: True if the segment could be closed, False if buffers still reference it.
+    """
+    try:
+        segment.close()
+    except BufferError:
+        return False
+    return True
+
+
+def _unlink(name):
+    try:
+        segment = SharedMemory(name)
+    except FileNotFoundError:
+        return
+    segment.close()
+    segment.unlink()
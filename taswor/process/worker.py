@@ -1,116 +1,779 @@
 import multiprocessing
 import os
 import time
-from collections import namedtuple
+import heapq
+import signal
+import asyncio
+import inspect
+import itertools
+import threading
 
-from taswor.util import get_logger
-from taswor.util import Next
+from taswor.cache import get_cache, MISSING
+from taswor.checkpoint import Checkpoint
+from taswor.events import FileEventSink, EventLog
+from taswor.metrics import MetricsRecorder
+from taswor.process.collector import chain_tag, branch_tag
+from taswor.process.inflight import InflightJournal
+from taswor.process.scheduler import LocalQueue
+from taswor.storage import Storage, get_storage
+from taswor.util import LogPolicy
+from taswor.util import Next, Join
 
 
-def worker_run(*args, **kwargs):
-    Worker(*args, **kwargs).start()
+def worker_run(worker_class, *args, **kwargs):
+    worker_class(*args, **kwargs).start()
 
 
-class NodeProcessed:
-    def __init__(self, from_node, from_args, from_kwargs, to_node, to_args, to_kwargs, duration, error):
-        self.from_node = from_node
-        self.from_args = from_args
-        self.from_kwargs = from_kwargs
-        self.to_node = to_node
-        self.to_args = to_args
-        self.to_kwargs = to_kwargs
-        self.duration = duration
-        self.error = error
+def split_task(task):
+    """
+    :return: the ``(node_name, args, kwargs, tag)`` of a task, whose tag is ``None`` unless it belongs to a join
+     branch (see :py:class:`taswor.process.collector.JoinCollector`).
+    """
+    if len(task) > 3:
+        return task
+    return task + (None,)
 
-    def to_dict(self):
-        return self.__dict__
 
-    def __str__(self):
-        return repr(self.to_dict())
+def call_with_timeout(timeout, func, *args, **kwargs):
+    """
+    Calls ``func``, which fails with a ``TimeoutError`` if it lasts more than ``timeout`` seconds. In the main thread
+    the call is interrupted by a ``SIGALRM``; elsewhere it is checked once the call returns.
+    """
+    if not timeout:
+        return func(*args, **kwargs)
+    if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        start_time = time.monotonic()
+        result = func(*args, **kwargs)
+        if time.monotonic() - start_time > timeout:
+            raise TimeoutError("Call timed out after {} seconds".format(timeout))
+        return result
+
+    def expire(signum, frame):
+        raise TimeoutError("Call timed out after {} seconds".format(timeout))
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+async def await_with_timeout(timeout, awaitable):
+    """
+    Awaits ``awaitable``, which is cancelled and fails with a ``TimeoutError`` if it lasts more than ``timeout``
+    seconds.
+    """
+    if not timeout:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError("Call timed out after {} seconds".format(timeout))
 
 
 class Worker:
-    def __init__(self, is_idle_event, queue, queue_lock, nodes, event_list, cache):
-        self.is_idle_event = is_idle_event
+    """
+    Consumes tasks from the shared queue. A task is a compact ``(node_name, args, kwargs)`` tuple; the node itself is
+    resolved against the workflow's :py:class:`taswor.graph.Graph`, which the worker receives once, when it starts,
+    so that the ``Node`` instances (and their functions) are never pickled per task.
+
+    Tasks are received in batches and the children they produce are buffered and enqueued in batches as well. When the
+    queue is bounded and full, the children are kept in a local queue and processed by the worker itself before it
+    takes new tasks from the shared queue. The local queue runs the tasks by node priority, breadth-first or, with
+    ``depth_first``, depth-first (see :py:class:`taswor.process.scheduler.LocalQueue`).
+
+    With ``affinity``, the worker keeps all the children it produces in its local queue, so they run in the same
+    process without a round-trip through the shared queue. It shares the tasks beyond ``local_queue_size``, and a
+    batch of them whenever the shared queue is empty, so the other workers do not starve.
+
+    The tasks of batched nodes (see :py:class:`taswor.node.Node`) are held by the worker until ``batch_size`` of them
+    are pending, their ``max_wait`` expires or the queue is empty, and are then resolved with a single call.
+
+    The worker measures the metrics of every node (see :py:class:`taswor.metrics.NodeMetrics`), which it writes when it
+    runs out of tasks, at most every :py:attr:`METRICS_FLUSH_INTERVAL` seconds otherwise. Until they are written, it
+    holds one of the tasks it completed as outstanding, so that the workflow only completes once the metrics of all its
+    tasks are written. If ``profile`` is given, it
+    runs the nodes it names (or all of them if it is ``True``) under a profiler built by ``profiler()``. The profiler
+    must have the ``enable()``, ``disable()`` and ``dump_stats(path)`` methods of ``cProfile.Profile``; its stats are
+    written when the worker runs out of tasks, at most every :py:attr:`PROFILE_DUMP_INTERVAL` seconds otherwise.
+
+    The worker logs through ``log_policy`` (see :py:class:`taswor.util.LogPolicy`). The messages about single tasks are
+    logged at the DEBUG level by a separate logger, which samples and rate limits them.
+
+    The failed calls of nodes with ``retries`` are held by the worker, like pending batches, until their backoff delay
+    expires and they are called again. With ``track_inflight``, the worker records the tasks it holds in an
+    :py:class:`taswor.process.inflight.InflightJournal`, from which they are recovered if the worker process dies.
+
+    With a ``checkpoint`` directory, the worker logs the tasks it completes (see
+    :py:class:`taswor.checkpoint.Checkpoint`) and replays the tasks its snapshot holds instead of running them again.
+    The joins are not checkpointed: the tasks of their branches, and the tasks that produced them, run again on resume.
+
+    A task of a single-flight node (see :py:class:`taswor.node.Node`) whose cache key is claimed by an identical task
+    in flight is held by the worker, like a retry, and looked up again every :py:attr:`SINGLE_FLIGHT_POLL_INTERVAL`
+    seconds until the result is cached, or the claim released by a failure, in which case the task takes it. The
+    claims still held when the worker is closed are released.
+
+    The tasks of join branches report their completion to the ``joins`` file of the worker, read by the
+    :py:class:`taswor.process.collector.JoinCollector` of the workflow. With ``collect_results``, the values returned
+    by the other leaf tasks are written to its ``results`` file, see :py:func:`taswor.workflow.Workflow.results()`.
+    """
+
+    PROFILE_DUMP_INTERVAL = 1
+
+    METRICS_FLUSH_INTERVAL = 1
+
+    SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+    def __init__(self, queue, graph, event_dir, cache_url, storage_url=None, name=None, profile=None, profiler=None,
+                 log_policy=None, track_inflight=False, checkpoint=None, checkpoint_interval=1, depth_first=False,
+                 affinity=False, local_queue_size=1000, collect_results=False):
         self.queue = queue
-        self.queue_lock = queue_lock
-        self.nodes = nodes
-        self.events = event_list
-        self.cache = cache
+        self.children = []
+        self.local = LocalQueue(graph, depth_first)
+        self.affinity = affinity
+        self.local_queue_size = local_queue_size
+        self.pending = {}
+        self.deferred = 0
+        self.retrying = []
+        self.retry_order = itertools.count()
+        self.waiting = []
+        self.graph = graph
+        self.cache = get_cache(cache_url)
+        self.claims = set()
+        # the nodes reach the storage through the class-level methods of Storage
+        self.storage = get_storage(storage_url)
+        Storage.bind(self.storage)
 
-        self.worker_process = multiprocessing.current_process()
-        self.logger = get_logger("Worker ".format(self.worker_process.name))
+        self.name = name or multiprocessing.current_process().name
+        # the events and metrics of remote workers are sent to the broker by an EventLog of their own
+        event_log = event_dir if isinstance(event_dir, EventLog) else EventLog(event_dir)
+        self.events = FileEventSink(event_log.open(self.name))
+        self.metrics = MetricsRecorder(event_log.open(self.name, "metrics"))
+        self.metrics_flushed = time.time()
+        self.metrics_held = False
+        self.journal = InflightJournal(event_log.open(self.name, "inflight")) if track_inflight else None
+        self.joins = FileEventSink(event_log.open(self.name, "joins"))
+        self.results = FileEventSink(event_log.open(self.name, "results")) if collect_results else None
+        # the join ids must not collide with the ones of other workers, or of the runs recorded in a checkpoint
+        self.join_prefix = "{}-{}".format(self.name, os.urandom(4).hex())
+        self.join_counter = itertools.count()
+        self.checkpoint = None
+        self.checkpoint_log = None
+        if checkpoint:
+            self.checkpoint = Checkpoint(checkpoint).connect()
+            self.checkpoint_log = self.checkpoint.open(self.name, checkpoint_interval)
+
+        self.profile = profile if profile is True or not profile else frozenset(profile)
+        self.profiler = profiler() if profile else None
+        self.profile_path = event_log.sink_path(self.name, "prof")
+        self.profile_depth = 0
+        self.profile_dumped = time.time()
+        self.profile_dirty = False
+        log_policy = log_policy or LogPolicy()
+        self.logger = log_policy.get_logger("Worker {}".format(self.name))
+        self.task_logger = log_policy.get_logger("Worker {}".format(self.name), task=True)
 
     def start(self):
+        self.logger.debug("Worker %s started and waiting", os.getpid())
+        while True:
+            tasks = self.next_tasks(timeout=self.pending_timeout())  # blocking
+            if tasks is None:
+                break
+            self.process_tasks(tasks)
+            self.run_retries()
+            self.run_batches(force=not tasks)
+        self.close()
+
+    def close(self):
+        for cache_key in list(self.claims):
+            self.release(cache_key)
+        self.flush_storage()
+        if self.storage is not None:
+            self.storage.close()
+            if Storage.backend() is self.storage:
+                Storage.bind(None)
+        self.events.close()
+        self.metrics.close()
+        self.joins.close()
+        if self.results is not None:
+            self.results.close()
+        if self.journal is not None:
+            self.journal.close()
+        if self.checkpoint is not None:
+            self.checkpoint_log.close()
+            self.checkpoint.close()
+        self.dump_profile()
 
-        self.logger.debug("Worker {} started and waiting".format(os.getpid()))
+    def run_until_idle(self):
+        """
+        Processes tasks in the calling thread until the queue is empty.
+        """
         while True:
-            self.is_idle_event.set()
+            self.run_retries()
+            tasks = self.next_tasks(block=False)
+            if not tasks:
+                if self.pending:
+                    self.run_batches(force=True)
+                elif self.retrying or self.waiting:
+                    time.sleep(self.pending_timeout())
+                else:
+                    break
+                continue
+            self.process_tasks(tasks)
+            self.run_batches()
+        self.flush_metrics()
+        self.dump_profile()
 
-            self.queue_lock.acquire()
-            node, args, kwargs = self.queue.get()  # blocking
+    def next_tasks(self, block=True, timeout=None):
+        """
+        Returns the next batch of tasks, taken from the local queue if it has any or from the shared queue otherwise.
+        See :py:func:`TaskQueue.get()`.
+        """
+        if self.local:
+            return self.local.pop_many(self.queue.batch_size)
+        tasks = []
+        if block and (self.metrics.nodes or self.metrics_held):
+            # the metrics are written before the worker waits for tasks, so they are complete once the workers are idle
+            tasks = self.queue.get(False, None, self.metrics, self.journal)
+            if tasks == []:
+                self.flush_metrics()
+        if tasks == []:
+            tasks = self.queue.get(block, timeout, self.metrics, self.journal)
+        if tasks and self.local.priorities:
+            # the tasks of a batch run by priority as well
+            self.local.extend(tasks)
+            return self.local.pop_many(len(tasks))
+        return tasks
 
-            self.is_idle_event.clear()
-            self.queue_lock.release()
+    def process_tasks(self, tasks):
+        deferred = self.deferred
+        try:
+            for task in tasks:
+                node_name, args, kwargs, tag = split_task(task)
+                node = self.graph[node_name]
+                self.task_logger.debug("Received %s", node)
+                try:
+                    self.process_node(node, args, kwargs, tag)
+                except Exception as e:
+                    # e.g. a child that could not be enqueued: the task fails, not the worker
+                    self.handle_error(e, node, args, kwargs, time.time(), tag)
+                self.metrics.record_latency(task)
+        finally:
+            # the deferred tasks are marked as done when their batch is resolved
+            self.finish(len(tasks) - (self.deferred - deferred))
 
-            self.logger.info("Received {}".format(node))
-            self.process_node(node, args, kwargs)
+    def finish(self, count):
+        self.flush_storage()
+        self.flush_children()
+        self.events.flush()
+        self.joins.flush()
+        if self.results is not None:
+            self.results.flush()
+        if self.checkpoint_log is not None:
+            self.checkpoint_log.flush()
+        now = time.time()
+        held = None
+        if now - self.metrics_flushed >= self.METRICS_FLUSH_INTERVAL or self.idle():
+            self.flush_metrics()
+        elif count and not self.metrics_held:
+            # released once the metrics are written, see flush_metrics()
+            self.metrics_held = held = True
+        if self.journal is not None:
+            self.journal.done(count, held)
+        if self.profile_dirty and (now - self.profile_dumped >= self.PROFILE_DUMP_INTERVAL or self.idle()):
+            self.dump_profile()
+        self.queue.task_done(count - 1 if held else count)
 
-    def process_node(self, current_node, args, kwargs):
-        result = None
+    def idle(self):
+        """
+        :return: True if the worker has no more tasks to run, as far as it knows.
+        """
+        return not self.local and self.queue.empty()
 
-        if current_node.use_cache:
-            # try searching in cache
-            cache_key = "{}_{}_{}".format(current_node.name, args, kwargs)
-            if cache_key in self.cache:
-                # cache hit, save the cached result and return
-                self.logger.info("Cached value {} ( {}, {} )".format(current_node.name, args, kwargs))
-                self.process_result(self.cache[cache_key], current_node, args, kwargs, time.time())
+    def flush_metrics(self):
+        """
+        Writes the metrics, and marks as done the task held until then, if any.
+        """
+        self.metrics.flush()
+        self.metrics_flushed = time.time()
+        if self.metrics_held:
+            self.metrics_held = False
+            if self.journal is not None:
+                self.journal.done(0, held=False)
+            self.queue.task_done(1)
+
+    def flush_storage(self):
+        """
+        Writes the values buffered by the storage, so that the results of the finished tasks are durable.
+        """
+        if self.storage is None:
+            return
+        try:
+            self.storage.flush()
+        except Exception as e:
+            # the values stay buffered until the next flush
+            self.logger.error("Could not write to the storage: %s", e)
+
+    def start_profile(self, current_node):
+        """
+        Enables the profiler if ``current_node`` is profiled. Calls can be nested (the asyncio engine runs several
+        nodes at once), the profiler is only disabled by the outermost :py:func:`Worker.stop_profile()`.
+
+        :return: True if the profiler was enabled, in which case :py:func:`Worker.stop_profile()` must be called.
+        """
+        if self.profiler is None or (self.profile is not True and current_node.name not in self.profile):
+            return False
+        if not self.profile_depth:
+            try:
+                self.profiler.enable()
+            except ValueError as e:
+                # since Python 3.12, a single profiler can be active per process (e.g. with the thread executor)
+                self.logger.warning("Profiling disabled: %s", e)
+                self.profiler = None
+                return False
+        self.profile_depth += 1
+        return True
+
+    def stop_profile(self):
+        self.profile_depth -= 1
+        if not self.profile_depth:
+            self.profiler.disable()
+            self.profile_dirty = True
+
+    def dump_profile(self):
+        if self.profile_dirty and not self.profile_depth:
+            self.profiler.dump_stats(self.profile_path)
+            self.profile_dumped = time.time()
+            self.profile_dirty = False
+
+    def process_node(self, current_node, args, kwargs, tag=None):
+        """
+        :param tag: the tag of the task if it belongs to a join branch.
+        """
+        start_time = time.time()
+        try:
+            if tag is None and self.replay(current_node, args, kwargs, start_time):
                 return
+            cache_key, cached = self.lookup_cache(current_node, args, kwargs)
+        except Exception as e:
+            # the key of the task could not be computed, e.g. its cache_key function raised
+            self.handle_error(e, current_node, args, kwargs, start_time, tag)
+            return
+        if cached is MISSING and current_node.single_flight:
+            claimed, cached = self.claim(current_node, cache_key)
+            if not claimed:
+                self.wait((current_node.name, args, kwargs, tag), cache_key)
+                return
+        if cached is not MISSING:
+            self.process_result(cached, current_node, args, kwargs, start_time, cached=True, tag=tag)
+            return
 
+        self.call_node(current_node, args, kwargs, cache_key, tag=tag)
+
+    def call_node(self, current_node, args, kwargs, cache_key, attempt=0, tag=None):
+        """
+        Calls the node function, or defers the call if the node is batched.
+
+        :param attempt: the number of times the call already failed.
+        """
+        if current_node.batch_size:
+            self.defer(current_node, args, kwargs, cache_key, attempt, tag)
+            return
+
+        profiled = self.start_profile(current_node)
         start_time = time.time()
         try:
-            result = current_node.resolve(*args, **kwargs)
+            result = call_with_timeout(current_node.timeout, current_node.resolve, *args, **kwargs)
+            if inspect.isawaitable(result):
+                # coroutine nodes outside of the asyncio engine
+                result = asyncio.run(await_with_timeout(current_node.timeout, result))
         except Exception as e:
-            self.logger.error("Node {} raised an exception: {}".format(current_node, e))
-            self.logger.error("Was called with arguments {}, {}".format(args, kwargs))
-            self.register_event((current_node.name, args, kwargs), None, time.time() - start_time, str(e))
+            self.metrics[current_node.name].exec_time.add(time.time() - start_time)
+            self.handle_failure(e, current_node, args, kwargs, cache_key, attempt, start_time, tag)
             return
+        finally:
+            if profiled:
+                self.stop_profile()
 
-        self.logger.info("Node {}({}, {}) resolved to {}".format(current_node.name, args, kwargs, result))
-        if current_node.use_cache:
-            self.logger.info("Cache the result value")
-            self.cache["{}_{}_{}".format(current_node.name, args, kwargs)] = result
+        self.metrics[current_node.name].exec_time.add(time.time() - start_time)
+        self.handle_resolved(result, cache_key, current_node, args, kwargs, start_time, tag)
+
+    def defer(self, current_node, args, kwargs, cache_key, attempt=0, tag=None):
+        # invocations can only be resolved together if they have the same shape
+        shape = (current_node.name, len(args), tuple(sorted(kwargs)))
+        if shape not in self.pending:
+            self.pending[shape] = (time.time(), [])
+        self.pending[shape][1].append((args, kwargs, cache_key, attempt, tag))
+        self.deferred += 1
+
+    def handle_failure(self, error, current_node, args, kwargs, cache_key, attempt, start_time, tag=None):
+        """
+        Schedules a new call if the node has retries left, records the error otherwise.
+
+        :return: True if the call is retried, in which case the task is held by the worker until then.
+        """
+        if attempt >= current_node.retries:
+            # one of the identical tasks waiting for the result is called instead
+            self.release(cache_key)
+            self.handle_error(error, current_node, args, kwargs, start_time, tag)
+            return False
+        self.metrics[current_node.name].retries += 1
+        self.task_logger.warning("Node %s raised an exception, retrying: %s", current_node, error)
+        due = time.time() + current_node.retry_delay(attempt + 1)
+        heapq.heappush(self.retrying, (due, next(self.retry_order), (current_node.name, args, kwargs, tag), cache_key,
+                                       attempt + 1))
+        self.deferred += 1
+        return True
+
+    @staticmethod
+    def pop_due(heap):
+        """
+        Removes and returns the entries of a heap of ``(due, order, ...)`` tuples whose time came, without their first
+        two items.
+        """
+        now = time.time()
+        due = []
+        while heap and heap[0][0] <= now:
+            due.append(heapq.heappop(heap)[2:])
+        return due
+
+    def due_retries(self):
+        """
+        Removes and returns the retries whose delay expired, as (task, cache_key, attempt) tuples.
+        """
+        return self.pop_due(self.retrying)
+
+    def run_retries(self):
+        """
+        Calls the failed tasks whose retry is due, and the waiting single-flight tasks that got their claim.
+        """
+        for task, cache_key, attempt in self.due_retries():
+            self.retry(task, cache_key, attempt)
+        for task, cache_key in self.pop_due(self.waiting):
+            if not self.poll_waiting(task, cache_key):
+                self.retry(task, cache_key, 0)
+
+    def retry(self, task, cache_key, attempt):
+        deferred = self.deferred
+        try:
+            node_name, args, kwargs, tag = split_task(task)
+            self.call_node(self.graph[node_name], args, kwargs, cache_key, attempt, tag)
+        finally:
+            self.finish(1 - (self.deferred - deferred))
+
+    def pending_timeout(self):
+        """
+        :return: how long the worker can wait for new tasks before the oldest pending batch must be resolved, the next
+         retry is due or a waiting task must be looked up, or ``None`` if there is none.
+        """
+        deadlines = [created + self.graph[shape[0]].max_wait for shape, (created, _) in self.pending.items()]
+        if self.retrying:
+            deadlines.append(self.retrying[0][0])
+        if self.waiting:
+            deadlines.append(self.waiting[0][0])
+        if not deadlines:
+            return None
+        return max(0, min(deadlines) - time.time())
+
+    def due_batches(self, force=False):
+        """
+        Removes and returns the pending batches that are full or waited long enough, as (node, invocations) tuples.
+        Batches holding more than ``batch_size`` invocations are split.
+
+        :param force: if True, all the pending batches are returned.
+        """
+        now = time.time()
+        due = []
+        for shape, (created, invocations) in list(self.pending.items()):
+            node = self.graph[shape[0]]
+            expired = node.max_wait and created + node.max_wait <= now
+            if force or expired or len(invocations) >= node.batch_size:
+                del self.pending[shape]
+                for i in range(0, len(invocations), node.batch_size):
+                    due.append((node, invocations[i:i + node.batch_size]))
+        return due
+
+    def run_batches(self, force=False):
+        for current_node, invocations in self.due_batches(force):
+            retried = 0
+            profiled = self.start_profile(current_node)
+            start_time = time.time()
+            try:
+                try:
+                    results = call_with_timeout(current_node.timeout, current_node.resolve_batch,
+                                                [(args, kwargs) for args, kwargs, _, _, _ in invocations])
+                    if inspect.isawaitable(results):
+                        results = asyncio.run(await_with_timeout(current_node.timeout, results))
+                except Exception as e:
+                    results = e
+                finally:
+                    if profiled:
+                        self.stop_profile()
+                self.metrics[current_node.name].exec_time.add(time.time() - start_time)
+                retried = self.handle_batch(results, current_node, invocations, start_time)
+            finally:
+                # the retried invocations are held until their next call
+                self.finish(len(invocations) - retried)
+
+    def handle_batch(self, results, current_node, invocations, start_time):
+        """
+        Splits the results of a batch call into the results of every invocation.
+
+        :param results: the list returned by the node function or the exception it raised.
+        :return: the number of invocations that are retried.
+        """
+        if not isinstance(results, Exception) and (not isinstance(results, (list, tuple)) or
+                                                   len(results) != len(invocations)):
+            results = RuntimeError("Batch node {} must return a list of {} results".format(
+                current_node.name, len(invocations)))
+        retried = 0
+        for i, (args, kwargs, cache_key, attempt, tag) in enumerate(invocations):
+            if isinstance(results, Exception):
+                retried += self.handle_failure(results, current_node, args, kwargs, cache_key, attempt, start_time,
+                                               tag)
+            else:
+                self.handle_resolved(results[i], cache_key, current_node, args, kwargs, start_time, tag)
+        return retried
+
+    def replay(self, current_node, args, kwargs, start_time):
+        """
+        Enqueues the tasks produced by the task if the checkpoint holds it as completed. Replayed tasks are counted as
+        cache hits.
+
+        :return: True if the task was replayed.
+        """
+        if self.checkpoint is None:
+            return False
+        children = self.checkpoint.completed((current_node.name, args, kwargs))
+        if children is None:
+            return False
+        metrics = self.metrics[current_node.name]
+        metrics.calls += 1
+        metrics.cache_hits += 1
+        task = (current_node.name, args, kwargs)
+        if not children:
+            self.register_event(task, None, time.time() - start_time, None, True)
+        for child in children:
+            self.enqueue(child)
+            self.register_event(task, child, time.time() - start_time, None, True)
+        return True
+
+    def lookup_cache(self, current_node, args, kwargs):
+        """
+        :return: a tuple (cache_key, cached_result). The cached result is ``MISSING`` if the node does not use the cache
+         or there is no cached result for the given arguments.
+        """
+        metrics = self.metrics[current_node.name]
+        metrics.calls += 1
+        if not current_node.use_cache:
+            return None, MISSING
+
+        # try searching in cache
+        cache_key = current_node.get_cache_key(args, kwargs)
+        cached = self.cache.get(cache_key, MISSING)
+        if cached is not MISSING:
+            # cache hit, the cached result will be processed instead of resolving the node
+            self.task_logger.debug("Cached value %s ( %s, %s )", current_node.name, args, kwargs)
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+        return cache_key, cached
+
+    def claim(self, current_node, cache_key):
+        """
+        Claims the computation of the result of a task of a single-flight node, after a cache miss.
+
+        :return: a tuple (claimed, cached_result). The result may have been cached by an identical task since the
+         lookup, in which case the claim is released right away and the result is returned; it is ``MISSING``
+         otherwise.
+        """
+        if not self.cache.claim(cache_key, current_node.claim_lease()):
+            return False, MISSING
+        self.claims.add(cache_key)
+        cached = self.cache.get(cache_key, MISSING)
+        if cached is not MISSING:
+            self.release(cache_key)
+            self.metrics[current_node.name].deduplicated += 1
+        return True, cached
+
+    def release(self, cache_key):
+        """
+        Releases the claim of the worker on a cache key, if it holds one.
+        """
+        if cache_key in self.claims:
+            self.claims.discard(cache_key)
+            self.cache.release(cache_key)
 
+    def wait(self, task, cache_key):
+        """
+        Holds a task of a single-flight node while an identical task is in flight, see
+        :py:func:`Worker.poll_waiting()`.
+        """
+        heapq.heappush(self.waiting, (time.time() + self.SINGLE_FLIGHT_POLL_INTERVAL, next(self.retry_order), task,
+                                      cache_key))
+        self.deferred += 1
 
-        self.process_result(result, current_node, args, kwargs, start_time)
+    def poll_waiting(self, task, cache_key):
+        """
+        Looks up the result of a waiting task: the task is completed with it if the identical task completed, and
+        waits again if that task is still in flight.
 
-    def process_result(self, result, current_node, args, kwargs, start_time):
-        if result is None:
-            self.logger.debug("Node leaf encountered")
-            self.register_event((current_node.name, args, kwargs), None, time.time() - start_time, None)
-        elif isinstance(result, Next):
+        :return: False if the identical task failed and the waiting task claimed the computation, in which case it
+         must be called.
+        """
+        node_name, args, kwargs, tag = task
+        current_node = self.graph[node_name]
+        cached = self.cache.get(cache_key, MISSING)
+        if cached is MISSING:
+            claimed, cached = self.claim(current_node, cache_key)
+            if not claimed:
+                self.wait(task, cache_key)
+                return True
+            if cached is MISSING:
+                return False
+        else:
+            self.metrics[node_name].deduplicated += 1
+        try:
+            self.process_result(cached, current_node, args, kwargs, time.time(), cached=True, tag=tag)
+        finally:
+            self.finish(1)
+        return True
+
+    def handle_error(self, error, current_node, args, kwargs, start_time, tag=None):
+        self.metrics[current_node.name].errors += 1
+        self.task_logger.error("Node %s raised an exception: %s", current_node, error)
+        self.task_logger.error("Was called with arguments %s, %s", args, kwargs)
+        self.register_event((current_node.name, args, kwargs), None, time.time() - start_time, str(error))
+        if tag is not None:
+            self.joins.append(("done", tag, 0, None, None, True))
+
+    def handle_resolved(self, result, cache_key, current_node, args, kwargs, start_time, tag=None):
+        self.task_logger.debug("Node %s(%s, %s) resolved to %s", current_node.name, args, kwargs, result)
+        if current_node.use_cache:
+            self.task_logger.debug("Cache the result value")
+            self.cache.set(cache_key, result)
+            self.release(cache_key)
+
+        self.process_result(result, current_node, args, kwargs, start_time, tag=tag)
+
+    def process_result(self, result, current_node, args, kwargs, start_time, cached=False, tag=None):
+        """
+        :param cached: True if the result comes from the cache rather than from a call of the node function.
+        :param tag: the tag of the task if it belongs to a join branch.
+        """
+        children = []
+        fanout = None
+        if isinstance(result, Next):
             # handle result
-            node = self.get_node_from_next(result)
-            self.queue.put((node, result.args, result.kwargs))
-            self.register_event((current_node.name, args, kwargs), (node.name, result.args, result.kwargs),
-                                time.time() - start_time, None)
+            children.append(self.process_next(result, current_node, args, kwargs, start_time, cached,
+                                              chain_tag(tag)))
         elif isinstance(result, list):
-            for next_node in result:
+            fanout = len(result)
+            for i, next_node in enumerate(result):
                 # handle next_node
-                node = self.get_node_from_next(next_node)
-                self.queue.put((node, next_node.args, next_node.kwargs))
+                children.append(self.process_next(next_node, current_node, args, kwargs, start_time, cached,
+                                                  branch_tag(tag, i)))
+        else:
+            self.task_logger.debug("Node leaf encountered")
+            self.register_event((current_node.name, args, kwargs), None, time.time() - start_time, None, cached)
+            if result is not None and tag is None and self.results is not None:
+                self.results.append(result)
+        if tag is not None:
+            produced = len([child for child in children if child])
+            self.joins.append(("done", tag, produced, result if fanout is None and not children else None, fanout,
+                               produced < len(children)))
+        elif self.checkpoint_log is not None and not (isinstance(result, Join) or fanout and any(
+                isinstance(next_node, Join) for next_node in result)):
+            self.checkpoint_log.record((current_node.name, args, kwargs), [child for child in children if child])
+
+    def process_next(self, next_instance, current_node, args, kwargs, start_time, cached=False, tag=None):
+        """
+        :param tag: the tag of the task produced, if it belongs to a join branch.
+        :return: the task enqueued, or ``None`` if the ``Next`` could not be routed.
+        """
+        try:
+            node = self.get_node_from_next(next_instance, current_node)
+        except RuntimeError as e:
+            # routing errors only drop the offending branch
+            self.register_event((current_node.name, args, kwargs), None, time.time() - start_time, str(e), cached)
+            return None
+        task = (node.name, next_instance.args, next_instance.kwargs)
+        if isinstance(next_instance, Join):
+            self.process_join(next_instance, current_node, args, kwargs, start_time, cached, task, tag)
+        else:
+            self.enqueue(task + (tag,) if tag is not None else task)
+        self.register_event((current_node.name, args, kwargs), task, time.time() - start_time, None, cached)
+        return task
 
-                self.register_event((current_node.name, args, kwargs), (node.name, next_node.args, next_node.kwargs),
-                                    time.time() - start_time, None)
+    def process_join(self, join, current_node, args, kwargs, start_time, cached, task, tag):
+        """
+        Enqueues the branches of a join. The join node itself is enqueued by the
+        :py:class:`taswor.process.collector.JoinCollector` once they are done, so it is counted as outstanding until
+        then.
+
+        :param task: the ``(node_name, args, kwargs)`` of the join node, without the results of the branches.
+        :param tag: the tag of the join node, if it belongs to a join branch itself.
+        """
+        join_id = "{}-{}".format(self.join_prefix, next(self.join_counter))
+        self.queue.reserve()
+        failed = 0
+        for i, branch in enumerate(join.branches):
+            if self.process_next(branch, current_node, args, kwargs, start_time, cached, (join_id, (i,), 0)) is None:
+                failed += 1
+        self.joins.append(("join", join_id, task, tag, len(join.branches), failed))
 
-    def register_event(self, current_node, next_node, duration, error=None):
+    def enqueue(self, task):
+        self.children.append(task)
+        if len(self.children) >= self.queue.batch_size:
+            self.flush_children()
+
+    def flush_children(self):
+        children, self.children = self.children, []
+        if self.affinity:
+            self.queue.reserve(len(children))
+            self.hold(children)
+            self.share()
+            return
+        self.hold(self.queue.put_many(children, block=False, metrics=self.metrics))
+
+    def hold(self, tasks):
+        """
+        Keeps tasks, already counted as outstanding, in the local queue.
+        """
+        if tasks:
+            if self.journal is not None:
+                self.journal.take(tasks)
+            self.local.extend(tasks)
+
+    def share(self):
+        """
+        Moves tasks from the local queue to the shared queue: the ones beyond ``local_queue_size``, or a batch if the
+        shared queue is empty.
+        """
+        count = len(self.local) - self.local_queue_size
+        if count <= 0:
+            if len(self.local) <= self.queue.batch_size or not self.queue.empty():
+                return
+            count = self.queue.batch_size
+        tasks = self.local.share(count)
+        self.metrics.forget(tasks)
+        overflow = self.queue.put_many(tasks, block=False, metrics=self.metrics)
+        self.local.extend(overflow)
+        if self.journal is not None:
+            self.journal.done(len(tasks) - len(overflow))
+        # the tasks were counted as outstanding twice, when they were kept and when they were enqueued
+        self.queue.task_done(len(tasks))
+
+    def register_event(self, current_node, next_node, duration, error=None, cached=False):
         """
 
         :param current_node: a tuple (str, list/tuple, dict) representing (current_node_name, args, kwargs)
         :param next_node: a tuple (str, list/tuple, dict) representing (next_node_name, args, kwargs)
         :param duration: a float representing how many seconds the processing lasted
         :param error: None or a str representing an error message
+        :param cached: True if the result of the current node came from the cache
         :return:
         """
         if not next_node:
@@ -122,18 +785,12 @@ class Worker:
             to_args = next_node[1]
             to_kwargs = next_node[2]
 
-        self.events.append(
-            NodeProcessed(from_node=current_node[0], from_args=current_node[1], from_kwargs=current_node[2],
-                          to_node=to_name, to_args=to_args, to_kwargs=to_kwargs,
-                          duration=duration, error=error))
-
-    def get_node_from_next(self, next_instance):
-        node_name = next_instance.node_name
-        nodes = [node for node in self.nodes if node.name == node_name]
-        if not nodes:
-            self.logger.error("No node with name {} registered".format(node_name))
-            raise RuntimeError("No node with name {} registered".format(node_name))
-        if len(nodes) > 1:
-            self.logger.error("Multiple nodes with name {} registered".format(node_name))
-            raise RuntimeError("Multiple nodes with name {} registered".format(node_name))
-        return nodes[0]
+        self.events.append((current_node[0], current_node[1], current_node[2], to_name, to_args, to_kwargs,
+                            duration, error, cached))
+
+    def get_node_from_next(self, next_instance, current_node):
+        try:
+            return self.graph.route(current_node, next_instance)
+        except RuntimeError as e:
+            self.task_logger.error("%s", e)
+            raise
@@ -1,6 +1,244 @@
+import os
+import pickle
+import sqlite3
+import threading
+from urllib.parse import urlparse, parse_qs
+
+from taswor import settings
+
+_local = threading.local()
+
+
 class Storage:
+    """
+    Entry point of the nodes to the storage of the workflow::
+
+        def leaf_node(number):
+            Storage.put("result", number)
+
+    Every worker builds its own backend from the workflow's ``storage_url`` (see :py:func:`get_storage`) and binds it
+    to the thread it runs in, so the class-level methods below always reach the backend of the calling worker. When
+    the workflow has no storage, the writes are ignored and the reads return nothing.
+    """
+
+    @staticmethod
+    def bind(backend):
+        """
+        Makes ``backend`` the storage of the current thread.
+        """
+        _local.backend = backend
+
+    @staticmethod
+    def backend():
+        """
+        :return: the :py:class:`StorageBackend` of the current thread, or ``None``.
+        """
+        return getattr(_local, "backend", None)
+
+    @staticmethod
+    def put(key, value):
+        backend = Storage.backend()
+        if backend is not None:
+            backend.put(key, value)
+
+    @staticmethod
+    def put_many(items):
+        backend = Storage.backend()
+        if backend is not None:
+            backend.put_many(items)
+
+    @staticmethod
+    def get(key, default=None):
+        backend = Storage.backend()
+        if backend is None:
+            return default
+        return backend.get(key, default)
+
+    @staticmethod
+    def get_many(keys):
+        backend = Storage.backend()
+        if backend is None:
+            return {}
+        return backend.get_many(keys)
+
+
+class StorageBackend:
+    """
+    Base class for the storage backends. Keys are strings and values are pickled.
+
+    Writes are buffered in memory and written in bulk, with a single statement or round-trip, when ``flush_size`` of
+    them are pending or when :py:func:`StorageBackend.flush()` is called. The workers flush their storage at the end
+    of every task, before marking it as done, so the results of a completed task are durable. Reads see the buffered
+    writes.
+
+    A backend instance is never shared between processes or threads: each worker builds its own and keeps its single
+    connection open for all its tasks.
+    """
+
+    def __init__(self, flush_size=1000):
+        self.flush_size = flush_size
+        self.buffer = {}
+
     def put(self, key, value):
-        pass
+        self.buffer[key] = value
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def put_many(self, items):
+        """
+        :param items: a dict or an iterable of (key, value) pairs.
+        """
+        self.buffer.update(items)
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        """
+        :return: a dict mapping the keys found in the storage to their values.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self.buffer:
+                found[key] = self.buffer[key]
+            else:
+                missing.append(key)
+        if missing:
+            found.update(self._get_many(missing))
+        return found
+
+    def flush(self):
+        """
+        Writes the buffered values. If the write fails, they stay buffered and are retried by the next flush.
+        """
+        if self.buffer:
+            items, self.buffer = self.buffer, {}
+            try:
+                self._put_many(items)
+            except Exception:
+                items.update(self.buffer)
+                self.buffer = items
+                raise
+
+    def close(self):
+        self.flush()
+
+    def _put_many(self, items):
+        raise NotImplementedError()
+
+    def _get_many(self, keys):
+        raise NotImplementedError()
+
+    def __len__(self):
+        raise NotImplementedError()
+
+
+class SqliteStorage(StorageBackend):
+    """
+    Storage in a sqlite database, shared by all the workers. Every flush is a single transaction.
+    """
+
+    # stays below the limit of variables in a statement of old sqlite versions
+    MAX_VARIABLES = 500
+
+    def __init__(self, path, flush_size=1000):
+        super().__init__(flush_size=flush_size)
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS storage (key TEXT PRIMARY KEY, value BLOB)")
+
+    def _put_many(self, items):
+        rows = [(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for key, value in items.items()]
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.executemany("INSERT OR REPLACE INTO storage (key, value) VALUES (?, ?)", rows)
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def _get_many(self, keys):
+        found = {}
+        for i in range(0, len(keys), self.MAX_VARIABLES):
+            chunk = keys[i:i + self.MAX_VARIABLES]
+            rows = self.connection.execute("SELECT key, value FROM storage WHERE key IN ({})".format(
+                ", ".join("?" * len(chunk))), chunk)
+            for key, value in rows:
+                found[key] = pickle.loads(value)
+        return found
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM storage").fetchone()[0]
+
+
+class RedisStorage(StorageBackend):
+    """
+    Storage on a Redis server (or anything speaking its protocol). A flush is a single ``MSET`` and
+    :py:func:`StorageBackend.get_many()` a single ``MGET``.
+
+    Requires the ``redis`` package.
+    """
+
+    def __init__(self, host=settings.redis_server, port=settings.redis_port, db=0, flush_size=1000,
+                 prefix="taswor:storage:"):
+        super().__init__(flush_size=flush_size)
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis storage backend")
+        self.client = redis.Redis(host=host, port=port, db=db)
+        self.prefix = prefix
+
+    def _put_many(self, items):
+        self.client.mset({self.prefix + key: pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                          for key, value in items.items()})
+
+    def _get_many(self, keys):
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: pickle.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def close(self):
+        self.flush()
+        self.client.close()
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+
+def get_storage(url):
+    """
+    Builds a storage backend from an url. The supported schemes are:
+
+    - ``sqlite:///path/to/file.db``: a sqlite database
+    - ``redis://host:port/db``: a Redis server; host and port default to the values in ``taswor.settings``
+
+    The ``flush_size`` query parameter sets the number of buffered writes, e.g.
+    ``sqlite:///tmp/results.db?flush_size=100``.
+
+    :return: the backend, or ``None`` if ``url`` is empty.
+    """
+    if not url:
+        return None
+
+    parsed = urlparse(url)
+    options = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+    kwargs = {}
+    if "flush_size" in options:
+        kwargs["flush_size"] = int(options["flush_size"])
 
-    def get(self, key):
-        pass
+    if parsed.scheme == "sqlite":
+        path = parsed.netloc + parsed.path
+        return SqliteStorage(os.path.abspath(path) if path else "taswor_storage.db", **kwargs)
+    if parsed.scheme == "redis":
+        return RedisStorage(host=parsed.hostname or settings.redis_server, port=parsed.port or settings.redis_port,
+                            db=int(parsed.path.strip("/") or 0), **kwargs)
+    raise RuntimeError("Unknown storage backend {}".format(url))
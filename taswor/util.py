@@ -1,7 +1,14 @@
 import logging
+import logging.handlers
 import sys
+import time
+import random
+import warnings
+import threading
 import itertools
 
+LOG_FORMAT = "[%(asctime)s][%(process)s][%(levelname).1s] %(message)s"
+
 
 class Next:
     """
@@ -23,22 +30,161 @@ class Next:
         return "<NextNode -> {}( {}, {} )>".format(self.node_name, self.args, self.kwargs)
 
 
-def get_logger(name=None):
+class Join(Next):
+    """
+    Fans out to several branches and in again: the tasks of ``branches`` run, then the node ``node_name`` is called
+    once with the list of their results as its first argument, followed by ``args`` and ``kwargs``.
+
+    The result of a branch is the value returned by the leaf task it ends with: if a task of the branch returns a
+    ``Next``, it is the result of that ``Next``, if it returns a list of them, the list of their results, and if it
+    returns a ``Join``, the result of the join node. If a task of a branch fails, the join node is not called and the
+    join fails as well.
+    """
+
+    def __init__(self, node_name, branches, *args, **kwargs):
+        """
+        :param node_name: The name of the node the results of the branches are given to
+        :param branches: The list of the :py:class:`Next` instances that start the branches
+        """
+        super().__init__(node_name, *args, **kwargs)
+        self.branches = list(branches)
+
+    def __repr__(self):
+        return "<Join {} -> {}( {}, {} )>".format(self.branches, self.node_name, self.args, self.kwargs)
+
+
+def get_logger(name=None, level=logging.DEBUG, handler=None):
+    """
+    :param level: the level of the logger.
+    :param handler: the handler of the logger. By default, the messages are written to stdout.
+    """
     if not name:
         name = __name__
     logger = logging.Logger(name)
-    format = "[%(asctime)s][%(process)s][%(levelname).1s] %(message)s"
 
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(logging.Formatter(format))
-    console_handler.setLevel(logging.DEBUG)
-    logger.addHandler(console_handler)
+    if handler is None:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(handler)
 
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(level)
     return logger
 
 
+class TaskLogFilter(logging.Filter):
+    """
+    Filters the messages logged for every task: only a ``sample_rate`` fraction of them is kept and at most
+    ``rate_limit`` of them per second.
+    """
+
+    def __init__(self, sample_rate=1.0, rate_limit=None):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self.window = 0
+        self.count = 0
+
+    def filter(self, record):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return False
+        if self.rate_limit:
+            window = int(time.time())
+            if window != self.window:
+                self.window = window
+                self.count = 0
+            self.count += 1
+            return self.count <= self.rate_limit
+        return True
+
+
+class LogPolicy:
+    """
+    The logging configuration of a workflow, shared with its workers.
+
+    The workers do not write their messages themselves: their loggers put the records in a queue and a listener thread
+    of the main process hands them to ``handler``. The messages are formatted lazily, only if their level is enabled,
+    and the messages logged for every task can be sampled and rate limited.
+    """
+
+    def __init__(self, level=logging.INFO, task_sample_rate=1.0, task_rate_limit=None, handler=None):
+        """
+        :param level: the level of all the loggers of the workflow.
+        :param task_sample_rate: the fraction of the per-task messages that are logged.
+        :param task_rate_limit: the maximum number of per-task messages logged per second by each worker. ``None``
+         means no limit.
+        :param handler: the handler that writes the messages. By default, they are written to stdout.
+        """
+        self.level = level
+        self.task_sample_rate = task_sample_rate
+        self.task_rate_limit = task_rate_limit
+        if handler is None:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self.handler = handler
+        self.queue = None
+        self.listener = None
+
+    def start(self, context, queue=None):
+        """
+        Starts the listener, with a queue created by ``context`` (see :py:class:`taswor.process.task_queue.TaskQueue`).
+
+        :param queue: the queue to listen to instead, e.g. one the processes of a
+         :py:class:`taswor.process.pool.WorkerPool` inherited.
+        """
+        self.queue = queue if queue is not None else context.Queue()
+        self.listener = threading.Thread(target=self.listen, name="log-listener", daemon=True)
+        self.listener.start()
+
+    def listen(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            self.handler.handle(record)
+
+    def stop(self, timeout=5):
+        """
+        Stops the listener once the records already enqueued are handled.
+
+        :param timeout: maximum number of seconds to wait for the listener. A worker process terminated while logging
+         can leave the queue locked, the listener is then abandoned.
+        """
+        if self.listener is not None:
+            self.queue.put(None)
+            self.listener.join(timeout)
+            self.listener = None
+
+    def get_logger(self, name, task=False):
+        """
+        :param task: if True, the logger is meant for the per-task messages, which are sampled and rate limited.
+        """
+        handler = logging.handlers.QueueHandler(self.queue) if self.queue is not None else self.handler
+        logger = get_logger(name, self.level, handler)
+        if task and (self.task_sample_rate < 1 or self.task_rate_limit):
+            logger.addFilter(TaskLogFilter(self.task_sample_rate, self.task_rate_limit))
+        return logger
+
+    def detached(self):
+        """
+        :return: a copy of the policy for workers that write their messages themselves (e.g. on another machine).
+        """
+        return LogPolicy(self.level, self.task_sample_rate, self.task_rate_limit)
+
+    def __getstate__(self):
+        # the handler and the listener stay in the main process
+        state = self.__dict__.copy()
+        state.update(handler=None, listener=None)
+        return state
+
+
 def preprocess_events(event_list):
+    """
+    Deprecated: builds the graph of the tasks of a workflow, with a vertex per task labelled with its arguments, which
+    grows with the number of tasks. Use :py:class:`taswor.export.GraphExport`, which aggregates it by node, instead.
+    """
+    warnings.warn("preprocess_events is deprecated, use taswor.export.GraphExport instead", DeprecationWarning,
+                  stacklevel=2)
+
     def get_label(node_name, args, kwargs):
         if not node_name:
             return None
@@ -49,9 +195,13 @@ def preprocess_events(event_list):
 
     nodes = {}
     edges = {}
+    first_node = None
 
     # get edges and nodes
     for event in event_list:
+        if first_node is None:
+            first_node = event.from_node
+
         current_node = event.from_node
         current_args = event.from_args
         current_kwargs = event.from_kwargs
@@ -85,7 +235,6 @@ def preprocess_events(event_list):
             }
 
     # color the start nodes in green
-    first_node = event_list[0].from_node
     for node in nodes:
         if node.startswith(first_node):
             nodes[node]["color"] = "green"
@@ -0,0 +1,36 @@
+"""
+Starts remote workers for a workflow created with ``executor="distributed"``, on any machine that can reach its broker
+and import the modules defining its node functions::
+
+    python -m taswor.worker host:port --authkey secret --workers 8
+"""
+import os
+import sys
+import argparse
+import multiprocessing
+
+from taswor.process.remote import run_worker, parse_address
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m taswor.worker", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("address", help="host:port of the broker")
+    parser.add_argument("--authkey", default=os.environ.get("TASWOR_AUTHKEY"),
+                        help="the authentication key of the workflow (default: $TASWOR_AUTHKEY)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args(argv)
+    if not args.authkey:
+        parser.error("the authentication key is required")
+
+    address = parse_address(args.address)
+    handles = [multiprocessing.Process(target=run_worker, args=(address, args.authkey.encode()))
+               for _ in range(args.workers)]
+    for handle in handles:
+        handle.start()
+    for handle in handles:
+        handle.join()
+    return 0 if all(handle.exitcode == 0 for handle in handles) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
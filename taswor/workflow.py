@@ -1,14 +1,28 @@
 import os
 import sys
 import json
-import shutil
-from multiprocessing import Queue, Event, Process, RLock, Manager
+import glob
+import pstats
+import logging
 import time
-import copy
+import shutil
+import cProfile
+import tempfile
+import itertools
 
-from taswor.util import Next, get_logger, preprocess_events
+from taswor.util import Next, LogPolicy, get_logger
 from taswor.node import Node
-from taswor.process.worker import worker_run
+from taswor.graph import Graph
+from taswor.checkpoint import Checkpoint
+from taswor.events import EventLog
+from taswor.export import GraphExport, write_ndjson, write_columns
+from taswor.metrics import read_metrics
+from taswor.storage import get_storage
+from taswor.process.worker import Worker
+from taswor.process.async_worker import AsyncWorker
+from taswor.process.executor import get_executor
+from taswor.process.seeder import Seeder
+from taswor.process.collector import JoinCollector
 
 
 class Workflow:
@@ -24,142 +38,367 @@ class Workflow:
 
     """
 
-    def __init__(self, *nodes, workers=os.cpu_count(), cache_url=None, storage_url=None):
-        self.nodes = nodes
-        self.queue = Queue()
-        self.queue_lock = RLock()
-        self.is_idle = [Event() for _ in range(workers)]
-        self.logger = get_logger("WorkflowMain")
+    RESULTS_POLL_INTERVAL = 0.05
+
+    def __init__(self, *nodes, workers=os.cpu_count(), cache_url=None, storage_url=None, batch_size=1, engine="sync",
+                 concurrency=100, executor="process", queue_size=None, high_water_mark=10000, profile=None,
+                 profiler=cProfile.Profile, log_level=logging.INFO, log_sample_rate=1.0, log_rate_limit=None,
+                 log_handler=None, broker_address="127.0.0.1:0", authkey=None, checkpoint=None, checkpoint_interval=1,
+                 scheduling="bfs", affinity=False, local_queue_size=1000, shared_memory_threshold=None,
+                 collect_results=False, pool=None):
+        """
+        :param nodes: the :py:class:`Node` instances that make up the workflow.
+        :param workers: the number of workers.
+        :param cache_url: the cache backend used for the node results, e.g. ``memory://?max_size=1000``,
+         ``sqlite:///tmp/cache.db`` or ``redis://127.0.0.1:6379/0``. See :py:func:`taswor.cache.get_cache`.
+        :param storage_url: the storage the nodes write to with :py:class:`taswor.storage.Storage`, e.g.
+         ``sqlite:///tmp/results.db`` or ``redis://127.0.0.1:6379/0``. See :py:func:`taswor.storage.get_storage`.
+        :param batch_size: the maximum number of tasks a worker takes from the queue at once. The children produced by
+         a worker are enqueued in batches of the same size. Larger batches mean less queue overhead for workflows with
+         many small tasks, at the expense of a less even distribution of the work.
+        :param engine: how the nodes are run inside a worker. ``"sync"`` runs one node at a time, ``"asyncio"`` runs
+         the nodes in an event loop, so that ``async def`` nodes doing I/O can run concurrently.
+        :param concurrency: with the ``"asyncio"`` engine, the maximum number of nodes in progress in each worker.
+        :param executor: where the workers run. ``"process"`` starts a process for every worker, ``"thread"`` a
+         thread and ``"inline"`` runs a single worker in the calling thread while waiting for the completion of the
+         workflow (the ``timeout`` of :py:func:`Workflow.wait_for_completion()` is then ignored). ``"distributed"``
+         starts a broker remote workers connect to, see :py:class:`taswor.process.executor.DistributedExecutor`.
+        :param queue_size: the maximum number of batches in the queue. By default the queue is unbounded. When it is
+         full, the workers process the children they produce themselves instead of enqueueing them.
+        :param high_water_mark: the start tasks are pulled from the ``init_generator`` of the start nodes only while
+         there are less than this many outstanding tasks.
+        :param profile: the names of the nodes to profile, or ``True`` to profile all of them. See
+         :py:func:`Workflow.profile_stats()`.
+        :param profiler: the profiler class, instantiated once per worker. It must have the ``enable()``,
+         ``disable()`` and ``dump_stats(path)`` methods of ``cProfile.Profile``, the default.
+        :param log_level: the level of the workflow and worker loggers. The messages about every single task are logged
+         at the ``DEBUG`` level.
+        :param log_sample_rate: the fraction of the per-task messages that are logged.
+        :param log_rate_limit: the maximum number of per-task messages logged per second by each worker.
+        :param log_handler: the ``logging.Handler`` all the messages are written by, from the main process. By default
+         they are written to stdout. See :py:class:`taswor.util.LogPolicy`.
+        :param broker_address: with the ``"distributed"`` executor, the ``host:port`` the broker listens on. The
+         default port 0 picks a free port.
+        :param authkey: with the ``"distributed"`` executor, the key the remote workers must authenticate with. A
+         random key is generated by default, which only the local workers know.
+        :param checkpoint: a directory the progress of the workflow is recorded to, so that it can be resumed with
+         :py:func:`Workflow.resume()` if it is interrupted. The workers must be able to reach it. See
+         :py:class:`taswor.checkpoint.Checkpoint`.
+        :param checkpoint_interval: how often, in seconds, the workers write their completed tasks to the checkpoint.
+        :param scheduling: the order the workers run the tasks they hold in, after the node priorities: ``"bfs"``
+         (breadth-first, first in first out) or ``"dfs"`` (depth-first, last in first out). Depth-first scheduling
+         implies ``affinity``, so the leaves complete early and the number of pending tasks stays bounded.
+        :param affinity: if ``True``, the tasks a worker produces are run by the same worker, unless other workers run
+         out of tasks. See :py:class:`taswor.process.worker.Worker`.
+        :param local_queue_size: with affinity, the number of tasks a worker holds before it shares the others.
+        :param shared_memory_threshold: with the ``"process"`` executor, the size in bytes from which the ``bytes``,
+         ``bytearray`` and NumPy arrays given to the tasks are passed to the workers through shared memory rather than
+         copied through the queue. See :py:class:`taswor.process.transport.SharedMemoryTransport`. Disabled by
+         default.
+        :param collect_results: if ``True``, the values returned by the leaf tasks are kept, to be read with
+         :py:func:`Workflow.results()`. By default they are thrown away.
+        :param pool: a :py:class:`taswor.process.pool.WorkerPool` whose processes run the workflow, instead of workers
+         started for it. ``workers`` and ``executor`` are then ignored, and ``queue_size`` and
+         ``shared_memory_threshold`` are not supported.
+        """
+        self.graph = Graph(nodes)
+        self.nodes = self.graph.nodes
+        # the arguments are checked before any resource is taken
+        if scheduling not in ("bfs", "dfs"):
+            raise RuntimeError("Unknown scheduling {}".format(scheduling))
+        if engine == "sync":
+            worker_class, worker_kwargs = Worker, {}
+        elif engine == "asyncio":
+            worker_class, worker_kwargs = AsyncWorker, {"concurrency": concurrency}
+        else:
+            raise RuntimeError("Unknown engine {}".format(engine))
+
+        self.log_policy = LogPolicy(log_level, log_sample_rate, log_rate_limit, log_handler)
+        self.logger = get_logger("WorkflowMain", log_level, self.log_policy.handler)
+        executor_options = {}
+        if executor == "distributed":
+            executor_options = {"address": broker_address, "authkey": authkey}
+        if pool is not None:
+            self.executor = pool.executor(self.log_policy)
+        else:
+            self.executor = get_executor(executor, workers, log_policy=self.log_policy, **executor_options)
+        # with a worker pool, takes a slot of the pool
+        self.queue = self.executor.create_queue(batch_size, queue_size or 0, shared_memory_threshold)
+        self.high_water_mark = high_water_mark
+        self.events = None
+        self.checkpoint = None
+        self.cache_url = cache_url
+        self.storage_url = storage_url
+        self.collect_results = collect_results
+        try:
+            self.log_policy.start(self.executor.context, self.executor.log_queue)
+            self.events = EventLog(tempfile.mkdtemp(prefix="taswor-events-"))
 
-        self.manager = Manager()
-        self.events = self.manager.list()
-        self.cache = self.manager.dict()
+            if not cache_url:
+                self.logger.warning("No cache backend supplied. Results will be cached in a separate in-memory LRU "
+                                    "cache for every worker")
+            if not storage_url:
+                self.logger.warning("No storage backend supplied. Storage usage inside the Node instances will be "
+                                    "ignored")
+            else:
+                # fails early on invalid urls, and creates the sqlite schema before the workers race to do it
+                get_storage(storage_url).close()
 
-        if not cache_url:
-            self.logger.warning("No cache backend supplied. Results will not be cached and may have a serious "
-                                "performance impact")
-        if not storage_url:
-            self.logger.warning("No storage backend supplied. Storage usage inside the Node instances will be ignored")
+            if checkpoint:
+                # the logs left by an interrupted run are folded into the snapshot before the workers read it
+                self.checkpoint = Checkpoint(checkpoint)
+                self.checkpoint.compact()
+                self.checkpoint.connect()
+                self.logger.info("Checkpoint %s holds %s completed tasks", checkpoint, len(self.checkpoint))
 
-        self.logger.info("Starting workers")
-        self.workers = [
-            Process(target=worker_run,
-                    args=(self.is_idle[i], self.queue, self.queue_lock, self.nodes, self.events, self.cache),
-                    name="worker-{}".format(i))
-            for i in range(workers)]
+            worker_kwargs["log_policy"] = self.log_policy
+            if profile:
+                worker_kwargs.update(profile=profile, profiler=profiler)
+            if checkpoint:
+                worker_kwargs.update(checkpoint=checkpoint, checkpoint_interval=checkpoint_interval)
+            if scheduling == "dfs" or affinity:
+                worker_kwargs.update(depth_first=scheduling == "dfs", affinity=True, local_queue_size=local_queue_size)
+            if collect_results:
+                worker_kwargs["collect_results"] = True
 
-        for worker in self.workers:
-            worker.start()
+            self.logger.info("Starting workers")
+            worker_args = (self.queue, self.graph, self.events.directory, self.cache_url, self.storage_url)
+            self.executor.start(worker_class, worker_args, worker_kwargs)
+            if executor == "distributed":
+                self.logger.info("Broker listening on %s:%s", *self.executor.address)
+            collector_logger = get_logger("Collector", self.log_policy.level, self.log_policy.handler)
+            self.collector = JoinCollector(self.queue, self.events, collector_logger)
+            self.executor.collect(self.collector)
+        except BaseException:
+            # gives back what was taken, such as the slot of the worker pool
+            self.executor.close(self.queue)
+            self.queue.close()
+            if self.checkpoint is not None:
+                self.checkpoint.close()
+            if self.events is not None:
+                shutil.rmtree(self.events.directory, ignore_errors=True)
+            self.log_policy.stop()
+            raise
 
-    def start(self, wait=False):
+    def start(self, wait=False, timeout=None):
         """
         Starts the processing of the registered nodes.
 
         :param wait: boolean that indicates if the call should be blocking or not. If ``True``, the function will
          return when no more processing can be done (all leaf nodes are processed).
+        :param timeout: when waiting, the maximum number of seconds to wait. See
+         :py:func:`Workflow.wait_for_completion()`.
         """
-        start_nodes = self._get_start_nodes()
+        seeder_logger = get_logger("Seeder", self.log_policy.level, self.log_policy.handler)
+        self.executor.seed(Seeder(self.queue, self.graph.start_nodes, self.high_water_mark, seeder_logger))
 
-        for node in start_nodes:
-            if not node.init_generator:
-                self.queue.put((node, (), {}))
-            else:
-                node_copy = copy.deepcopy(node)
-                node_copy.init_generator = None
-                for args, kwargs in node.init_generator:
-                    print(args, kwargs)
-                    self.queue.put((node_copy, args, kwargs))
+        if wait:
+            self.wait_for_completion(timeout)
+
+    def resume(self, wait=False, timeout=None):
+        """
+        Like :py:func:`Workflow.start()`, but only processes the work left by the runs recorded in the checkpoint: the
+        tasks they produced and never completed, and the tasks of the start nodes they did not complete. A task
+        produced several times is resumed once.
+
+        The checkpoint does not hold the values returned by the tasks, so :py:func:`Workflow.results()` only yields the
+        ones of the tasks run by this run, not the ones of the leaves completed by the previous runs.
+        """
+        if self.checkpoint is None:
+            raise RuntimeError("The workflow has no checkpoint to resume from")
+        start_tasks = (task for task in Seeder.generate(self.graph.start_nodes)
+                       if self.checkpoint.completed(task) is None)
+        tasks = itertools.chain(self.checkpoint.pending(), start_tasks)
+        seeder_logger = get_logger("Seeder", self.log_policy.level, self.log_policy.handler)
+        self.executor.seed(Seeder(self.queue, self.graph.start_nodes, self.high_water_mark, seeder_logger, tasks))
 
         if wait:
-            self.wait_for_completion()
+            self.wait_for_completion(timeout)
 
     def close(self):
         """
-        Terminates all child processes (workers and shared memory manager).
+        Stops all the workers and removes the event log.
         """
         self.logger.info("Closing all workers")
-        for worker in self.workers:
-            worker.terminate()
-            worker.join()
-
-        self.logger.info("All workers killed")
+        self.collector.close()
+        try:
+            self.executor.close(self.queue)
+        finally:
+            # the resources of the workflow are released even if a worker could not be closed cleanly
+            self.queue.close()
+            self.logger.info("All workers killed")
+            if self.checkpoint is not None:
+                self.checkpoint.close()
+                self.checkpoint.compact()
+            shutil.rmtree(self.events.directory, ignore_errors=True)
+            self.log_policy.stop()
 
         self.logger.info("Terminating")
 
-    def wait_for_completion(self):
+    def wait_for_completion(self, timeout=None):
         """
         Blocks until all tasks are processed.
+
+        :param timeout: maximum number of seconds to wait. ``None`` means waiting until the workflow is finished.
+        :return: ``True`` if the workflow finished, ``False`` if the timeout expired first.
         """
         self.logger.debug("Waiting for completion")
-        finished = False
-        while not finished:
-            if self._all_workers_are_idle():
-                self.logger.info("Finished")
-                finished = True
+        self.executor.run_pending()
+        finished = self.queue.join(timeout)
+        if finished:
+            self.logger.info("Finished")
+        else:
+            self.logger.warning("Timed out while waiting for completion")
+        return finished
+
+    def results(self, timeout=None):
+        """
+        Yields the values returned by the leaf tasks of the workflow as they are completed, until the workflow
+        completes: the values other than ``None``, ``Next`` and lists of ``Next``, except the ones of the tasks of join
+        branches, which are given to their join node. The workflow must be created with ``collect_results``.
+
+        The values are read from the files the workers write them to, so they can be read again, in the same order, as
+        long as the workflow is not closed. With the ``"inline"`` executor, the workflow runs to completion first.
+        After :py:func:`Workflow.resume()`, the results are partial: the leaves completed before the interruption are
+        not run again, and their values are not recorded in the checkpoint.
+
+        :param timeout: maximum number of seconds to wait for the completion of the workflow. ``None`` means waiting
+         until the workflow is finished.
+        """
+        if not self.collect_results:
+            raise RuntimeError("The results are not collected, create the workflow with collect_results=True")
+        self.executor.run_pending()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        tail = self.events.tail("results")
+        try:
+            while True:
+                # the workers write the results of their tasks before marking them as done
+                finished = self.queue.join(self.RESULTS_POLL_INTERVAL)
+                yield from tail.read()
+                if finished or (deadline is not None and time.monotonic() >= deadline):
+                    break
+        finally:
+            tail.close()
+
+    def open_storage(self):
+        """
+        Opens the storage of the workflow in the calling process, e.g. to read the results once the workflow has
+        completed. The caller must close it.
+
+        :return: a :py:class:`taswor.storage.StorageBackend`, or ``None`` if the workflow has no storage.
+        """
+        return get_storage(self.storage_url)
+
+    def metrics(self):
+        """
+        Aggregates the metrics measured by all the workers: counters and histograms of the calls, cache hits and
+        misses, errors, execution time, queue wait time, latency and serialization time of every node. The workers
+        write their metrics about every second, and as soon as they run out of tasks. The workflow only completes once
+        they are written, so the metrics are complete then.
+
+        :return: a dict mapping node names to :py:class:`taswor.metrics.NodeMetrics`. Their ``to_dict()`` method
+         returns plain counters and percentiles, which can be dumped as JSON.
+        """
+        return read_metrics(self.events.directory)
+
+    def profile_stats(self):
+        """
+        Merges the profiles of the nodes selected by the ``profile`` parameter. The workers write their profile when
+        they run out of tasks, so the stats are complete once the workflow has completed.
+
+        :return: a ``pstats.Stats`` instance, or ``None`` if no profile was written.
+        """
+        paths = sorted(glob.glob(os.path.join(self.events.directory, "*.prof")))
+        if not paths:
+            return None
+        return pstats.Stats(*paths)
 
     def dump_result_as_json(self, filename):
         """
         Writes the result to a file in JSON format.
         :param filename: The name or path of the file in which the results will be stored.
         """
-        import json
         with open(filename, "w") as out:
-            data = {"raport": [x.to_dict() for x in self.events]}
-            json.dump(data, out, indent=4, sort_keys=True)
+            out.write('{\n    "raport": [')
+            separator = "\n        "
+            for event in self.events:
+                out.write(separator)
+                out.write(json.dumps(event.to_dict(), sort_keys=True))
+                separator = ",\n        "
+            out.write("\n    ]\n}\n")
 
-    def dump_result_as_html(self, directory):
+    def dump_result_as_ndjson(self, filename, compress=None):
+        """
+        Writes the result to a file in newline-delimited JSON, an event per line, as the events are read from the
+        workers' logs. Read it back with :py:func:`taswor.export.read_ndjson()`.
+
+        :param compress: whether the file is compressed with gzip. By default it is if the name ends with ``.gz``.
+        :return: the number of events written.
+        """
+        return write_ndjson(self.events, filename, compress)
+
+    def dump_result_as_columns(self, filename, args=True, group_size=65536):
+        """
+        Writes the result to a file in a compact binary format with a column per field, for analytics (see
+        :py:class:`taswor.export.ColumnarWriter`). Read it back with :py:func:`taswor.export.read_columns()`.
+
+        :param args: whether the arguments of the tasks are written.
+        :param group_size: the number of events written at a time.
+        :return: the number of events written.
+        """
+        return write_columns(self.events, filename, group_size, args)
+
+    def dump_result_as_html(self, directory, detail=(), chunk_size=10000):
         """
         Dumps the processing result to a directory in which the index.html file will contain the graph visualisation of
-        the whole process
-        :param directory:
-        :return:
+        the whole process: a vertex per node, with its call counts, durations and errors, and an edge per pair of nodes
+        with the number of tasks the first produced for the second. The events are read in a single pass. See
+        :py:class:`taswor.export.GraphExport`.
+
+        :param directory: the directory to create. It is replaced if it exists.
+        :param detail: the names of the nodes whose tasks can be listed in the report, or ``True`` for all of them.
+        :param chunk_size: the number of tasks per file loaded by the report.
         """
         template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "html")
         if os.path.exists(directory):
             shutil.rmtree(directory)
         shutil.copytree(template_dir, directory)
 
-        def get_label(node_name, args, kwargs):
-            args = [str(arg) for arg in args]
-            kwargs = {k: str(v) for k, v in kwargs.items()}
-            arguments = ", ".join(args + ["{}={}".format(k, v) for k, v in kwargs.items()])
-            return node_name + " (" + arguments + ")"
-
-        data = {
-            "nodes": {},
-            "edges": {}
-        }
-
-        nodes, edges = preprocess_events(self.events)
-        data["nodes"] = nodes
-        data["edges"] = edges
-
-        with open(os.path.join(directory, "data.json"), "w") as data_json:
-            data_json.write("var data = ")
-            data_json.write(json.dumps(data, indent=4))
-            data_json.write(";")
-
-    def _get_start_nodes(self):
-        return [node for node in self.nodes if node.start]
-
-    def _all_workers_are_idle(self):
-        time.sleep(1)
-        x = [event.is_set() for event in self.is_idle]
-        return all(x)
+        export = GraphExport(self.graph, os.path.join(directory, "data"), self.metrics(), detail, chunk_size)
+        export.add_all(self.events).close()
 
 
-def node(start=False, init_args=None, use_cache=True):
+def node(start=False, init_args=None, use_cache=True, cache_key=None, batch_size=None, max_wait=0, batch_numpy=False,
+         successors=None, retries=0, backoff=0, timeout=None, priority=0, single_flight=False):
     """
     Decorator for defining a valid Node body.
 
     :param start: if True, the node will be treated as a starting node and will be processed first.
     :param init_args: A list of tuples of (tuple, dict) representing the ``args`` and ``kwargs`` for the current \
     start node. If not given, the start node will be processed with no arguments.
-    :param use_cache: ``NotImplemented``
+    :param use_cache: if False, the results of the node will never be cached.
+    :param cache_key: optional callable receiving the node arguments and returning the value from which the cache key \
+    is derived (e.g. ``lambda image, options: image.path``). By default all the arguments are used.
+    :param batch_size: turns the node into a batch node, resolving up to ``batch_size`` invocations with a single \
+    call. The function receives a list of values for every argument and returns a list of results. See \
+    :py:class:`taswor.node.Node`.
+    :param max_wait: the maximum number of seconds an invocation of a batch node waits for its batch to fill up.
+    :param batch_numpy: if True, a batch node receives NumPy arrays instead of lists.
+    :param successors: optional names of the nodes the node may emit a ``Next`` to, validated when the workflow is \
+    created.
+    :param retries: the number of times a failed call is retried.
+    :param backoff: the number of seconds before the first retry, doubled for every following retry.
+    :param timeout: the maximum number of seconds a call may last. See :py:class:`taswor.node.Node`.
+    :param priority: the tasks of nodes with a higher priority are run first by the workers holding them.
+    :param single_flight: if True, a task identical to one in flight waits for its cached result instead of being run. \
+    See :py:class:`taswor.node.Node`.
     """
 
     def decorator(func):
-        node = Node(name=func.__name__, func=func, start=start, init_generator=init_args, use_cache=use_cache)
+        node = Node(name=func.__name__, func=func, start=start, init_generator=init_args, use_cache=use_cache,
+                    cache_key=cache_key, batch_size=batch_size, max_wait=max_wait, batch_numpy=batch_numpy,
+                    successors=successors, retries=retries, backoff=backoff, timeout=timeout, priority=priority,
+                    single_flight=single_flight)
         func.node = node
         return func
 
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import threading
+import unittest
+
+from taswor import Next, Workflow, node
+
+running = [0, 0]
+running_lock = threading.Lock()
+
+
+@node(start=True, init_args=[((i,), {}) for i in range(20)], use_cache=False)
+async def fetch(i):
+    with running_lock:
+        running[0] += 1
+        running[1] = max(running)
+    await asyncio.sleep(0.2)
+    with running_lock:
+        running[0] -= 1
+    return Next("parse", i)
+
+
+@node(use_cache=False)
+def parse(i):
+    return i * 2
+
+
+class AsyncEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        running[:] = [0, 0]
+
+    def run_workflow(self, executor, concurrency):
+        workflow = Workflow(fetch.node, parse.node, executor=executor, engine="asyncio", workers=1,
+                            concurrency=concurrency, collect_results=True, log_level=logging.CRITICAL)
+        try:
+            workflow.start()
+            return sorted(workflow.results(timeout=30))
+        finally:
+            workflow.close()
+
+    def test_async_nodes_run_concurrently(self):
+        for executor in ("inline", "thread"):
+            with self.subTest(executor=executor):
+                running[:] = [0, 0]
+                self.assertEqual(self.run_workflow(executor, concurrency=100), [i * 2 for i in range(20)])
+                self.assertGreater(running[1], 1)
+
+    def test_concurrency_is_limited(self):
+        self.assertEqual(self.run_workflow("inline", concurrency=3), [i * 2 for i in range(20)])
+        self.assertEqual(running[1], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import logging
+import unittest
+
+from taswor import Next, Workflow, node
+
+batches = []
+
+
+@node(start=True, init_args=[((i,), {}) for i in range(10)], use_cache=False)
+def emit(i):
+    return Next("square", i, offset=100)
+
+
+@node(use_cache=False, batch_size=4)
+def square(values, offset):
+    batches.append(len(values))
+    return [value * value + extra for value, extra in zip(values, offset)]
+
+
+@node(start=True, init_args=[((i,), {}) for i in range(3)], use_cache=False, batch_size=3)
+def truncate(values):
+    return values[1:]
+
+
+class BatchNodeTest(unittest.TestCase):
+
+    def setUp(self):
+        del batches[:]
+
+    def run_workflow(self, *nodes, **kwargs):
+        workflow = Workflow(*nodes, executor="inline", collect_results=True, log_level=logging.CRITICAL, **kwargs)
+        try:
+            workflow.start()
+            results = sorted(workflow.results(timeout=30))
+            errors = [event.error for event in workflow.events if event.error]
+        finally:
+            workflow.close()
+        return results, errors
+
+    def test_invocations_are_resolved_in_batches(self):
+        for engine in ("sync", "asyncio"):
+            with self.subTest(engine=engine):
+                del batches[:]
+                results, errors = self.run_workflow(emit.node, square.node, engine=engine, batch_size=10)
+                self.assertEqual(results, [i * i + 100 for i in range(10)])
+                self.assertEqual(errors, [])
+                self.assertEqual(sum(batches), 10)
+                self.assertLess(len(batches), 10)
+                self.assertLessEqual(max(batches), 4)
+
+    def test_batch_with_missing_results_fails_all_its_invocations(self):
+        results, errors = self.run_workflow(truncate.node, batch_size=3)
+        self.assertEqual(results, [])
+        self.assertEqual(errors, ["Batch node truncate must return a list of 3 results"] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
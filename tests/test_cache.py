@@ -0,0 +1,102 @@
+import os
+import logging
+import shutil
+import tempfile
+import unittest
+
+from taswor import Workflow, node
+from taswor.cache import get_cache, make_key
+
+
+def key_of(x):
+    if x == 1:
+        raise ValueError("no key for 1")
+    return x
+
+
+@node(start=True, init_args=[((x,), {}) for x in range(3)], cache_key=key_of)
+def double(x):
+    return x * 2
+
+
+class SqliteCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get_cache(self, query=""):
+        return get_cache("sqlite:///" + os.path.join(self.directory, "cache.db") + query)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self.get_cache("?max_size=20")
+        for i in range(20):
+            cache.set(str(i), i)
+        # read before the newer entries are added
+        self.assertEqual(cache.get("0"), 0)
+        for i in range(20, 30):
+            cache.set(str(i), i)
+        self.assertEqual(len(cache), 20)
+        self.assertEqual(cache.get("0"), 0)
+        self.assertIsNone(cache.get("10"))
+        self.assertEqual(cache.get("11"), 11)
+        cache.close()
+
+    def test_unbounded_cache(self):
+        cache = self.get_cache()
+        for i in range(100):
+            cache.set(str(i), i)
+        self.assertEqual(len(cache), 100)
+        self.assertEqual(cache.get("0"), 0)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 0, "size": 100})
+        cache.close()
+
+    def test_expired_entries_are_missed(self):
+        cache = self.get_cache("?ttl=0.01")
+        cache.set("key", "value")
+        self.assertEqual(cache.get("key"), "value")
+        cache.connection.execute("UPDATE cache SET expires = 0")
+        self.assertIsNone(cache.get("key"))
+        cache.close()
+
+
+class MakeKeyTest(unittest.TestCase):
+
+    def test_key_does_not_depend_on_ordering(self):
+        self.assertEqual(make_key({"a": 1, "b": [1, 2]}), make_key({"b": [1, 2], "a": 1}))
+        self.assertEqual(make_key({"x", "y", "z"}), make_key({"z", "x", "y"}))
+        self.assertEqual(make_key(frozenset([1, 2])), make_key(frozenset([2, 1])))
+
+    def test_values_of_different_types_have_different_keys(self):
+        keys = [make_key(value) for value in (1, 1.0, "1", b"1", True, (1,), [1], {1}, None, 0.1 + 0.2, 0.3)]
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertNotEqual(make_key("ab", "c"), make_key("a", "bc"))
+
+    def test_key_has_a_fixed_size(self):
+        self.assertEqual(len(make_key()), 32)
+        self.assertEqual(len(make_key(b"x" * 1000000, list(range(1000)))), 32)
+        self.assertEqual(make_key(bytearray(b"data")), make_key(b"data"))
+
+
+class CacheKeyTest(unittest.TestCase):
+
+    def test_failing_cache_key_fails_the_task(self):
+        for executor, engine in (("inline", "sync"), ("inline", "asyncio"), ("thread", "sync"), ("process", "sync")):
+            with self.subTest(executor=executor, engine=engine):
+                workflow = Workflow(double.node, executor=executor, engine=engine, workers=2, collect_results=True,
+                                    log_level=logging.CRITICAL)
+                try:
+                    workflow.start()
+                    results = sorted(workflow.results(timeout=30))
+                    errors = [(event.from_node, event.from_args, event.error) for event in workflow.events
+                              if event.error]
+                finally:
+                    workflow.close()
+                self.assertEqual(results, [0, 4])
+                self.assertEqual(errors, [("double", (1,), "no key for 1")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import logging
+import shutil
+import tempfile
+import threading
+import unittest
+
+from taswor import Next, Workflow, node
+
+calls = []
+calls_lock = threading.Lock()
+failing = set()
+
+
+@node(start=True, init_args=[((n,), {}) for n in range(5)], use_cache=False)
+def fetch(n):
+    with calls_lock:
+        calls.append(("fetch", n))
+    return Next("parse", n)
+
+
+@node(use_cache=False)
+def parse(n):
+    with calls_lock:
+        calls.append(("parse", n))
+    if n in failing:
+        raise ValueError("parse {} failed".format(n))
+    return n * 10
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def tearDown(self):
+        del calls[:]
+        failing.clear()
+
+    def run_workflow(self, executor, checkpoint, resume=False):
+        workflow = Workflow(fetch.node, parse.node, executor=executor, workers=2, checkpoint=checkpoint,
+                            collect_results=True, log_level=logging.CRITICAL)
+        try:
+            if resume:
+                workflow.resume()
+            else:
+                workflow.start()
+            return sorted(workflow.results(timeout=30))
+        finally:
+            workflow.close()
+
+    def test_resume_runs_only_the_remaining_tasks(self):
+        for executor in ("inline", "thread"):
+            with self.subTest(executor=executor):
+                checkpoint = tempfile.mkdtemp()
+                self.addCleanup(shutil.rmtree, checkpoint, ignore_errors=True)
+                failing.update((1, 3))
+                self.assertEqual(self.run_workflow(executor, checkpoint), [0, 20, 40])
+                self.assertEqual(len(calls), 10)
+
+                failing.clear()
+                del calls[:]
+                # the results of the leaves completed before the interruption are not yielded again
+                self.assertEqual(self.run_workflow(executor, checkpoint, resume=True), [10, 30])
+                self.assertEqual(sorted(calls), [("parse", 1), ("parse", 3)])
+
+                del calls[:]
+                self.assertEqual(self.run_workflow(executor, checkpoint, resume=True), [])
+                self.assertEqual(calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
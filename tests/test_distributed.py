@@ -0,0 +1,52 @@
+import os
+import sys
+import logging
+import subprocess
+import unittest
+
+from taswor import Next, Workflow, node
+
+
+@node(start=True, init_args=[((i,), {}) for i in range(10)], use_cache=False)
+def split(i):
+    return [Next("multiply", i, 2), Next("multiply", i, 3)]
+
+
+@node(use_cache=False)
+def multiply(i, factor):
+    return i * factor, os.getpid()
+
+
+class DistributedExecutorTest(unittest.TestCase):
+
+    def run_workflow(self, workers, remote_workers=0):
+        workflow = Workflow(split.node, multiply.node, executor="distributed", workers=workers, authkey="secret",
+                            collect_results=True, log_level=logging.CRITICAL)
+        remote = None
+        try:
+            workflow.start()
+            if remote_workers:
+                remote = subprocess.Popen(
+                    [sys.executable, "-m", "taswor.worker", "{}:{}".format(*workflow.executor.address), "--authkey",
+                     "secret", "--workers", str(remote_workers)],
+                    cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            results = list(workflow.results(timeout=60))
+            self.assertTrue(workflow.wait_for_completion(0))
+            errors = [event.error for event in workflow.events if event.error]
+        finally:
+            workflow.close()
+            if remote is not None:
+                self.assertEqual(remote.wait(30), 0)
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(value for value, _ in results), sorted(i * f for i in range(10) for f in (2, 3)))
+        return {pid for _, pid in results}
+
+    def test_local_workers(self):
+        self.assertNotIn(os.getpid(), self.run_workflow(2))
+
+    def test_remote_workers(self):
+        self.assertNotIn(os.getpid(), self.run_workflow(0, remote_workers=2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import logging
+import shutil
+import tempfile
+import threading
+import unittest
+
+from taswor import Next, Workflow, node
+from taswor.events import EventLog, FileEventSink
+
+
+@node(start=True, init_args=[((2,), {})], use_cache=False)
+def split(n):
+    return [Next("check", i) for i in range(n)]
+
+
+@node(use_cache=False)
+def check(i):
+    if i:
+        raise ValueError("bad {}".format(i))
+    return "ok"
+
+
+class EventLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.event_log = EventLog(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def record(self, i):
+        return ("a", (i,), {}, None, None, None, 0.0, None, False)
+
+    def test_events_of_all_the_workers_are_merged(self):
+        for name in ("1", "2"):
+            sink = FileEventSink(self.event_log.open(name), flush_size=2)
+            for i in range(3):
+                sink.append(self.record(i))
+            sink.close()
+        self.assertEqual(sorted(event.from_args for event in self.event_log), [(0,), (0,), (1,), (1,), (2,), (2,)])
+
+    def test_partial_record_is_ignored(self):
+        sink = FileEventSink(self.event_log.open("1"))
+        sink.append(self.record(0))
+        sink.close()
+        with self.event_log.open("1") as events_file:
+            events_file.write(b"\x80\x05partial")
+        self.assertEqual([event.from_args for event in self.event_log], [(0,)])
+
+    def test_fields_that_can_not_be_pickled_are_written_as_their_repr(self):
+        sink = FileEventSink(self.event_log.open("1"))
+        sink.append(self.record(threading.Lock()))
+        sink.close()
+        event, = self.event_log
+        self.assertIsInstance(event.from_args, str)
+        self.assertIn("lock", event.from_args)
+
+    def test_tail_yields_the_new_records(self):
+        tail = self.event_log.tail("results")
+        sink = FileEventSink(self.event_log.open("1", "results"))
+        sink.append(1)
+        sink.flush()
+        self.assertEqual(list(tail.read()), [1])
+        sink.append(2)
+        sink.flush()
+        other = FileEventSink(self.event_log.open("2", "results"))
+        other.append(3)
+        other.close()
+        self.assertEqual(list(tail.read()), [2, 3])
+        self.assertEqual(list(tail.read()), [])
+        sink.close()
+        tail.close()
+
+
+class WorkflowEventsTest(unittest.TestCase):
+
+    def test_edges_of_the_execution(self):
+        for executor in ("process", "thread", "inline"):
+            with self.subTest(executor=executor):
+                workflow = Workflow(split.node, check.node, executor=executor, workers=2, log_level=logging.CRITICAL)
+                try:
+                    workflow.start(wait=True)
+                    events = [(event.from_node, event.from_args, event.to_node, event.to_args, event.error)
+                              for event in workflow.events]
+                finally:
+                    workflow.close()
+                self.assertCountEqual(events, [("split", (2,), "check", (0,), None),
+                                               ("split", (2,), "check", (1,), None),
+                                               ("check", (0,), None, None, None),
+                                               ("check", (1,), None, None, "bad 1")])
+
+
+if __name__ == "__main__":
+    unittest.main()
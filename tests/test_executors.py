@@ -0,0 +1,86 @@
+import os
+import logging
+import threading
+import unittest
+from unittest import mock
+
+from taswor import Next, Workflow, node
+from taswor.node import Node
+
+
+def visit(x, lock):
+    if x < 3:
+        return Next("visit", x + 1, lock)
+    return x
+
+
+@node(start=True, init_args=[((i,), {}) for i in range(4)], use_cache=False)
+def where(i):
+    return os.getpid(), threading.get_ident()
+
+
+class ExecutorTest(unittest.TestCase):
+
+    def run_workflow(self, executor, use_cache):
+        lock = threading.Lock()
+        nodes = [Node(visit, "visit", start=True, use_cache=use_cache, init_generator=[((0, lock), {})])]
+        workflow = Workflow(*nodes, executor=executor, workers=2, collect_results=True, log_level=logging.CRITICAL)
+        try:
+            workflow.start()
+            results = list(workflow.results(timeout=30))
+            self.assertTrue(workflow.wait_for_completion(0))
+            events = [(event.from_node, event.to_node, event.error) for event in workflow.events]
+        finally:
+            workflow.close()
+        return results, events
+
+    def test_where_the_workers_run(self):
+        for executor in ("inline", "thread", "process"):
+            with self.subTest(executor=executor):
+                workflow = Workflow(where.node, executor=executor, workers=2, collect_results=True,
+                                    log_level=logging.CRITICAL)
+                try:
+                    workflow.start()
+                    results = list(workflow.results(timeout=30))
+                finally:
+                    workflow.close()
+                self.assertEqual(len(results), 4)
+                pids = {pid for pid, _ in results}
+                threads = {thread for _, thread in results}
+                if executor == "process":
+                    self.assertNotIn(os.getpid(), pids)
+                else:
+                    self.assertEqual(pids, {os.getpid()})
+                    self.assertEqual(threads == {threading.get_ident()}, executor == "inline")
+
+    def test_unknown_executor(self):
+        with self.assertRaises(RuntimeError):
+            Workflow(where.node, executor="fibers", log_level=logging.CRITICAL)
+
+    def test_arguments_that_can_not_be_pickled(self):
+        for executor in ("inline", "thread"):
+            with self.subTest(executor=executor):
+                results, events = self.run_workflow(executor, use_cache=False)
+                self.assertEqual(results, [3])
+                self.assertCountEqual(events, [("visit", "visit", None)] * 3 + [("visit", None, None)])
+
+    def test_cache_key_of_arguments_that_can_not_be_pickled(self):
+        for executor in ("inline", "thread"):
+            with self.subTest(executor=executor):
+                results, events = self.run_workflow(executor, use_cache=True)
+                # the cache key of the task can not be derived
+                self.assertEqual(results, [])
+                self.assertEqual(events, [("visit", None, "cannot pickle '_thread.lock' object")])
+
+    def test_close_cleans_up_when_the_worker_can_not_be_closed(self):
+        nodes = [Node(visit, "visit", start=True, use_cache=False, init_generator=[((3, None), {})])]
+        workflow = Workflow(*nodes, executor="inline", log_level=logging.CRITICAL)
+        workflow.start(wait=True)
+        with mock.patch.object(workflow.executor.worker, "close", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                workflow.close()
+        self.assertFalse(os.path.exists(workflow.events.directory))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import json
+import logging
+import shutil
+import tempfile
+import unittest
+
+from taswor import Next, Workflow, node
+from taswor.export import GraphExport, read_columns, read_ndjson
+from taswor.util import preprocess_events
+
+
+@node(start=True, init_args=[((3,), {})], use_cache=False)
+def split(n):
+    return [Next("check", i, label="x" * 300) for i in range(n)]
+
+
+@node(use_cache=False)
+def check(i, label):
+    if i:
+        raise ValueError("bad")
+    return i
+
+
+def read_script(path, prefix):
+    with open(path) as script:
+        content = script.read()
+    return json.loads(content[len(prefix):-len(");\n")])
+
+
+class GraphExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.workflow = Workflow(split.node, check.node, executor="inline", log_level=logging.CRITICAL)
+        self.workflow.start(wait=True)
+
+    def tearDown(self):
+        self.workflow.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_graph_is_aggregated_by_node(self):
+        export = GraphExport(self.workflow.graph, self.directory, self.workflow.metrics(), detail=["check"],
+                             chunk_size=2, label_size=20)
+        export.add_all(self.workflow.events).close()
+        summary = read_script(os.path.join(self.directory, "summary.js"), "report.summary(")
+        split_summary, check_summary = summary["nodes"]
+        self.assertEqual((split_summary["name"], split_summary["start"], split_summary["events"]), ("split", True, 3))
+        self.assertEqual((check_summary["events"], check_summary["errors"], check_summary["calls"]), (3, 2, 3))
+        self.assertEqual(check_summary["error_messages"], [["bad", 2]])
+        self.assertEqual(summary["edges"], [[0, 1, 3]])
+        # only the tasks of the detail nodes are written, in chunks
+        self.assertEqual(split_summary["chunks"], [])
+        self.assertEqual(check_summary["chunks"], ["node-1-0.js", "node-1-1.js"])
+        chunk = read_script(os.path.join(self.directory, "node-1-0.js"), "report.chunk(1, 0, ")
+        self.assertEqual(len(chunk["tasks"]), 2)
+        self.assertTrue(all(len(label) <= 20 for label in chunk["labels"]))
+
+    def test_html_report(self):
+        report = os.path.join(self.directory, "report")
+        self.workflow.dump_result_as_html(report)
+        self.assertTrue(os.path.exists(os.path.join(report, "index.html")))
+        self.assertTrue(os.path.exists(os.path.join(report, "data", "summary.js")))
+        self.assertFalse(os.path.exists(os.path.join(report, "data", "node-0-0.js")))
+
+    def test_preprocess_events_is_deprecated(self):
+        with self.assertWarns(DeprecationWarning):
+            nodes, edges = preprocess_events(list(self.workflow.events))
+        self.assertEqual(len(nodes), 4)
+        self.assertEqual(len(edges), 1)
+
+
+class DumpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.workflow = Workflow(split.node, check.node, executor="inline", log_level=logging.CRITICAL)
+        self.workflow.start(wait=True)
+        self.events = sorted(self.fields(event) for event in self.workflow.events)
+
+    def tearDown(self):
+        self.workflow.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def fields(self, event):
+        return (event.from_node, list(event.from_args), event.to_node, list(event.to_args or []), event.error,
+                event.cached)
+
+    def test_json(self):
+        path = os.path.join(self.directory, "result.json")
+        self.workflow.dump_result_as_json(path)
+        with open(path) as dump:
+            report = json.load(dump)["raport"]
+        self.assertEqual(sorted((event["from_node"], event["from_args"], event["to_node"], event["to_args"] or [],
+                                 event["error"], event["cached"]) for event in report), self.events)
+
+    def test_ndjson(self):
+        for name in ("result.ndjson", "result.ndjson.gz"):
+            with self.subTest(name=name):
+                path = os.path.join(self.directory, name)
+                self.assertEqual(self.workflow.dump_result_as_ndjson(path), 6)
+                self.assertEqual(sorted(self.fields(event) for event in read_ndjson(path)), self.events)
+
+    def test_columns(self):
+        path = os.path.join(self.directory, "result.columns")
+        self.assertEqual(self.workflow.dump_result_as_columns(path, group_size=4), 6)
+        columns = read_columns(path, args=True)
+        self.assertEqual(len(columns), 6)
+        self.assertEqual(sorted(self.fields(event) for event in columns), self.events)
+        # the arguments can be skipped when reading
+        columns = read_columns(path)
+        self.assertIsNone(columns.args)
+        self.assertEqual([columns.string(index) for index in columns.error].count("bad"), 2)
+
+    def test_columns_without_arguments(self):
+        path = os.path.join(self.directory, "result.columns")
+        self.workflow.dump_result_as_columns(path, args=False)
+        events = list(read_columns(path, args=True))
+        self.assertEqual(len(events), 6)
+        self.assertTrue(all(event.from_args is None for event in events))
+
+    def test_not_a_columnar_dump(self):
+        path = os.path.join(self.directory, "result.json")
+        self.workflow.dump_result_as_json(path)
+        with self.assertRaises(RuntimeError):
+            read_columns(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
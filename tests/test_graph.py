@@ -0,0 +1,58 @@
+import logging
+import unittest
+
+from taswor import Next, Workflow
+from taswor.graph import Graph
+from taswor.node import Node
+
+
+def start(n):
+    return [Next("done", n), Next("missing", n)]
+
+
+def done(n):
+    return n
+
+
+class GraphTest(unittest.TestCase):
+
+    def test_invalid_graphs_are_rejected(self):
+        for nodes, message in (
+                ([], "The workflow has no start node"),
+                ([Node(done, "done")], "The workflow has no start node"),
+                ([Node(start, "start", start=True), Node(done, "start")], "Multiple nodes with name start registered"),
+                ([Node(start, "start", start=True, successors=["done", "nowhere"]), Node(done, "done")],
+                 "Node start declares the unknown successor nowhere"),
+                ([start], "is not a Node")):
+            with self.subTest(message=message):
+                with self.assertRaisesRegex(RuntimeError, message):
+                    Graph(nodes)
+
+    def test_routing(self):
+        start_node = Node(start, "start", start=True, successors=["start"])
+        done_node = Node(done, "done")
+        graph = Graph([start_node, done_node])
+        self.assertEqual(graph.start_nodes, [start_node])
+        self.assertIs(graph.route(done_node, Next("start", 1)), start_node)
+        self.assertIs(graph.route(start_node, Next("start", 1)), start_node)
+        with self.assertRaisesRegex(RuntimeError, "Node done is not a declared successor of start"):
+            graph.route(start_node, Next("done", 1))
+        with self.assertRaisesRegex(RuntimeError, "No node with name missing registered"):
+            graph["missing"]
+
+    def test_next_to_an_unknown_node_fails_the_task(self):
+        nodes = [Node(start, "start", start=True, use_cache=False, init_generator=[((1,), {})]),
+                 Node(done, "done", use_cache=False)]
+        workflow = Workflow(*nodes, executor="inline", collect_results=True, log_level=logging.CRITICAL)
+        try:
+            workflow.start()
+            results = list(workflow.results(timeout=30))
+            errors = [event.error for event in workflow.events if event.error]
+        finally:
+            workflow.close()
+        self.assertEqual(results, [1])
+        self.assertEqual(errors, ["No node with name missing registered"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import logging
+import shutil
+import tempfile
+import unittest
+
+from taswor import Join, Next, Workflow, node
+from taswor.events import EventLog
+from taswor.process.collector import JoinCollector
+from taswor.process.task_queue import TaskQueue, ThreadContext
+
+
+@node(start=True, init_args=[((n,), {}) for n in range(1, 6)], use_cache=False)
+def split(n):
+    return Join("total", [Next("square", i) for i in range(n)], n)
+
+
+@node(use_cache=False)
+def square(i):
+    if i == 3:
+        return [Next("halve", i), Next("halve", i + 1)]
+    return i * i
+
+
+@node(use_cache=False)
+def halve(i):
+    return i / 2
+
+
+@node(use_cache=False)
+def total(results, n):
+    return n, results
+
+
+@node(start=True, init_args=[((n,), {}) for n in range(3)], use_cache=False)
+def split_failing(n):
+    return Join("total", [Next("fail_on", i, n) for i in range(3)], n)
+
+
+@node(use_cache=False)
+def fail_on(i, n):
+    if i == n:
+        raise ValueError("branch {} failed".format(i))
+    return i
+
+
+class JoinTest(unittest.TestCase):
+
+    def run_workflow(self, *nodes, **kwargs):
+        workflow = Workflow(*nodes, workers=2, collect_results=True, log_level=logging.CRITICAL, **kwargs)
+        try:
+            workflow.start()
+            results = sorted(workflow.results(timeout=30))
+            errors = [event for event in workflow.events if event.error]
+        finally:
+            workflow.close()
+        return results, errors
+
+    def test_join_node_receives_the_results_of_the_branches(self):
+        expected = [(n, [i * i if i != 3 else [1.5, 2.0] for i in range(n)]) for n in range(1, 6)]
+        for executor in ("inline", "thread"):
+            for engine in ("sync", "asyncio"):
+                with self.subTest(executor=executor, engine=engine):
+                    results, errors = self.run_workflow(split.node, square.node, halve.node, total.node,
+                                                        executor=executor, engine=engine)
+                    self.assertEqual(results, expected)
+                    self.assertEqual(errors, [])
+
+    def test_failed_branch_fails_the_join(self):
+        for executor in ("inline", "thread"):
+            with self.subTest(executor=executor):
+                results, errors = self.run_workflow(split_failing.node, fail_on.node, total.node, executor=executor)
+                # the join of n = 0..2 fails as its branch n does
+                self.assertEqual(results, [])
+                self.assertEqual(sorted((event.from_node, event.from_args) for event in errors),
+                                 [("fail_on", (0, 0)), ("fail_on", (1, 1)), ("fail_on", (2, 2)),
+                                  ("total", (0,)), ("total", (1,)), ("total", (2,))])
+
+
+class JoinCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queue = TaskQueue(context=ThreadContext)
+        self.collector = JoinCollector(self.queue, EventLog(self.directory), logging.getLogger("test"))
+
+    def tearDown(self):
+        self.collector.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def complete_join(self, join_id):
+        # the worker that produced the join holds an outstanding task for it
+        self.queue.reserve()
+        self.collector.add_join(join_id, ("total", (join_id,), {}), None, 1, 0)
+        self.collector.report((join_id, (0,), 0), 0, join_id, None, False)
+        return self.queue.get(block=False)
+
+    def test_late_reports_are_ignored(self):
+        self.assertEqual(self.complete_join(1), [("total", ([1], 1), {})])
+        # a branch task delivered again after its worker died
+        self.collector.report((1, (0,), 0), 0, 1, None, False)
+        self.assertEqual(self.collector.joins, {})
+        self.assertEqual(self.queue.get(block=False), [])
+
+    def test_completed_joins_are_bounded(self):
+        self.collector.COMPLETED_JOINS = 3
+        for join_id in range(10):
+            self.complete_join(join_id)
+        self.assertEqual(list(self.collector.completed), [7, 8, 9])
+        self.assertEqual(self.queue.outstanding.value, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
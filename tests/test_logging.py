@@ -0,0 +1,62 @@
+import logging
+import unittest
+from unittest import mock
+
+from taswor import Workflow, node
+from taswor.util import TaskLogFilter
+
+
+@node(start=True, init_args=[((i,), {}) for i in range(20)], use_cache=False)
+def fail(i):
+    raise ValueError("bad {}".format(i))
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TaskLogFilterTest(unittest.TestCase):
+
+    def record(self):
+        return logging.LogRecord("worker", logging.INFO, __file__, 1, "task", (), None)
+
+    def test_messages_are_rate_limited_per_second(self):
+        log_filter = TaskLogFilter(rate_limit=3)
+        with mock.patch("time.time", return_value=100.5):
+            self.assertEqual([log_filter.filter(self.record()) for _ in range(5)], [True] * 3 + [False] * 2)
+        with mock.patch("time.time", return_value=101.0):
+            self.assertTrue(log_filter.filter(self.record()))
+
+    def test_messages_are_sampled(self):
+        self.assertFalse(any(TaskLogFilter(sample_rate=0).filter(self.record()) for _ in range(100)))
+        self.assertTrue(all(TaskLogFilter(sample_rate=1).filter(self.record()) for _ in range(100)))
+
+
+class LogPolicyTest(unittest.TestCase):
+
+    def run_workflow(self, executor, **kwargs):
+        handler = RecordingHandler()
+        workflow = Workflow(fail.node, executor=executor, workers=2, log_level=logging.ERROR, log_handler=handler,
+                            **kwargs)
+        try:
+            workflow.start(wait=True)
+        finally:
+            workflow.close()
+        return [message for message in handler.messages if "raised an exception" in message]
+
+    def test_worker_messages_are_written_by_the_handler(self):
+        for executor in ("process", "thread", "inline"):
+            with self.subTest(executor=executor):
+                self.assertEqual(len(self.run_workflow(executor)), 20)
+                self.assertEqual(self.run_workflow(executor, log_sample_rate=0), [])
+                self.assertLessEqual(len(self.run_workflow(executor, log_rate_limit=1)), 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import logging
+import unittest
+from unittest import mock
+
+from taswor import Next, Workflow, node
+from taswor.metrics import Histogram
+from taswor.process.async_worker import AsyncWorker
+from taswor.process.worker import Worker
+
+
+@node(start=True, init_args=[((i,), {}) for i in range(50)], use_cache=False)
+def produce(i):
+    return [Next("consume", i, 0), Next("consume", i, 1)]
+
+
+@node(use_cache=False)
+def consume(i, j):
+    return None
+
+
+@node(start=True, init_args=[((i % 3,), {}) for i in range(6)], retries=1)
+def check(i):
+    if i == 2:
+        raise ValueError("bad {}".format(i))
+    return i
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_percentiles_are_bounded_by_their_bucket(self):
+        histogram = Histogram()
+        for i in range(1, 101):
+            histogram.add(i / 1000)
+        other = Histogram()
+        other.add(1.0)
+        histogram.merge(other)
+        self.assertEqual(histogram.count, 101)
+        self.assertEqual(histogram.max, 1.0)
+        self.assertAlmostEqual(histogram.total, 6.05)
+        self.assertLessEqual(histogram.percentile(0.5), 0.065536)
+        self.assertGreaterEqual(histogram.percentile(0.5), 0.05)
+        self.assertEqual(histogram.percentile(1.0), 1.0)
+        self.assertIsNone(Histogram().percentile(0.5))
+
+
+class WorkflowMetricsTest(unittest.TestCase):
+
+    def test_metrics_are_complete_once_the_workflow_completes(self):
+        for executor, engine in (("process", "sync"), ("process", "asyncio"), ("thread", "sync"), ("thread", "asyncio"),
+                                 ("inline", "sync")):
+            with self.subTest(executor=executor, engine=engine):
+                for _ in range(5):
+                    workflow = Workflow(produce.node, consume.node, executor=executor, engine=engine, workers=3,
+                                        log_level=logging.CRITICAL)
+                    try:
+                        workflow.start(wait=True)
+                        metrics = workflow.metrics()
+                    finally:
+                        workflow.close()
+                    self.assertEqual({name: node_metrics.calls for name, node_metrics in metrics.items()},
+                                     {"produce": 50, "consume": 100})
+                    self.assertEqual(metrics["consume"].queue_wait.count, 100)
+                    self.assertEqual(metrics["consume"].exec_time.count, 100)
+
+    def test_counters_and_profile(self):
+        workflow = Workflow(check.node, executor="inline", profile=["check"], log_level=logging.CRITICAL)
+        try:
+            workflow.start(wait=True)
+            metrics = workflow.metrics()["check"]
+            stats = workflow.profile_stats()
+        finally:
+            workflow.close()
+        # the failed calls are not cached, so both tasks of 2 are called and retried
+        self.assertEqual((metrics.calls, metrics.cache_hits, metrics.cache_misses), (6, 2, 4))
+        self.assertEqual((metrics.errors, metrics.retries), (2, 2))
+        self.assertEqual(metrics.exec_time.count, 6)
+        self.assertEqual(metrics.to_dict()["errors"], 2)
+        self.assertTrue(any(function == "check" for _, _, function in stats.stats))
+
+    # the workers only write their metrics once they find the queue empty, not when they complete their tasks
+    @mock.patch.object(Worker, "METRICS_FLUSH_INTERVAL", 1000)
+    @mock.patch.object(Worker, "idle", lambda self: False)
+    @mock.patch.object(AsyncWorker, "idle", lambda self: False)
+    def test_workflow_completes_once_the_metrics_are_written(self):
+        self.test_metrics_are_complete_once_the_workflow_completes()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import logging
+import tempfile
+import unittest
+
+from taswor import Workflow, WorkerPool, node
+
+
+@node(start=True, init_args=[((i,), {}) for i in range(10)], use_cache=False)
+def square(x):
+    return x * x
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(workers=2, max_workflows=2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_workflows_share_the_processes(self):
+        for _ in range(3):
+            workflow = Workflow(square.node, pool=self.pool, collect_results=True, log_level=logging.CRITICAL)
+            workflow.start()
+            self.assertEqual(sorted(workflow.results(timeout=30)), [x * x for x in range(10)])
+            workflow.close()
+        self.assertEqual(sorted(self.pool.free), [0, 1])
+
+    def test_invalid_workflow_gives_its_slot_back(self):
+        with tempfile.NamedTemporaryFile() as file:
+            for kwargs in ({"engine": "bogus"}, {"scheduling": "bogus"}, {"checkpoint": file.name + "/checkpoint"}):
+                with self.assertRaises(Exception):
+                    Workflow(square.node, pool=self.pool, log_level=logging.CRITICAL, **kwargs)
+                self.assertEqual(sorted(self.pool.free), [0, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import logging
+import shutil
+import tempfile
+import unittest
+
+from taswor import Workflow
+from taswor.events import EventLog
+from taswor.node import Node
+from taswor.process.inflight import InflightJournal
+from taswor.process.task_queue import TaskQueue, ThreadContext
+
+
+def crash_once(n, directory):
+    marker = os.path.join(directory, "crashed")
+    if n == 3 and not os.path.exists(marker):
+        open(marker, "w").close()
+        # the worker process dies without completing its tasks
+        os._exit(1)
+    return n * n
+
+
+class RecoveryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_tasks_of_a_killed_worker_are_delivered_again(self):
+        for batch_size in (1, 4):
+            with self.subTest(batch_size=batch_size):
+                directory = tempfile.mkdtemp(dir=self.directory)
+                nodes = [Node(crash_once, "crash_once", start=True, use_cache=False,
+                              init_generator=[((n, directory), {}) for n in range(10)])]
+                workflow = Workflow(*nodes, executor="process", workers=2, batch_size=batch_size,
+                                    collect_results=True, log_level=logging.CRITICAL)
+                try:
+                    workflow.start()
+                    results = sorted(workflow.results(timeout=60))
+                    self.assertTrue(workflow.wait_for_completion(0))
+                finally:
+                    workflow.close()
+                self.assertTrue(os.path.exists(os.path.join(directory, "crashed")))
+                self.assertEqual(results, [n * n for n in range(10)])
+
+
+class InflightJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.event_log = EventLog(self.directory)
+        self.journal = InflightJournal(self.event_log.open("worker", "inflight"))
+        self.queue = TaskQueue(batch_size=2, context=ThreadContext)
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def recover(self):
+        batches, done = InflightJournal.recover(self.event_log.sink_path("worker", "inflight"))
+        return self.queue.recover(batches, done)
+
+    def test_unfinished_batches_are_recovered(self):
+        self.queue.put_many([("a", (1,), {}), ("a", (2,), {})])
+        batch = self.queue.get(block=False, journal=self.journal)
+        self.journal.done(1)
+        self.queue.task_done(1)
+        self.assertEqual(self.recover(), 2)
+        # the task marked as done is delivered, and counted, again
+        self.assertEqual(self.queue.outstanding.value, 2)
+        self.assertEqual(self.queue.get(block=False), batch)
+
+    def test_task_held_until_the_metrics_are_written_is_released(self):
+        self.queue.put_many([("a", (1,), {})])
+        self.queue.get(block=False, journal=self.journal)
+        # the worker completed the task but died before writing its metrics
+        self.journal.done(1, held=True)
+        self.assertEqual(self.recover(), 0)
+        self.assertEqual(self.queue.outstanding.value, 0)
+        self.assertTrue(self.queue.join(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
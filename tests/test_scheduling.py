@@ -0,0 +1,87 @@
+import logging
+import unittest
+
+from taswor import Next, Workflow, node
+from taswor.graph import Graph
+from taswor.node import Node
+from taswor.process.scheduler import LocalQueue
+
+calls = []
+
+
+@node(start=True, init_args=[(("",), {})], use_cache=False)
+def tree(path):
+    calls.append(path)
+    if len(path) < 2:
+        return [Next("tree", path + branch) for branch in "ab"]
+    return None
+
+
+@node(start=True, use_cache=False)
+def fan_out():
+    return [Next("low", i) for i in range(3)] + [Next("high", i) for i in range(3)]
+
+
+@node(use_cache=False)
+def low(i):
+    calls.append(("low", i))
+
+
+@node(use_cache=False, priority=1)
+def high(i):
+    calls.append(("high", i))
+
+
+def noop():
+    pass
+
+
+class LocalQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = Graph([Node(noop, "low", start=True), Node(noop, "high", priority=2),
+                            Node(noop, "mid", priority=1)])
+
+    def test_tasks_run_by_priority_then_in_arrival_order(self):
+        local = LocalQueue(self.graph)
+        local.extend([("low", (1,), {}), ("high", (1,), {}), ("mid", (1,), {}), ("high", (2,), {})])
+        self.assertEqual(len(local), 4)
+        self.assertEqual(local.pop_many(3), [("high", (1,), {}), ("high", (2,), {}), ("mid", (1,), {})])
+        self.assertEqual(local.pop_many(3), [("low", (1,), {})])
+        self.assertEqual(len(local), 0)
+
+    def test_depth_first_runs_the_last_task_first_and_shares_the_oldest(self):
+        local = LocalQueue(self.graph, depth_first=True)
+        local.extend([("low", (i,), {}) for i in range(4)] + [("high", (0,), {})])
+        self.assertEqual(local.share(2), [("low", (0,), {}), ("low", (1,), {})])
+        self.assertEqual(local.pop_many(2), [("high", (0,), {}), ("low", (3,), {})])
+        self.assertEqual(len(local), 1)
+
+
+class SchedulingTest(unittest.TestCase):
+
+    def setUp(self):
+        del calls[:]
+
+    def run_workflow(self, *nodes, **kwargs):
+        workflow = Workflow(*nodes, executor="inline", log_level=logging.CRITICAL, **kwargs)
+        try:
+            workflow.start(wait=True)
+        finally:
+            workflow.close()
+
+    def test_depth_first_scheduling(self):
+        self.run_workflow(tree.node, scheduling="dfs")
+        # every subtree completes before the next one starts
+        self.assertEqual(calls, ["", "b", "bb", "ba", "a", "ab", "aa"])
+
+    def test_tasks_of_nodes_with_a_higher_priority_run_first(self):
+        for affinity in (True, False):
+            with self.subTest(affinity=affinity):
+                del calls[:]
+                self.run_workflow(fan_out.node, low.node, high.node, batch_size=6, affinity=affinity)
+                self.assertEqual(calls, [("high", i) for i in range(3)] + [("low", i) for i in range(3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import logging
+import itertools
+import unittest
+
+from taswor import Next, Workflow
+from taswor.node import Node
+from taswor.process.seeder import Seeder
+from taswor.process.task_queue import TaskQueue, ThreadContext
+
+
+def fan_out(n):
+    return [Next("leaf", n, i) for i in range(3)]
+
+
+def leaf(n, i):
+    return n * 3 + i
+
+
+class SeederTest(unittest.TestCase):
+
+    def start_nodes(self, init_generator):
+        return [Node(fan_out, "fan_out", start=True, init_generator=init_generator)]
+
+    def test_generator_is_consumed_up_to_the_high_water_mark(self):
+        queue = TaskQueue(batch_size=2, context=ThreadContext)
+        pulled = []
+        init_generator = (((n,), {}) for n in itertools.count() if not pulled.append(n))
+        seeder = Seeder(queue, self.start_nodes(init_generator), 5, logging.getLogger("test"))
+        self.assertTrue(seeder.feed(block=False))
+        # the seeder holds an outstanding task of its own
+        self.assertEqual(queue.outstanding.value, 5)
+        self.assertEqual(pulled, list(range(4)))
+        queue.get(block=False)
+        queue.task_done(2)
+        self.assertTrue(seeder.feed(block=False))
+        self.assertEqual(pulled, list(range(6)))
+
+    def test_tasks_that_do_not_fit_in_a_full_queue_are_kept(self):
+        queue = TaskQueue(batch_size=1, context=ThreadContext, maxsize=2)
+        init_generator = [((n,), {}) for n in range(3)]
+        seeder = Seeder(queue, self.start_nodes(init_generator), 100, logging.getLogger("test"))
+        self.assertTrue(seeder.feed(block=False))
+        self.assertEqual(queue.outstanding.value, 3)
+        self.assertEqual(queue.get(block=False), [("fan_out", (0,), {})])
+        queue.task_done()
+        self.assertFalse(seeder.feed(block=False))
+        self.assertEqual([queue.get(block=False) for _ in range(2)], [[("fan_out", (1,), {})], [("fan_out", (2,), {})]])
+        self.assertEqual(queue.outstanding.value, 2)
+
+
+class BoundedQueueTest(unittest.TestCase):
+
+    def test_workflow_completes_with_a_bounded_queue(self):
+        for executor in ("process", "thread", "inline"):
+            with self.subTest(executor=executor):
+                nodes = [Node(fan_out, "fan_out", start=True, use_cache=False,
+                              init_generator=(((n,), {}) for n in range(100))),
+                         Node(leaf, "leaf", use_cache=False)]
+                workflow = Workflow(*nodes, executor=executor, workers=2, queue_size=2, high_water_mark=10,
+                                    collect_results=True, log_level=logging.CRITICAL)
+                try:
+                    workflow.start()
+                    self.assertEqual(sorted(workflow.results(timeout=60)), list(range(300)))
+                finally:
+                    workflow.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import time
+import asyncio
+import logging
+import shutil
+import tempfile
+import threading
+import unittest
+
+from taswor import Workflow, node
+
+calls = []
+calls_lock = threading.Lock()
+
+
+def count_call(name):
+    with calls_lock:
+        calls.append(name)
+        return len(calls)
+
+
+@node(start=True, init_args=[(("page",), {}) for _ in range(5)], single_flight=True, timeout=10)
+async def render(name):
+    count_call(name)
+    await asyncio.sleep(0.2)
+    return name.upper()
+
+
+@node(start=True, init_args=[(("page",), {}) for _ in range(3)], single_flight=True, timeout=10)
+async def render_flaky(name):
+    if count_call(name) == 1:
+        await asyncio.sleep(0.2)
+        raise ValueError("first call failed")
+    return name.upper()
+
+
+@node(start=True, init_args=[(("page",), {}) for _ in range(2)], single_flight=True, timeout=10)
+def render_slowly(name):
+    count_call(name)
+    time.sleep(0.5)
+    return name.upper()
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        del calls[:]
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def run_workflow(self, *nodes, **kwargs):
+        workflow = Workflow(*nodes, collect_results=True, log_level=logging.CRITICAL, **kwargs)
+        try:
+            workflow.start()
+            results = list(workflow.results(timeout=30))
+            metrics = workflow.metrics()
+            errors = [event.error for event in workflow.events if event.error]
+        finally:
+            workflow.close()
+        return results, metrics, errors
+
+    def test_identical_tasks_in_flight_run_once(self):
+        results, metrics, errors = self.run_workflow(render.node, executor="inline", engine="asyncio")
+        self.assertEqual(calls, ["page"])
+        self.assertEqual(results, ["PAGE"] * 5)
+        self.assertEqual(metrics["render"].deduplicated, 4)
+        self.assertEqual(errors, [])
+
+    def test_waiting_task_runs_when_the_first_fails(self):
+        results, metrics, errors = self.run_workflow(render_flaky.node, executor="inline", engine="asyncio")
+        self.assertEqual(calls, ["page", "page"])
+        self.assertEqual(results, ["PAGE"] * 2)
+        self.assertEqual(metrics["render_flaky"].deduplicated, 1)
+        self.assertEqual(len(errors), 1)
+
+    def test_identical_tasks_are_detected_across_workers(self):
+        cache_url = "sqlite:///" + os.path.join(self.directory, "cache.db")
+        results, metrics, errors = self.run_workflow(render_slowly.node, executor="thread", workers=2,
+                                                     cache_url=cache_url)
+        self.assertEqual(calls, ["page"])
+        self.assertEqual(results, ["PAGE"] * 2)
+        self.assertEqual(metrics["render_slowly"].deduplicated, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import logging
+import shutil
+import tempfile
+import unittest
+
+from taswor import Workflow, node
+from taswor.storage import Storage, get_storage
+
+
+@node(start=True, init_args=[((i,), {}) for i in range(10)], use_cache=False)
+def store(i):
+    Storage.put("square-{}".format(i), i * i)
+    if i == 9:
+        # the reads see the writes of the worker that are not flushed yet
+        Storage.put_many({"last": Storage.get("square-9", "missing")})
+
+
+class SqliteStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.url = "sqlite:///" + os.path.join(self.directory, "storage.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_writes_are_buffered_until_flushed(self):
+        storage = get_storage(self.url + "?flush_size=3")
+        reader = get_storage(self.url)
+        storage.put("a", [1])
+        storage.put_many([("b", {"x": 2})])
+        # the buffered writes are only seen by the backend that made them
+        self.assertEqual(storage.get_many(["a", "b", "c"]), {"a": [1], "b": {"x": 2}})
+        self.assertEqual(reader.get_many(["a", "b"]), {})
+        storage.put("c", None)
+        self.assertEqual(reader.get_many(["a", "b", "c"]), {"a": [1], "b": {"x": 2}, "c": None})
+        storage.put("a", [2])
+        storage.close()
+        self.assertEqual(reader.get("a"), [2])
+        self.assertEqual(reader.get("d", "default"), "default")
+        self.assertEqual(len(reader), 3)
+        reader.close()
+
+    def test_no_storage(self):
+        self.assertIsNone(get_storage(None))
+        with self.assertRaises(RuntimeError):
+            get_storage("ftp://host/storage")
+
+    def test_nodes_write_to_the_storage_of_their_worker(self):
+        for executor in ("process", "thread", "inline"):
+            with self.subTest(executor=executor):
+                url = "sqlite:///" + os.path.join(tempfile.mkdtemp(dir=self.directory), "storage.db")
+                workflow = Workflow(store.node, executor=executor, workers=2, storage_url=url,
+                                    log_level=logging.CRITICAL)
+                try:
+                    workflow.start(wait=True)
+                    storage = workflow.open_storage()
+                finally:
+                    workflow.close()
+                values = storage.get_many(["square-{}".format(i) for i in range(10)] + ["last"])
+                storage.close()
+                self.assertEqual(values, dict({"square-{}".format(i): i * i for i in range(10)}, last=81))
+
+
+if __name__ == "__main__":
+    unittest.main()
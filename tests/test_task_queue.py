@@ -0,0 +1,62 @@
+import time
+import logging
+import threading
+import unittest
+
+from taswor import Next, Workflow, node
+from taswor.process.task_queue import TaskQueue, ThreadContext
+
+
+@node(start=True, init_args=[((3,), {})], use_cache=False)
+def countdown(n):
+    if n:
+        return Next("countdown", n - 1)
+    time.sleep(0.5)
+    return None
+
+
+class TaskQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = TaskQueue(batch_size=2, context=ThreadContext)
+
+    def test_join_waits_for_the_outstanding_tasks(self):
+        self.queue.put_many([("a", (i,), {}) for i in range(3)])
+        self.assertEqual(self.queue.get(block=False), [("a", (0,), {}), ("a", (1,), {})])
+        self.assertFalse(self.queue.join(0.01))
+        # the children are counted before their parent is done
+        self.queue.put_many([("b", (), {})])
+        self.queue.task_done(2)
+        self.assertFalse(self.queue.join(0.01))
+        self.queue.task_done(2)
+        self.assertTrue(self.queue.join(0))
+
+    def test_join_is_woken_by_the_last_task_done(self):
+        self.queue.put(("a", (), {}))
+        timer = threading.Timer(0.1, self.queue.task_done)
+        timer.start()
+        start_time = time.monotonic()
+        self.assertTrue(self.queue.join(10))
+        self.assertLess(time.monotonic() - start_time, 1)
+        timer.join()
+
+
+class CompletionTest(unittest.TestCase):
+
+    def test_wait_for_completion(self):
+        for executor in ("process", "thread", "inline"):
+            with self.subTest(executor=executor):
+                workflow = Workflow(countdown.node, executor=executor, workers=2, log_level=logging.CRITICAL)
+                try:
+                    workflow.start()
+                    if executor != "inline":
+                        self.assertFalse(workflow.wait_for_completion(0.1))
+                    self.assertTrue(workflow.wait_for_completion(30))
+                    self.assertEqual(workflow.queue.outstanding.value, 0)
+                    self.assertEqual(len(list(workflow.events)), 4)
+                finally:
+                    workflow.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
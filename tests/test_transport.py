@@ -0,0 +1,72 @@
+import os
+import glob
+import logging
+import unittest
+
+from taswor import Next, Workflow, node
+from taswor.process.transport import SharedMemoryTransport
+
+
+@node(start=True, init_args=[((i,), {}) for i in range(4)], use_cache=False)
+def produce(i):
+    return Next("checksum", bytearray([i]) * (1 << 16), b"small")
+
+
+@node(use_cache=False)
+def checksum(data, tag):
+    return type(data).__name__, len(data), sum(data[:10]), tag
+
+
+class SharedMemoryTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = SharedMemoryTransport(threshold=1024)
+        self.addCleanup(self.transport.unlink_all)
+
+    def segments(self):
+        return glob.glob(os.path.join(SharedMemoryTransport.SHM_DIRECTORY, self.transport.prefix + "_*"))
+
+    def test_large_arguments_are_passed_through_shared_memory(self):
+        batch = [("node", (b"x" * 4096, bytearray(b"y" * 2048), b"z"), {})]
+        payload = self.transport.dumps(batch)
+        self.assertLess(len(payload), 1024)
+        self.assertEqual(len(self.segments()), 2)
+        received = self.transport.loads(payload)
+        self.assertEqual(received, batch)
+        self.assertEqual([type(arg) for arg in received[0][1]], [bytes, bytearray, bytes])
+        # the segments are removed once the tasks are done
+        del received
+        self.transport.release(force=True)
+        self.assertEqual(self.segments(), [])
+
+    def test_small_arguments_are_pickled_in_band(self):
+        batch = [("node", (b"x" * 100,), {"data": bytearray(100)})]
+        payload = self.transport.dumps(batch)
+        self.assertEqual(self.segments(), [])
+        self.assertEqual(self.transport.loads(payload), batch)
+        self.assertEqual(self.transport.received, [])
+
+    def test_segments_of_tasks_never_received_are_removed(self):
+        self.transport.dumps([("node", (b"x" * 4096,), {})])
+        self.assertEqual(len(self.segments()), 1)
+        self.transport.unlink_all()
+        self.assertEqual(self.segments(), [])
+
+
+class SharedMemoryWorkflowTest(unittest.TestCase):
+
+    def test_arguments_above_the_threshold(self):
+        workflow = Workflow(produce.node, checksum.node, executor="process", workers=2, shared_memory_threshold=1024,
+                            collect_results=True, log_level=logging.CRITICAL)
+        try:
+            workflow.start()
+            results = sorted(workflow.results(timeout=60))
+            prefix = workflow.queue.transport.prefix
+        finally:
+            workflow.close()
+        self.assertEqual(results, [("bytearray", 1 << 16, i * 10, b"small") for i in range(4)])
+        self.assertEqual(glob.glob(os.path.join(SharedMemoryTransport.SHM_DIRECTORY, prefix + "_*")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()